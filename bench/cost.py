@@ -0,0 +1,94 @@
+"""
+Статическая оценка стоимости (sll/cost.py) против измерений интерпретатора.
+
+Для каждой функции из samples/ и каждой стратегии (HE/TAG × TOP/BOTTOM) строится
+остаточная программа; ее редукции на входах размеров 0..N-1 (все аргументы одного
+размера) оцениваются моделью и считаются evaluate. est — сумма оценок, run — сумма
+измерений, miss — размеров, где оценка не совпала с измерением ('?' — не оценивается:
+например, в остаточной программе свободная переменная). Запуски, упершиеся в предел
+шагов или застрявшие не на данных, в суммы не входят (ячейка отмечена '*').
+best — стратегия с наименьшей оценкой (по модели, без запусков) и по измерениям;
+выбирается среди ячеек, где посчитаны все размеры.
+
+    python bench/cost.py
+    python bench/cost.py --sizes 10
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sll.parser import parse
+from sll.cache import supercompile
+from sll.cost import cost_table, residual_call, sample_value
+from sll.interpreter import evaluate
+from sll.matching import substitute
+from sll.budget import Budget
+from sll.ast_nodes import Ctr, FCall, Var
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+CONFIGS = [(s, g) for s in ("HE", "TAG") for g in ("TOP", "BOTTOM")]
+
+
+def is_data(expr) -> bool:
+    return isinstance(expr, Ctr) and all(is_data(a) for a in expr.args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Static cost estimates vs interpreter counts")
+    parser.add_argument("--sizes", type=int, default=6, help="Input sizes 0..N-1")
+    parser.add_argument("--max-steps", type=int, default=100, help="Driving step limit")
+    parser.add_argument("--limit", type=int, default=20000, help="Interpreter step limit per run")
+    args = parser.parse_args()
+
+    header = "".join(f"{s + '/' + g:>20}" for s, g in CONFIGS)
+    print(f"{'function':<20}{header}{'best est':>14}{'best run':>14}")
+    runs = misses = unknown = 0
+    for fname in sorted(os.listdir(SAMPLES_DIR)):
+        if not fname.endswith(".sll"):
+            continue
+        with open(os.path.join(SAMPLES_DIR, fname), encoding="utf-8") as f:
+            prog = parse(f.read())
+        for sig in prog.signatures:
+            names = [f"x{i + 1}" for i in range(len(sig.arg_types))]
+            start = FCall(sig.name, [Var(n) for n in names])
+            cells, est_totals, run_totals = [], {}, {}
+            for strategy, gen in CONFIGS:
+                _, residual, _ = supercompile(prog, start, dict(zip(names, sig.arg_types)),
+                                              strategy=strategy, gen_type=gen,
+                                              budget=Budget(max_steps=args.max_steps))
+                call = residual_call(residual, names)
+                table = cost_table(residual, call, list(range(args.sizes)), names)
+                est = run = miss = counted = 0
+                for k, cost in enumerate(table):
+                    values = {n: sample_value(t, prog.types, k) for n, t in zip(names, sig.arg_types)}
+                    result, steps = evaluate(substitute(call, values), residual, max_steps=args.limit)
+                    if steps >= args.limit or not is_data(result):
+                        continue
+                    runs += 1
+                    counted += 1
+                    if cost is None:
+                        miss, unknown = "?", unknown + 1
+                        continue
+                    est += cost.reductions
+                    run += steps
+                    if cost.reductions != steps and miss != "?":
+                        miss += 1
+                        misses += 1
+                complete = counted == args.sizes
+                if complete and miss != "?":
+                    est_totals[(strategy, gen)] = est
+                if complete:
+                    run_totals[(strategy, gen)] = run
+                cells.append(f"{est}/{run} {miss}{'' if complete else '*'}")
+            best_est = min(est_totals, key=est_totals.get, default=None)
+            best_run = min(run_totals, key=run_totals.get, default=None)
+            fmt = lambda c: "/".join(c) if c else "-"
+            print(f"{fname[:-4] + ':' + sig.name:<20}{''.join(f'{c:>20}' for c in cells)}"
+                  f"{fmt(best_est):>14}{fmt(best_run):>14}")
+    print(f"\n{runs} runs, {misses} estimates differ from measured counts, {unknown} not estimated")
+
+
+if __name__ == "__main__":
+    main()
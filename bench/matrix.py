@@ -0,0 +1,241 @@
+"""
+Матрица экспериментов: входы × стратегии (HE/TAG × TOP/BOTTOM) по конфигу.
+
+Каждая ячейка считается в отдельном процессе (spawn) с пределом времени (считается
+с запуска процесса, вместе с импортом): зависший или упавший запуск не мешает остальным
+и попадает в таблицу со статусом timeout/crash, исключение — со статусом error.
+Колонки:
+  nodes  — узлов в готовом дереве, created — создано узлов за запуск (с выброшенными
+           при обобщении), steps/folds/whistles/gens/stopped — счетчики Stats;
+  rules, funcs — правил и функций остаточной программы;
+  sec    — время дерева и остаточной программы;
+  peak KB — рост пикового RSS процесса за запуск (процесс свой, поэтому пик — этого запуска).
+
+Конфиг — JSON:
+  {
+    "strategies": ["HE", "TAG"], "gens": ["TOP", "BOTTOM"],
+    "max_steps": 100, "timeout": 30,
+    "cells": [
+      {"file": "*"},                                   все функции всех samples/*.sll
+      {"file": "test_2.sll"},                          все функции файла
+      {"file": "test_2.sll", "entry": "mul2"},         вызов с типами из сигнатуры
+      {"file": "test_3.sll", "entry": "(add a b)", "types": {"a": "Nat", "b": "Nat"},
+       "strategies": ["TAG"], "max_steps": 200}        поля ячейки перекрывают общие
+    ]
+  }
+Тип переменной — как в -t у main.py: Nat или [List Nat].
+
+    python bench/matrix.py bench/matrix.json
+    python bench/matrix.py bench/matrix.json -j 4 --csv out.csv --json out.json
+"""
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from multiprocessing.connection import wait
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sll.parser import parse, Parser, tokenize
+from sll.cache import supercompile
+from sll.budget import Budget
+from sll.ast_nodes import TypeExpr
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+COLUMNS = ["file", "entry", "strategy", "gen", "status", "nodes", "created", "steps", "folds",
+           "whistles", "gens", "stopped", "rules", "funcs", "sec", "peak_kb", "error"]
+
+
+def resolve_file(name: str) -> str:
+    return name if os.path.exists(name) else os.path.join(SAMPLES_DIR, name)
+
+
+def parse_type(text: str) -> TypeExpr:
+    text = text.strip()
+    if text.startswith("["):
+        return Parser(list(tokenize(text))).parse_type_expr()
+    return TypeExpr(text, [])
+
+
+def expand(config: dict) -> list:
+    """Задания: одно на (файл, вход, стратегия, обобщение)."""
+    jobs = []
+    for cell in config["cells"]:
+        opts = {**config, **cell}
+        if cell["file"] == "*":
+            files = sorted(f for f in os.listdir(SAMPLES_DIR) if f.endswith(".sll"))
+        else:
+            files = [cell["file"]]
+        for fname in files:
+            if "entry" in cell:
+                entries = [cell["entry"]]
+            else:
+                with open(resolve_file(fname), encoding="utf-8") as f:
+                    entries = [sig.name for sig in parse(f.read()).signatures]
+            for entry in entries:
+                for strategy in opts.get("strategies", ["HE", "TAG"]):
+                    for gen in opts.get("gens", ["TOP", "BOTTOM"]):
+                        jobs.append({"file": fname, "entry": entry, "types": cell.get("types", {}),
+                                     "strategy": strategy, "gen": gen,
+                                     "max_steps": opts.get("max_steps", 100),
+                                     "timeout": opts.get("timeout", 30)})
+    return jobs
+
+
+def _max_rss_kb() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss    # macOS — байты, Linux — KB
+
+
+def run_cell(job: dict) -> dict:
+    """Одна ячейка в текущем процессе: дерево, остаточная программа, счетчики."""
+    with open(resolve_file(job["file"]), encoding="utf-8") as f:
+        prog = parse(f.read())
+    entry = job["entry"]
+    if "(" in entry:
+        start_expr = Parser(tokenize(entry)).parse_expr()
+        var_types = {}
+    else:
+        sig = next(s for s in prog.signatures if s.name == entry)
+        names = [f"x{i + 1}" for i in range(len(sig.arg_types))]
+        start_expr = Parser(tokenize(f"({entry} {' '.join(names)})")).parse_expr()
+        var_types = dict(zip(names, sig.arg_types))
+    var_types.update({v: parse_type(t) for v, t in job["types"].items()})
+
+    rss_before = _max_rss_kb()
+    started = time.perf_counter()
+    tree, residual, sc = supercompile(prog, start_expr, var_types, strategy=job["strategy"],
+                                      gen_type=job["gen"], budget=Budget(max_steps=job["max_steps"]))
+    seconds = time.perf_counter() - started
+
+    size, stack = 0, [tree]
+    while stack:
+        node = stack.pop()
+        size += 1
+        stack.extend(node.children)
+    c = sc.stats.counters
+    return {"status": "ok", "nodes": size, "created": c.get("nodes", 0), "steps": c.get("steps", 0),
+            "folds": c.get("folds", 0), "whistles": c.get("whistles", 0),
+            "gens": c.get("generalizations", 0), "stopped": c.get("stopped", 0),
+            "rules": len(residual.rules), "funcs": len({r.pattern.name for r in residual.rules}),
+            "sec": round(seconds, 4), "peak_kb": max(0, _max_rss_kb() - rss_before)}
+
+
+def _worker(job: dict, conn):
+    try:
+        result = run_cell(job)
+    except Exception as e:
+        result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+    conn.send(result)
+    conn.close()
+
+
+def run_matrix(jobs: list, workers: int) -> list:
+    """Строки таблицы в порядке заданий; не больше workers процессов одновременно."""
+    ctx = multiprocessing.get_context("spawn")
+    rows = [None] * len(jobs)
+    pending = list(enumerate(jobs))
+    running = {}    # conn -> (номер, процесс, срок)
+    while pending or running:
+        while pending and len(running) < workers:
+            i, job = pending.pop(0)
+            recv, send = ctx.Pipe(duplex=False)
+            proc = ctx.Process(target=_worker, args=(job, send), daemon=True)
+            proc.start()
+            send.close()
+            running[recv] = (i, proc, time.monotonic() + job["timeout"])
+
+        deadline = min(d for _, _, d in running.values())
+        for conn in wait(list(running), timeout=max(0.0, deadline - time.monotonic())):
+            i, proc, _ = running.pop(conn)
+            try:
+                result = conn.recv()
+            except EOFError:
+                proc.join()
+                result = {"status": "crash", "error": f"exit code {proc.exitcode}"}
+            proc.join()
+            rows[i] = _row(jobs[i], result)
+        now = time.monotonic()
+        for conn, (i, proc, d) in list(running.items()):
+            if now >= d:
+                proc.kill()
+                proc.join()
+                running.pop(conn)
+                rows[i] = _row(jobs[i], {"status": "timeout", "sec": jobs[i]["timeout"]})
+    return rows
+
+
+def _row(job: dict, result: dict) -> dict:
+    return {"file": job["file"], "entry": job["entry"], "strategy": job["strategy"], "gen": job["gen"], **result}
+
+
+def print_table(rows: list):
+    w = max([len(f"{r['file'].removesuffix('.sll')}:{r['entry']}") for r in rows] + [20]) + 2
+    print(f"{'input':<{w}}{'config':<12}{'status':<9}{'nodes':>7}{'created':>8}{'steps':>7}{'folds':>7}"
+          f"{'whistles':>9}{'gens':>6}{'stopped':>8}{'rules':>7}{'sec':>9}{'peak KB':>9}")
+    for r in rows:
+        name = f"{r['file'].removesuffix('.sll')}:{r['entry']}"
+        config = f"{r['strategy']}/{r['gen']}"
+        if r["status"] != "ok":
+            print(f"{name:<{w}}{config:<12}{r['status']:<9}{r.get('error', '')}")
+            continue
+        print(f"{name:<{w}}{config:<12}{'ok':<9}{r['nodes']:>7}{r['created']:>8}{r['steps']:>7}{r['folds']:>7}"
+              f"{r['whistles']:>9}{r['gens']:>6}{r['stopped']:>8}{r['rules']:>7}{r['sec']:>9.4f}{r['peak_kb']:>9}")
+
+    # итоги по конфигурациям — только по входам, где все конфигурации дошли до конца
+    by_input = {}
+    for r in rows:
+        by_input.setdefault((r["file"], r["entry"]), []).append(r)
+    complete = [rs for rs in by_input.values() if all(r["status"] == "ok" for r in rs)]
+    totals = {}
+    for rs in complete:
+        for r in rs:
+            t = totals.setdefault(f"{r['strategy']}/{r['gen']}", [0, 0, 0, 0.0])
+            t[0] += r["nodes"]
+            t[1] += r["rules"]
+            t[2] += r["stopped"]
+            t[3] += r["sec"]
+    print(f"\ntotals over {len(complete)} of {len(by_input)} inputs finished in every configuration:")
+    print(f"{'config':<12}{'nodes':>8}{'rules':>8}{'stopped':>9}{'sec':>9}")
+    for config, (nodes, rules, stopped, sec) in totals.items():
+        print(f"{config:<12}{nodes:>8}{rules:>8}{stopped:>9}{sec:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a matrix of supercompilation experiments")
+    parser.add_argument("config", nargs="?", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  "matrix.json"))
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Parallel worker processes")
+    parser.add_argument("--timeout", type=float, default=None, help="Per-cell time limit (overrides config)")
+    parser.add_argument("--csv", default=None, help="Write the table as CSV")
+    parser.add_argument("--json", default=None, help="Write the table as JSON")
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        config = json.load(f)
+    if args.timeout is not None:
+        config["timeout"] = args.timeout
+        for cell in config["cells"]:
+            cell.pop("timeout", None)
+    jobs = expand(config)
+    print(f"{len(jobs)} cells, {args.jobs} workers")
+    rows = run_matrix(jobs, max(1, args.jobs))
+    print_table(rows)
+
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Память дерева процессов: обычные узлы (Node), облегченные (Supercompiler(lean=True))
+и массивы TreeStore (Supercompiler.pack_tree).
+incr peak — пик облегченного запуска с поэтапной резидуализацией
+(IncrementalResidualizer: закрытые поддеревья отрезаются по ходу постройки).
+share KB, share peak — обычные узлы со слиянием закрытых поддеревьев по ходу
+постройки (Supercompiler(share_subtrees=True), в BOTTOM — compact_tree после).
+
+Для каждого входа строится дерево и остаточная программа, tracemalloc меряет
+пик за запуск и память, которую держит готовое дерево (B/node — байт на узел).
+store — облегченное дерево, упакованное в TreeStore (вместе с выражениями);
+arrays — только массивы узлов, без выражений, сужений и словарей типов.
+Входы — функции из samples/ и сгенерированные широкие конфигурации wideN.
+
+    python bench/memory.py
+    python bench/memory.py --sizes 100 400 -g BOTTOM
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.incremental import IncrementalResidualizer
+from sll.budget import Budget
+from sll.ast_nodes import TypeExpr
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+GENERATED = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+
+def sample_inputs():
+    """(имя, программа, стартовое выражение, типы, предел шагов) для каждой функции из samples/."""
+    for fname in sorted(os.listdir(SAMPLES_DIR)):
+        if not fname.endswith(".sll"):
+            continue
+        with open(os.path.join(SAMPLES_DIR, fname), encoding="utf-8") as f:
+            code = f.read()
+        for sig in parse(code).signatures:
+            names = [f"x{i + 1}" for i in range(len(sig.arg_types))]
+            expr = f"({sig.name} {' '.join(names)})"
+            yield f"{fname[:-4]}:{sig.name}", code, expr, dict(zip(names, sig.arg_types)), None
+
+
+def generated_inputs(sizes):
+    """
+    [T e1 ... en], где ei = (eq (add (add ai bi) ci) (add ai (add bi ci))) —
+    n независимых поддеревьев, дерево растет линейно по n. Строится без предела шагов.
+    """
+    nat = TypeExpr("Nat", [])
+    for n in sizes:
+        code = GENERATED + f"type [Tup] : T {' '.join(['[Bool]'] * n)} .\n"
+        parts = " ".join(f"(eq (add (add a{i} b{i}) c{i}) (add a{i} (add b{i} c{i})))" for i in range(n))
+        types = {f"{v}{i}": nat for i in range(n) for v in "abc"}
+        yield f"wide{n}", code, f"[T {parts}]", types, sys.maxsize
+
+
+def measure(code, expr_text, var_types, strategy, gen_type, lean, max_steps):
+    """
+    (узлов, байт, которые держит готовое дерево, байт того же дерева в TreeStore,
+    из них байт массивов узлов, пиковых байт за запуск).
+    """
+    gc.collect()
+    tracemalloc.start()
+    prog = parse(code)
+    start_expr = Parser(tokenize(expr_text)).parse_expr()
+    sc = Supercompiler(prog, strategy=strategy, gen_type=gen_type,
+                       budget=Budget(max_steps=max_steps), lean=lean)
+    if gen_type == "TOP":
+        sc.build_tree(start_expr, var_types)
+    else:
+        sc.run_hypercycle(start_expr, var_types)
+    Residualizer(sc.tree, prog, sc.stats).residualize()
+    gc.collect()
+    with_tree, peak = tracemalloc.get_traced_memory()
+    store = sc.pack_tree()
+    sc.hypercycle_roots = {}
+    gc.collect()
+    with_store, _ = tracemalloc.get_traced_memory()
+    sc.tree = None
+    nodes, arrays = len(store), store.nbytes()
+    del store
+    gc.collect()
+    without_tree, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return nodes, with_tree - without_tree, with_store - without_tree, arrays, peak
+
+
+def measure_incremental(code, expr_text, var_types, strategy, gen_type, max_steps):
+    """Пиковых байт за облегченный запуск с IncrementalResidualizer."""
+    gc.collect()
+    tracemalloc.start()
+    prog = parse(code)
+    start_expr = Parser(tokenize(expr_text)).parse_expr()
+    sc = Supercompiler(prog, strategy=strategy, gen_type=gen_type,
+                       budget=Budget(max_steps=max_steps), lean=True)
+    residualizer = IncrementalResidualizer(sc, prog)
+    for event in sc.iter_build(start_expr, var_types):
+        residualizer(event)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def measure_shared(code, expr_text, var_types, strategy, gen_type, max_steps):
+    """(байт, которые держит граф процессов после постройки со слиянием, пиковых байт за запуск)."""
+    gc.collect()
+    tracemalloc.start()
+    prog = parse(code)
+    start_expr = Parser(tokenize(expr_text)).parse_expr()
+    sc = Supercompiler(prog, strategy=strategy, gen_type=gen_type,
+                       budget=Budget(max_steps=max_steps), share_subtrees=True)
+    if gen_type == "TOP":
+        sc.build_tree(start_expr, var_types)
+    else:
+        sc.run_hypercycle(start_expr, var_types)
+        sc.compact_tree()
+    Residualizer(sc.tree, prog, sc.stats).residualize()
+    gc.collect()
+    with_tree, peak = tracemalloc.get_traced_memory()
+    sc.tree = None
+    sc.hypercycle_roots = {}
+    gc.collect()
+    without_tree, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return with_tree - without_tree, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory of full vs lean process trees")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200],
+                        help="Widths of the generated inputs")
+    parser.add_argument("--max-steps", type=int, default=100, help="Step limit for the samples")
+    parser.add_argument("-s", "--strategy", choices=["HE", "TAG"], default="HE")
+    parser.add_argument("-g", "--gen", choices=["TOP", "BOTTOM"], default="TOP")
+    args = parser.parse_args()
+
+    print(f"{'input':<22}{'nodes':>7}{'full KB':>10}{'lean KB':>10}{'store KB':>10}"
+          f"{'B/node':>8}{'lean':>6}{'store':>7}{'arrays':>8}{'full peak':>11}{'lean peak':>11}"
+          f"{'incr peak':>11}{'share KB':>10}{'share peak':>11}")
+    totals = [0, 0, 0, 0, 0, 0]
+    for name, code, expr, types, steps in list(sample_inputs()) + list(generated_inputs(args.sizes)):
+        steps = steps or args.max_steps
+        nodes, full, _, _, full_peak = measure(code, expr, types, args.strategy, args.gen, False, steps)
+        _, lean, store, arrays, lean_peak = measure(code, expr, types, args.strategy, args.gen, True, steps)
+        incr_peak = measure_incremental(code, expr, types, args.strategy, args.gen, steps)
+        shared, shared_peak = measure_shared(code, expr, types, args.strategy, args.gen, steps)
+        for k, v in enumerate((nodes, full, lean, store, arrays, shared)):
+            totals[k] += v
+        print(f"{name:<22}{nodes:>7}{full / 1024:>10.1f}{lean / 1024:>10.1f}{store / 1024:>10.1f}"
+              f"{full // nodes:>8}{lean // nodes:>6}{store // nodes:>7}{arrays // nodes:>8}"
+              f"{full_peak / 1024:>11.1f}{lean_peak / 1024:>11.1f}{incr_peak / 1024:>11.1f}"
+              f"{shared / 1024:>10.1f}{shared_peak / 1024:>11.1f}")
+    nodes, full, lean, store, arrays, shared = totals
+    print(f"{'total':<22}{nodes:>7}{full / 1024:>10.1f}{lean / 1024:>10.1f}{store / 1024:>10.1f}"
+          f"{full // nodes:>8}{lean // nodes:>6}{store // nodes:>7}{arrays // nodes:>8}"
+          f"{'':>33}{shared / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
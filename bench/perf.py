@@ -0,0 +1,62 @@
+"""
+Регрессии производительности: фиксированные входы суперкомпилятора и интерпретатора
+(sll/perf.py) против базы bench/baselines/perf.json.
+
+Для каждого входа — время фаз (build, drive, fold, whistle, generalize, msg,
+hypercycle, residualize, interpret) в единицах эталонного запуска, лучшее из --repeat,
+и счетчики Stats. Рост счетчика или времени фазы сверх допуска — регрессия:
+отчет по фазам, код выхода 1. Без времени те же счетчики проверяет sll/test_perf.py.
+
+    python bench/perf.py
+    python bench/perf.py --counters-only
+    python bench/perf.py --save            после намеренного изменения
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sll.perf import BASELINE, TOLERANCE, run_suite, compare, by_phase, load_baseline, save_baseline
+
+PHASE_COLUMNS = ["build", "drive", "fold", "whistle", "generalize", "msg", "hypercycle", "residualize", "interpret"]
+
+
+def print_table(results: dict):
+    print(f"{'workload':<22}{'nodes':>7}{'steps':>7}" + "".join(f"{p[:10]:>11}" for p in PHASE_COLUMNS))
+    for name, r in results.items():
+        c = r["counters"]
+        steps = c.get("steps", c.get("interpreter.steps", 0))
+        times = "".join(f"{r['timers'][p]:>11.2f}" if p in r["timers"] else f"{'-':>11}" for p in PHASE_COLUMNS)
+        print(f"{name:<22}{c.get('nodes', 0):>7}{steps:>7}{times}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Performance regression check against stored baselines")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per workload, the best one counts")
+    parser.add_argument("--counters-only", action="store_true", help="Skip timings, compare counters only")
+    parser.add_argument("--time-tolerance", type=float, default=TOLERANCE["timers"],
+                        help="Allowed relative growth of a phase time")
+    parser.add_argument("--count-tolerance", type=float, default=TOLERANCE["counters"],
+                        help="Allowed relative growth of a counter")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="Write this run as the new baseline")
+    args = parser.parse_args()
+
+    results = run_suite(args.repeat, timings=not args.counters_only)
+    print_table(results)
+
+    if args.save:
+        save_baseline(results, args.baseline)
+        print(f"\nbaseline written: {args.baseline}")
+        return
+    baseline = load_baseline(args.baseline)
+    regressions = compare(results, baseline, {"counters": args.count_tolerance, "timers": args.time_tolerance})
+    if regressions:
+        print(f"\n{by_phase(regressions)}")
+        sys.exit(1)
+    print("\nno regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
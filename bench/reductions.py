@@ -0,0 +1,88 @@
+"""
+Число редукций (шагов sll/interpreter.py) до нормальной формы: исходная программа,
+остаточная (Residualizer) и остаточная после sll/optimizer.py.
+
+Для каждой функции из samples/ строится остаточная программа, затем вход и обе
+остаточные программы вычисляются на одних и тех же аргументах: значения типов
+аргументов размеров 0..N-1 (числа [S .. [Z]], списки длины k и т.д.).
+Запуски, упершиеся в предел шагов, не суммируются (отмечены '*').
+--strict — вычисление по значению: видно, не повторяет ли остаточная программа
+вычисления, которые исходная делает один раз.
+opt/res — доля редукций оптимизированной программы от остаточной.
+
+    python bench/reductions.py
+    python bench/reductions.py -s TAG -g BOTTOM --inputs 8
+    python bench/reductions.py --strict
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sll.parser import parse
+from sll.cache import supercompile
+from sll.optimizer import optimize, entry_name
+from sll.interpreter import evaluate
+from sll.budget import Budget
+from sll.stats import Stats
+from sll.cost import sample_value
+from sll.ast_nodes import FCall, Var
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+
+def count(program, name, args, limit, strict=False):
+    """Шагов до нормальной формы или None, если предел исчерпан."""
+    _, steps = evaluate(FCall(name, args), program, max_steps=limit, strict=strict)
+    return steps if steps < limit else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reduction counts of source vs residual vs optimized programs")
+    parser.add_argument("-s", "--strategy", choices=["HE", "TAG"], default="HE")
+    parser.add_argument("-g", "--gen", choices=["TOP", "BOTTOM"], default="BOTTOM")
+    parser.add_argument("--inputs", type=int, default=6, help="Argument tuples per function (sizes 0..N-1)")
+    parser.add_argument("--max-steps", type=int, default=100, help="Driving step limit")
+    parser.add_argument("--limit", type=int, default=20000, help="Interpreter step limit per run")
+    parser.add_argument("--strict", action="store_true", help="Call-by-value evaluation")
+    args = parser.parse_args()
+
+    print(f"{'function':<22}{'rules':>7}{'opt':>5}{'source':>9}{'resid':>9}{'opt':>9}{'opt/res':>9}")
+    totals = [0, 0, 0]
+    for fname in sorted(os.listdir(SAMPLES_DIR)):
+        if not fname.endswith(".sll"):
+            continue
+        with open(os.path.join(SAMPLES_DIR, fname), encoding="utf-8") as f:
+            prog = parse(f.read())
+        for sig in prog.signatures:
+            names = [f"x{i + 1}" for i in range(len(sig.arg_types))]
+            start = FCall(sig.name, [Var(n) for n in names])
+            _, residual, _ = supercompile(prog, start, dict(zip(names, sig.arg_types)),
+                                          strategy=args.strategy, gen_type=args.gen,
+                                          budget=Budget(max_steps=args.max_steps))
+            optimized = optimize(residual, stats=Stats())
+            entry = entry_name(residual)
+
+            row = [0, 0, 0]
+            partial = False
+            for k in range(args.inputs):
+                values = [sample_value(t, prog.types, (k + i) % args.inputs) for i, t in enumerate(sig.arg_types)]
+                counts = [count(prog, sig.name, values, args.limit, args.strict),
+                          count(residual, entry, values, args.limit, args.strict),
+                          count(optimized, entry, values, args.limit, args.strict)]
+                if None in counts:
+                    partial = True
+                    continue
+                row = [a + b for a, b in zip(row, counts)]
+            totals = [a + b for a, b in zip(totals, row)]
+            mark = "*" if partial else ""
+            ratio = f"{row[2] / row[1]:.2f}" if row[1] else "-"
+            print(f"{fname[:-4] + ':' + sig.name + mark:<22}{len(residual.rules):>7}{len(optimized.rules):>5}"
+                  f"{row[0]:>9}{row[1]:>9}{row[2]:>9}{ratio:>9}")
+    ratio = f"{totals[2] / totals[1]:.2f}" if totals[1] else "-"
+    print(f"{'total':<22}{'':>12}{totals[0]:>9}{totals[1]:>9}{totals[2]:>9}{ratio:>9}")
+
+
+if __name__ == "__main__":
+    main()
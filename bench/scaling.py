@@ -0,0 +1,193 @@
+"""
+Масштабирование по размеру входа: сгенерированные программы (sll/workloads.py) размера n
+для n из --sizes и каждой конфигурации HE/TAG × TOP/BOTTOM.
+
+Колонки:
+  nodes   — узлов в готовом дереве, created — создано за запуск (с выброшенными при
+            обобщении), stopped — не прогнанных из-за предела шагов;
+  ms      — лучшее из --repeat время дерева и остаточной программы;
+  norm    — то же в единицах эталонного запуска (sll.workloads.calibrate): сравнимо
+            с базой, снятой на другой машине;
+  peak KB — пик tracemalloc за отдельный запуск (под tracemalloc время не меряется).
+После таблицы — показатель роста: k в time ~ n^k (и для created, peak) между
+наименьшим и наибольшим n, где конфигурация дошла до конца.
+
+База — bench/baselines/scaling.json (--save перезаписывает). Без --save прогон
+сравнивается с базой: ошибка там, где в базе ok, другое число узлов (nodes, created,
+stopped), norm или peak больше базы на --tolerance (и на порог шума) — регрессия,
+код выхода 1. Ячейка, которая в базе с ошибкой, а теперь ok, — не регрессия.
+
+    python bench/scaling.py
+    python bench/scaling.py --only chain --sizes 2 4 8 16 32
+    python bench/scaling.py --save
+"""
+import argparse
+import gc
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sll.workloads import GENERATORS, calibrate
+from sll.cache import supercompile
+from sll.budget import Budget
+from sll.checkpoint import deep_recursion
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "scaling.json")
+
+SIZES = {"chain": [1, 2, 4, 8, 16], "acc": [1, 2, 3, 4], "alphabet": [4, 8, 16, 32, 64]}
+CONFIGS = [("HE", "TOP"), ("HE", "BOTTOM"), ("TAG", "TOP"), ("TAG", "BOTTOM")]
+
+# разница меньше этого — шум, а не регрессия, даже если относительно она больше допуска
+NOISE = {"norm": 1.0, "peak_kb": 64.0}
+
+
+def _tree_size(root) -> int:
+    size, stack = 0, [root]
+    while stack:
+        node = stack.pop()
+        size += 1
+        stack.extend(node.children)
+    return size
+
+
+def measure(workload, strategy, gen_type, max_steps, repeat) -> dict:
+    """
+    Одна ячейка. Под BOTTOM обобщения вкладывают let в let, и str() таких выражений
+    (ключи MSG) уходит глубоко в рекурсию, поэтому, как при pickle, предел поднимается
+    deep_recursion. RecursionError и после этого — статус error; прочие исключения — ошибки.
+    """
+    program, expr, types = workload.parsed()
+    budget = Budget(max_steps=max_steps)
+    best = math.inf
+    try:
+        with deep_recursion():
+            for _ in range(repeat):
+                gc.collect()
+                started = time.perf_counter()
+                tree, _, sc = supercompile(program, expr, types, strategy=strategy, gen_type=gen_type, budget=budget)
+                best = min(best, time.perf_counter() - started)
+            gc.collect()
+            tracemalloc.start()
+            try:
+                supercompile(program, expr, types, strategy=strategy, gen_type=gen_type, budget=budget)
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    except RecursionError as e:
+        return {"status": "error", "error": f"RecursionError: {e}"}
+    c = sc.stats.counters
+    return {"status": "ok", "nodes": _tree_size(tree), "created": c.get("nodes", 0), "stopped": c.get("stopped", 0),
+            "seconds": best, "peak_kb": peak / 1024}
+
+
+def growth(points) -> str:
+    """k в value ~ n^k по крайним точкам [(n, value)]."""
+    (n1, v1), (n2, v2) = points[0], points[-1]
+    if n1 == n2 or v1 <= 0 or v2 <= 0:
+        return "-"
+    return f"n^{math.log(v2 / v1) / math.log(n2 / n1):.2f}"
+
+
+def compare(rows, baseline, tolerance) -> list:
+    """Строки-описания регрессий относительно базы."""
+    problems = []
+    base_cells = baseline["cells"]
+    for key, row in rows.items():
+        base = base_cells.get(key)
+        if base is None:
+            continue
+        if row["status"] != "ok":
+            if base["status"] == "ok":
+                problems.append(f"{key}: status ok -> {row['status']}")
+            continue
+        if base["status"] != "ok":
+            print(f"{key}: {base['status']} in the baseline, ok now (run with --save)")
+            continue
+        for metric in ("nodes", "created", "stopped"):
+            if row[metric] != base[metric]:
+                problems.append(f"{key}: {metric} {base[metric]} -> {row[metric]}")
+        for metric in ("norm", "peak_kb"):
+            was, now = base[metric], row[metric]
+            if now > was * (1 + tolerance) and now - was > NOISE[metric]:
+                problems.append(f"{key}: {metric} {was:.1f} -> {now:.1f} (+{(now / was - 1) * 100:.0f}%)")
+    missing = sorted(set(base_cells) - set(rows))
+    if missing and len(missing) < len(base_cells):
+        print(f"not measured this run: {len(missing)} baseline cells")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scaling of supercompilation on generated programs")
+    parser.add_argument("--only", choices=sorted(GENERATORS), nargs="+", default=None,
+                        help="Generators to run (default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help="Values of n for every selected generator (default: per generator)")
+    parser.add_argument("--max-steps", type=int, default=100, help="Step limit of one tree (as in main.py)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per cell, the best one counts")
+    parser.add_argument("--tolerance", type=float, default=1.0,
+                        help="Allowed relative growth of norm and peak over the baseline")
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline JSON file")
+    parser.add_argument("--save", action="store_true", help="Write this run as the new baseline")
+    args = parser.parse_args()
+
+    unit = calibrate()
+    print(f"calibration: {unit * 1000:.2f} ms per unit\n")
+    print(f"{'input':<14}{'config':<12}{'status':<8}{'nodes':>7}{'created':>8}{'stopped':>8}{'ms':>10}{'norm':>9}{'peak KB':>10}")
+    rows = {}
+    series = {}     # (генератор, конфигурация) -> [(n, строка)]
+    for name in args.only or list(GENERATORS):
+        for n in args.sizes or SIZES[name]:
+            workload = GENERATORS[name](n)
+            for strategy, gen_type in CONFIGS:
+                config = f"{strategy}/{gen_type}"
+                row = measure(workload, strategy, gen_type, args.max_steps, args.repeat)
+                rows[f"{workload.name} {config}"] = row
+                if row["status"] != "ok":
+                    print(f"{workload.name:<14}{config:<12}{'error':<8}  {row['error'][:60]}")
+                    continue
+                row["norm"] = row["seconds"] / unit
+                series.setdefault((name, config), []).append((n, row))
+                print(f"{workload.name:<14}{config:<12}{'ok':<8}{row['nodes']:>7}{row['created']:>8}{row['stopped']:>8}"
+                      f"{row['seconds'] * 1000:>10.2f}{row['norm']:>9.1f}{row['peak_kb']:>10.1f}")
+
+    print(f"\n{'generator':<14}{'config':<12}{'n':>9}{'created':>10}{'time':>10}{'peak':>10}")
+    for (name, config), points in series.items():
+        span = f"{points[0][0]}..{points[-1][0]}"
+        print(f"{name:<14}{config:<12}{span:>9}"
+              f"{growth([(n, r['created']) for n, r in points]):>10}"
+              f"{growth([(n, r['seconds']) for n, r in points]):>10}"
+              f"{growth([(n, r['peak_kb']) for n, r in points]):>10}")
+
+    if args.save:
+        cells = {k: {m: (round(v, 2) if isinstance(v, float) else v) for m, v in r.items() if m != "seconds"}
+                 for k, r in rows.items()}
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"max_steps": args.max_steps, "cells": cells}, f, indent=1, ensure_ascii=False)
+            f.write("\n")
+        print(f"\nbaseline written: {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("\nno baseline to compare with (run with --save)")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline["max_steps"] != args.max_steps:
+        print(f"\nbaseline was taken with --max-steps {baseline['max_steps']}, not compared")
+        return
+    problems = compare(rows, baseline, args.tolerance)
+    if problems:
+        print(f"\n{len(problems)} regressions against {args.baseline}:")
+        for p in problems:
+            print(f"  {p}")
+        sys.exit(1)
+    print(f"\nno regressions against the baseline (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
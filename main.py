@@ -1,13 +1,25 @@
 import argparse
 import sys
 import os
+import time
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from sll.parser import parse, Parser, tokenize
 from sll.type_checker import check_program
+from sll.cache import SupercompilationCache, supercompile
+from sll.process_graph import compact, count_stored
 from sll.supercompiler import Supercompiler
 from sll.residualizer import Residualizer
+from sll.optimizer import optimize
+from sll.minimize import minimize
+from sll.cost import cost_table, recurrences, residual_call
+from sll.autotune import autotune
+from sll.budget import Budget
+from sll.trace import Tracer, TextSink, JsonlSink, LEVELS, QUIET
+from sll.stats import Stats
+from sll.tree_store import TreeStore
+from sll.stream import CREATED, DRIVEN, CLOSED, DONE
 from sll.exporter import to_dot
 from sll.ast_nodes import TypeExpr, Var
 
@@ -20,6 +32,66 @@ try:
 except ImportError:
     HAS_GRAPHVIZ = False
 
+def export_graph(tree, args, start_expr, dev_mode, run_stats):
+    """Сохраняет дерево в output/<out>.dot (и .png, если установлен graphviz)."""
+    # Создаем папку output, если нет
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+    out_path_base = os.path.join(OUTPUT_DIR, args.out)
+
+    print(f"--- Exporting Graph to {OUTPUT_DIR}/ ---")
+    with run_stats.timer("export"):
+        dot_code = to_dot(tree, dev_mode=dev_mode, start_expr=start_expr)
+
+    graph_label = (
+        f"Expression: {args.expr}\\n"
+        f"Whistle Strategy: {args.strategy} | Gen Type: {args.gen}"
+    )
+
+    header_settings = (
+        f'\n  label="{graph_label}";\n'
+        f'  labelloc="t";\n'      # Расположить сверху (top)
+        f'  fontsize=20;\n'       # Размер шрифта
+        f'  fontname="Arial";\n'
+    )
+    dot_code = dot_code.replace('{', '{' + header_settings, 1)
+
+    # Сохраняем .dot
+    with open(f"{out_path_base}.dot", 'w', encoding='utf-8') as f:
+        f.write(dot_code)
+
+    # Рисуем граф
+    if HAS_GRAPHVIZ:
+        try:
+            s = graphviz.Source(dot_code)
+            output_file = s.render(filename=args.out, directory=OUTPUT_DIR, format="png", cleanup=True)
+            print(f"✅ Graph saved: {output_file}")
+        except Exception as e:
+            print(f"Warning: Graphviz render failed: {e}")
+    else:
+        print(f"Saved .dot file. Install 'graphviz' to generate PNG automatically.")
+
+
+def progress_printer(stream=sys.stderr, interval: float = 0.1):
+    """Потребитель событий построения: строка прогресса в stderr не чаще раза в interval секунд."""
+    counts = {CREATED: 0, DRIVEN: 0, CLOSED: 0}
+    last = 0.0
+
+    def on_event(event):
+        nonlocal last
+        if event.kind in counts:
+            counts[event.kind] += 1
+        now = time.monotonic()
+        if event.kind == DONE or now - last >= interval:
+            last = now
+            stream.write(f"\r  nodes {counts[CREATED]}, driven {counts[DRIVEN]}, closed {counts[CLOSED]}")
+            if event.kind == DONE:
+                stream.write("\n")
+            stream.flush()
+
+    return on_event
+
+
 def main():
     parser = argparse.ArgumentParser(description="SLL Supercompiler")
     parser.add_argument("file", help="Filename of .sll program (looks in current dir or ./samples/)")
@@ -32,6 +104,55 @@ def main():
                     help="Generalization type: TOP (rewrite ancestor) or BOTTOM (rewrite current)")
     parser.add_argument("-d", "--dev", choices=['ON', 'OFF'], default='OFF',
                     help="Developer mode: ON (show tags in graph) or OFF (hide tags)")
+    parser.add_argument("--global-fold", action="store_true",
+                    help="Fold onto already processed nodes of any branch (process tree becomes a DAG)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                    help="Worker processes for --auto candidates")
+    parser.add_argument("--cache-dir", default=None,
+                    help="Directory of the on-disk result cache (disabled if not set)")
+    parser.add_argument("--cache-max-mb", type=int, default=256,
+                    help="Cache size limit in MB; least recently used entries are evicted")
+    parser.add_argument("--share-subtrees", action="store_true",
+                    help="Store renaming-equivalent finished subtrees once (process graph)")
+    parser.add_argument("--checkpoint", default=None,
+                    help="Periodically save the supercompiler state to this file")
+    parser.add_argument("--checkpoint-every", type=int, default=50,
+                    help="Driving steps (and basis trees) between checkpoints")
+    parser.add_argument("--resume", default=None,
+                    help="Continue an interrupted run from this checkpoint file")
+    parser.add_argument("--max-steps", type=int, default=100,
+                    help="Driving steps per process tree")
+    parser.add_argument("--time-limit", type=float, default=None,
+                    help="Wall time budget in seconds for the whole run")
+    parser.add_argument("--max-nodes", type=int, default=None,
+                    help="Budget of created process tree nodes for the whole run")
+    parser.add_argument("--max-memory-mb", type=float, default=None,
+                    help="Budget of estimated process tree memory in MB")
+    parser.add_argument("--max-depth", type=int, default=None,
+                    help="Maximal depth of a branch; deeper nodes are not driven")
+    parser.add_argument("--trace", choices=list(LEVELS), default=None,
+                    help="Trace level of driving events (default: quiet; debug with --trace-file)")
+    parser.add_argument("--trace-file", default=None,
+                    help="Write trace events as JSON lines to this file instead of stderr")
+    parser.add_argument("--lean", action="store_true",
+                    help="Lean nodes without visualization metadata; the graph is not exported")
+    parser.add_argument("--pack-tree", action="store_true",
+                    help="Keep the finished process tree in compact parallel arrays")
+    parser.add_argument("--stats", nargs="?", const="-", default=None, metavar="FILE",
+                    help="Print counters and phase timings as JSON (to FILE if given)")
+    parser.add_argument("--incremental", action="store_true",
+                    help="Residualize closed subtrees during construction (no graph export)")
+    parser.add_argument("--progress", action="store_true",
+                    help="Show tree construction progress on stderr (builds sequentially)")
+    parser.add_argument("--optimize", action="store_true",
+                    help="Optimize the residual program (dead code, inlining, unused parameters, merging)")
+    parser.add_argument("--minimize", action="store_true",
+                    help="Merge equivalent functions of the residual program (partition refinement)")
+    parser.add_argument("--auto", action="store_true",
+                    help="Pick -s/-g automatically: run all four under a shared budget (-j in parallel), "
+                         "keep the cheapest residual program")
+    parser.add_argument("--cost", type=int, default=None, metavar="N",
+                    help="Estimate reductions/allocations of source and residual for input sizes 0..N-1")
 
     args = parser.parse_args()
     DEV_MODE = (args.dev == 'ON')
@@ -112,62 +233,119 @@ def main():
             start_var_types[vname] = TypeExpr(tname, [])
 
     # --- 5. Запуск Суперкомпилятора ---
+    # Когда бюджет исчерпан, непрогнанные узлы остаются вызовами исходной программы
+    budget = Budget(max_steps=args.max_steps, max_seconds=args.time_limit, max_nodes=args.max_nodes,
+                    max_memory_mb=args.max_memory_mb, max_depth=args.max_depth)
+
+    if args.auto and not args.resume:
+        # Победитель затем строится заново с полным бюджетом: нужны дерево и статистика
+        print("--- Auto-tuning: HE/TAG x TOP/BOTTOM ---")
+        tuned = autotune(prog, start_expr, start_var_types, budget=budget, workers=args.jobs)
+        print(tuned.summary())
+        args.strategy, args.gen = tuned.best.strategy, tuned.best.gen_type
+
     print(f"--- Supercompiling: {start_expr} ---")
     print(f"    Strategy: {args.strategy}")
     print(f"    Generalize type: {args.gen}")
     print(f"    Context: {start_var_types}")
 
-    sc = Supercompiler(prog, strategy=args.strategy, gen_type=args.gen)
+    # Трассировка: текст в stderr или JSONL в файл
+    level = LEVELS[args.trace or ("debug" if args.trace_file else "quiet")]
+    sink = None
+    if level != QUIET:
+        sink = JsonlSink(args.trace_file) if args.trace_file else TextSink()
+    tracer = Tracer(sink, level)
+
+    cache = None
+    if args.cache_dir:
+        cache = SupercompilationCache(args.cache_dir, max_bytes=args.cache_max_mb * 1024 * 1024)
+
     if args.gen == 'TOP':
         print("Running Classical TOP-down Supercompilation...")
-        sc.build_tree(start_expr, start_var_types)
     else:
         print("Running Abramov's BOTTOM-up Supercompilation with Hypercycle...")
-        sc.run_hypercycle(start_expr, start_var_types)
-
-    # --- 6. Экспорт (Graphviz) ---
-    # Создаем папку output, если нет
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-    out_path_base = os.path.join(OUTPUT_DIR, args.out)
-
-    print(f"--- Exporting Graph to {OUTPUT_DIR}/ ---")
-    dot_code = to_dot(sc.tree, dev_mode=DEV_MODE, start_expr=start_expr)
+    if args.resume:
+        # Настройки и программа берутся из чекпоинта
+        print(f"--- Resuming from {args.resume} ---")
+        sc = Supercompiler.resume(args.resume, budget=budget, tracer=tracer)
+        tree, new_prog = sc.tree, Residualizer(sc.tree, sc.program, sc.stats).residualize()
+    else:
+        tree, new_prog, sc = supercompile(prog, start_expr, start_var_types, strategy=args.strategy,
+                                          gen_type=args.gen, global_folding=args.global_fold,
+                                          cache=cache,
+                                          checkpoint_path=args.checkpoint,
+                                          checkpoint_every=args.checkpoint_every,
+                                          budget=budget, tracer=tracer, lean=args.lean,
+                                          on_event=progress_printer() if args.progress else None,
+                                          incremental=args.incremental,
+                                          share_subtrees=args.share_subtrees)
+    tracer.close()
+    # Счетчики и время фаз; при попадании в кэш суперкомпиляции не было
+    run_stats = sc.stats if sc is not None else Stats()
+    if sc is None:
+        print(f"--- Cache hit: {cache.path} ---")
 
-    graph_label = (
-        f"Expression: {args.expr}\\n"
-        f"Whistle Strategy: {args.strategy} | Gen Type: {args.gen}"
-    )
+    if args.global_fold and sc is not None:
+        print(f"Global folding: {len(sc.shared_refs)} shared references, {sc.saved_nodes} nodes saved")
 
-    header_settings = (
-        f'\n  label="{graph_label}";\n'
-        f'  labelloc="t";\n'      # Расположить сверху (top)
-        f'  fontsize=20;\n'       # Размер шрифта
-        f'  fontname="Arial";\n'
-    )
-    dot_code = dot_code.replace('{', '{' + header_settings, 1)
+    if args.share_subtrees and args.gen == 'BOTTOM':
+        # лес гиперцикла сжимается после обрезки; в TOP поддеревья слиты по ходу постройки
+        stats = compact(tree)
+        print(f"Shared subtrees: {stats.shared_subtrees}, nodes {stats.nodes_before} -> {stats.nodes_after}")
+    elif args.share_subtrees and sc is not None:
+        print(f"Shared subtrees: {run_stats.counters.get('shared_subtrees', 0)} merged while building, "
+              f"{count_stored(tree)} nodes stored")
 
-    # Сохраняем .dot
-    with open(f"{out_path_base}.dot", 'w', encoding='utf-8') as f:
-        f.write(dot_code)
+    if args.pack_tree:
+        store = TreeStore.pack(tree)
+        tree = store.root
+        print(f"Packed tree: {len(store)} nodes, {len(store.exprs)} distinct expressions, "
+              f"{store.nbytes()} bytes of node arrays")
 
-    # Рисуем граф
-    if HAS_GRAPHVIZ:
-        try:
-            s = graphviz.Source(dot_code)
-            output_file = s.render(filename=args.out, directory=OUTPUT_DIR, format="png", cleanup=True)
-            print(f"✅ Graph saved: {output_file}")
-        except Exception as e:
-            print(f"Warning: Graphviz render failed: {e}")
+    # --- 6. Экспорт (Graphviz) ---
+    if args.lean:
+        print("--- Lean mode: graph is not exported ---")
+    elif args.incremental:
+        print("--- Incremental residualization: graph is not exported ---")
     else:
-        print(f"Saved .dot file. Install 'graphviz' to generate PNG automatically.")
+        export_graph(tree, args, start_expr, DEV_MODE, run_stats)
 
     # --- 7. Резидуализация ---
+    if args.optimize:
+        rules_before = len(new_prog.rules)
+        new_prog = optimize(new_prog, stats=run_stats)
+        print(f"--- Optimized residual program: {rules_before} -> {len(new_prog.rules)} rules ---")
+    if args.minimize:       # после --optimize: его подстановки могут сделать функции эквивалентными
+        rules_before = len(new_prog.rules)
+        new_prog = minimize(new_prog, stats=run_stats)
+        print(f"--- Minimized residual program: {rules_before} -> {len(new_prog.rules)} rules ---")
+
     print("\n=== RESIDUAL PROGRAM ===")
-    res = Residualizer(sc.tree, prog)
-    new_prog = res.residualize()
     print(new_prog)
     print("========================")
 
+    if args.cost:
+        names = [v.name for v in Residualizer(None)._get_vars(start_expr)]
+        sizes = list(range(args.cost))
+        source_cost = cost_table(prog, start_expr, sizes, names)
+        residual_cost = cost_table(new_prog, residual_call(new_prog, names), sizes, names)
+        fmt = lambda c: f"{c.reductions}/{c.allocations}" if c else "?"
+        print("\n=== COST (reductions/allocations) ===")
+        print(f"{'size':>6}{'source':>14}{'residual':>14}")
+        for n, a, b in zip(sizes, source_cost, residual_cost):
+            print(f"{n:>6}{fmt(a):>14}{fmt(b):>14}")
+        call = residual_call(new_prog, names)
+        rec = recurrences(new_prog, call, names) if call is not None else None
+        if rec is not None:
+            print("\n=== COST RECURRENCES (reductions/allocations) ===")
+            print(rec)
+
+    if args.stats == "-":
+        print("\n=== STATS ===")
+        print(run_stats.to_json())
+    elif args.stats:
+        with open(args.stats, 'w', encoding='utf-8') as f:
+            f.write(run_stats.to_json() + "\n")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
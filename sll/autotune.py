@@ -0,0 +1,245 @@
+import copy
+import dataclasses
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from sll.ast_nodes import Program, Expr, Ctr, FCall, TypeExpr
+from sll.budget import Budget
+from sll.cache import supercompile
+from sll.cost import cost_table, residual_call, sample_value
+from sll.interpreter import evaluate
+from sll.matching import substitute
+from sll.residualizer import Residualizer
+
+# Автоподбор стратегии суперкомпиляции (свисток HE/TAG × обобщение TOP/BOTTOM).
+#
+# Каждая конфигурация из CANDIDATES прогоняется на одном входе, результаты сравниваются:
+#   cost  — редукции остаточной программы по статической модели (sll/cost.py),
+#           сумма по входам размеров 0..sizes-1 (все переменные одного размера);
+#   nodes — узлов в готовом дереве процессов;
+#   time  — секунд на дерево и остаточную программу.
+# Оценка конфигурации — сумма WEIGHTS[метрика] * log2(значение / лучшее среди кандидатов):
+# 0 у лучшего по всем метрикам, вес за каждое удвоение; побеждает наименьшая. Стоимость
+# остаточной программы важнее всего: удвоение дерева или времени весит 0.05, стоимости — 1.
+# Кандидаты, чью остаточную программу модель оценить не смогла, идут после оцененных.
+#
+# До оценки остаточная программа сверяется с исходной на тех же входах размеров
+# 0..sizes-1 (sample_value; переменные — со сдвигом размеров, как в bench/reductions.py):
+# кандидат, который хоть раз дал другой результат, выбывает, как упавший. Сверка — по
+# значению: по имени интерпретатор берет правило-переменную (eq x y) -> [False], не
+# вычисляя аргументов, а прогонка, как и вычисление по значению, сначала их вычисляет.
+#
+# Бюджет общий: max_nodes и max_memory_mb делятся между всеми кандидатами, max_seconds —
+# между волнами запусков (при workers >= числа кандидатов все идут одной волной).
+# max_steps и max_depth — пределы одного дерева, остаются как есть.
+
+CANDIDATES: List[Tuple[str, str]] = [("HE", "TOP"), ("HE", "BOTTOM"), ("TAG", "TOP"), ("TAG", "BOTTOM")]
+
+WEIGHTS: Dict[str, float] = {"cost": 1.0, "nodes": 0.05, "time": 0.05}
+
+# сдвиг, чтобы нулевые значения (стоимость пустой программы, миг) сравнивались без деления на ноль
+_EPS: Dict[str, float] = {"cost": 1.0, "nodes": 1.0, "time": 1e-3}
+
+CHECK_STEPS = 20000     # шагов интерпретатора на одну сверку; не уложившиеся входы не сверяются
+
+
+@dataclass
+class Candidate:
+    """Результат одной конфигурации."""
+    strategy: str
+    gen_type: str
+    residual: Optional[Program] = None
+    cost: Optional[int] = None          # None — модель не оценила (или запуск упал)
+    allocations: Optional[int] = None
+    nodes: int = 0
+    seconds: float = 0.0
+    stopped: int = 0                    # узлов, не прогнанных из-за бюджета
+    error: Optional[str] = None         # упал или разошелся с исходной программой
+    parts: Dict[str, float] = field(default_factory=dict)   # вклад метрик в оценку
+
+    @property
+    def name(self) -> str:
+        return f"{self.strategy}/{self.gen_type}"
+
+    @property
+    def score(self) -> float:
+        return sum(self.parts.values()) if self.error is None else math.inf
+
+    def rank_key(self) -> Tuple[bool, bool, float]:
+        return (self.error is not None, self.cost is None, self.score)
+
+
+_DESCRIBE = {
+    "cost": lambda c: f"{c.cost} estimated reductions",
+    "nodes": lambda c: f"{c.nodes} tree nodes",
+    "time": lambda c: f"{c.seconds * 1000:.1f} ms",
+}
+
+
+@dataclass
+class AutotuneResult:
+    best: Candidate
+    candidates: List[Candidate] = field(default_factory=list)   # от лучшего к худшему
+    sizes: int = 0
+
+    def summary(self) -> str:
+        """Таблица кандидатов и почему выбран победитель."""
+        lines = [f"{'config':<12}{'cost':>8}{'allocs':>8}{'nodes':>7}{'ms':>9}{'score':>8}"]
+        for c in self.candidates:
+            cost = "?" if c.cost is None else str(c.cost)
+            allocs = "?" if c.allocations is None else str(c.allocations)
+            note = f"  {c.error}" if c.error else (f"  stopped {c.stopped}" if c.stopped else "")
+            score = "-" if c.error else f"{c.score:.2f}"
+            lines.append(f"{c.name:<12}{cost:>8}{allocs:>8}{c.nodes:>7}{c.seconds * 1000:>9.1f}{score:>8}{note}")
+        lines.append(self.reason())
+        return "\n".join(lines)
+
+    def reason(self) -> str:
+        """Решающая метрика против второго места (и в чем победитель уступает)."""
+        best = self.best
+        rivals = [c for c in self.candidates if c is not best and c.error is None]
+        if not rivals:
+            return f"{best.name} wins: the only configuration that finished"
+        runner = rivals[0]
+        if best.cost is not None and runner.cost is None:
+            return (f"{best.name} wins: {best.cost} estimated reductions on sizes 0..{self.sizes - 1}, "
+                    f"the cost of {runner.name} and the rest could not be estimated")
+        gains = {m: runner.parts.get(m, 0.0) - best.parts.get(m, 0.0) for m in best.parts}
+        decisive = max(gains, key=gains.get)
+        why = f"{_DESCRIBE[decisive](best)} vs {_DESCRIBE[decisive](runner)} for {runner.name}"
+        if decisive == "cost":
+            why += f" (sizes 0..{self.sizes - 1})"
+        losses = [m for m, g in gains.items() if g < 0]
+        if losses:
+            why += "; despite " + ", ".join(f"{_DESCRIBE[m](best)} vs {_DESCRIBE[m](runner)}" for m in losses)
+        if gains[decisive] == 0:
+            why = f"ties with {runner.name} on every metric, listed first"
+        return f"{best.name} wins: {why}"
+
+
+def share_budget(budget: Budget, count: int, workers: int) -> Budget:
+    """Доля общего бюджета на одного из count кандидатов при workers параллельных запусках."""
+    waves = math.ceil(count / max(1, min(workers, count)))
+    return dataclasses.replace(
+        budget,
+        max_seconds=None if budget.max_seconds is None else budget.max_seconds / waves,
+        max_nodes=None if budget.max_nodes is None else max(1, budget.max_nodes // count),
+        max_memory_mb=None if budget.max_memory_mb is None else budget.max_memory_mb / count,
+    )
+
+
+def _tree_size(root) -> int:
+    size, stack = 0, [root]
+    while stack:
+        node = stack.pop()
+        size += 1
+        stack.extend(node.children)
+    return size
+
+
+def _run(job) -> Candidate:
+    """Одна конфигурация: дерево, остаточная программа и ее оценка (в исполнителе или здесь)."""
+    program, start_expr, start_var_types, strategy, gen_type, budget, sizes = job
+    candidate = Candidate(strategy, gen_type)
+    started = time.perf_counter()
+    try:
+        tree, residual, sc = supercompile(program, start_expr, start_var_types,
+                                          strategy=strategy, gen_type=gen_type, budget=budget)
+    except Exception as e:     # кандидат выбывает, остальные продолжают
+        candidate.error = f"{type(e).__name__}: {e}"
+        return candidate
+    candidate.seconds = time.perf_counter() - started
+    candidate.residual = residual
+    candidate.nodes = _tree_size(tree)
+    candidate.stopped = sc.stats.counters.get("stopped", 0)
+
+    names = [v.name for v in Residualizer(None)._get_vars(start_expr)]
+    call = residual_call(residual, names)
+    candidate.error = _check(program, residual, start_expr, start_var_types, call, names, sizes)
+    if candidate.error is not None:
+        return candidate
+    table = cost_table(residual, call, list(range(sizes)), names) if call is not None else [None]
+    if all(c is not None for c in table):
+        candidate.cost = sum(c.reductions for c in table)
+        candidate.allocations = sum(c.allocations for c in table)
+    return candidate
+
+
+def _is_data(expr: Expr) -> bool:
+    return isinstance(expr, Ctr) and all(_is_data(a) for a in expr.args)
+
+
+def _check(program: Program, residual: Program, start_expr: Expr, start_var_types: Dict[str, TypeExpr],
+           call: Optional[FCall], names: List[str], sizes: int) -> Optional[str]:
+    """
+    Сверка остаточной программы с исходной: описание первого расхождения или None.
+    Сверяются входы, на которых исходная программа дает данные за CHECK_STEPS шагов
+    (и остаточная укладывается в тот же предел).
+    """
+    if call is None:
+        return "empty residual program"
+    for k in range(sizes):
+        try:
+            values = {n: sample_value(start_var_types[n], program.types, (k + i) % sizes)
+                      for i, n in enumerate(names)}
+        except (KeyError, StopIteration):
+            return None     # тип без определения в программе: входов не построить
+        expected, steps = evaluate(substitute(start_expr, values), program, max_steps=CHECK_STEPS, strict=True)
+        if steps >= CHECK_STEPS or not _is_data(expected):
+            continue
+        got, steps = evaluate(substitute(call, values), residual, max_steps=CHECK_STEPS, strict=True)
+        if steps < CHECK_STEPS and str(got) != str(expected):
+            return f"wrong result on {substitute(start_expr, values)}: {got} instead of {expected}"
+    return None
+
+
+def _score(candidates: List[Candidate], weights: Dict[str, float]):
+    """
+    Вклад метрики — вес * log2(значение / лучшее значение): 0 у лучшего,
+    вес за каждое удвоение. Стоимость сравнивается только среди оцененных.
+    """
+    finished = [c for c in candidates if c.error is None]
+    values = {
+        "cost": lambda c: c.cost,
+        "nodes": lambda c: c.nodes,
+        "time": lambda c: c.seconds,
+    }
+    for metric, value in values.items():
+        known = [value(c) for c in finished if value(c) is not None]
+        if not known:
+            continue
+        best = min(known)
+        for c in finished:
+            v = value(c)
+            if v is not None:
+                c.parts[metric] = weights.get(metric, 0.0) * math.log2((v + _EPS[metric]) / (best + _EPS[metric]))
+
+
+def autotune(program: Program, start_expr: Expr, start_var_types: Dict[str, TypeExpr],
+             budget: Optional[Budget] = None, workers: int = 1, sizes: int = 6,
+             candidates: Optional[List[Tuple[str, str]]] = None,
+             weights: Optional[Dict[str, float]] = None) -> AutotuneResult:
+    """
+    Прогоняет конфигурации candidates (по умолчанию CANDIDATES) под общим бюджетом
+    budget, workers > 1 — в отдельных процессах, и выбирает лучшую по WEIGHTS.
+    Порядок кандидатов в результате — по оценке; при равной оценке — как в candidates.
+    """
+    configs = candidates or CANDIDATES
+    share = share_budget(budget or Budget(), len(configs), workers)
+    # у каждого кандидата свои программа и старт: TAG размечает их на месте
+    jobs = [(copy.deepcopy(program), copy.deepcopy(start_expr), start_var_types, s, g, share, sizes)
+            for s, g in configs]
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_run, jobs))
+    else:
+        results = [_run(job) for job in jobs]
+
+    _score(results, weights or WEIGHTS)
+    ranked = sorted(results, key=Candidate.rank_key)
+    if ranked[0].error is not None:
+        raise RuntimeError("no configuration finished: " + "; ".join(f"{c.name}: {c.error}" for c in ranked))
+    return AutotuneResult(ranked[0], ranked, sizes)
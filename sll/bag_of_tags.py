@@ -21,9 +21,15 @@ class TagBag:
         Возвращает tag-bag для конфигурации узла (heap/focus/stack).
         """
         bag = Counter()
-
-        # focus root tag: 3 * tag(focus)
-        TagBag._add_tag(bag, getattr(node.expr, "tag", None), TagBag.W_FOCUS)
+        context = getattr(node, "context", None)
+
+        # focus root tag: 3 * tag(focus); между шагами в фокусе expr не собран —
+        # корень конфигурации берем из нижнего кадра контекста
+        if context is None:
+            root = node.expr
+        else:
+            root = context.frames[0].call if context.frames else context.focus
+        TagBag._add_tag(bag, getattr(root, "tag", None), TagBag.W_FOCUS)
 
         # heap root tags: 2 * tag(rhs)
         for hb in getattr(node, "heap", []):
@@ -0,0 +1,86 @@
+import sys
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sll.ast_nodes import Expr, Ctr, FCall, Let
+
+# Бюджеты суперкомпиляции.
+# Когда бюджет исчерпан, оставшиеся в очереди узлы помечаются stopped и не
+# прогоняются; резидуализатор превращает их в вызовы функций исходной программы
+# (см. Residualizer._stopped_expr). Так любой запуск за предсказуемое время
+# дает корректную, пусть и менее оптимизированную, остаточную программу.
+
+_NODE_BYTES = 400   # грубая оценка узла без выражения (dataclass, списки, словарь типов)
+
+
+@dataclass
+class Budget:
+    """
+    Пределы одного запуска; None — без предела.
+    max_steps  — шагов прогонки на одно дерево (как раньше в build_tree);
+    max_seconds, max_nodes, max_memory_mb — на весь запуск (с гиперциклом);
+    max_depth  — глубина ветки: более глубокие узлы не прогоняются, остальные ветки строятся дальше.
+    """
+    max_steps: int = 100
+    max_seconds: Optional[float] = None
+    max_nodes: Optional[int] = None
+    max_memory_mb: Optional[float] = None
+    max_depth: Optional[int] = None
+
+
+class BudgetMeter:
+    """Расход бюджета: время с начала запуска, созданные узлы и оценка их памяти."""
+
+    def __init__(self, budget: Budget):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.nodes = 0
+        self.bytes = 0
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def add_node(self, expr: Expr):
+        self.nodes += 1
+        if self.budget.max_memory_mb is not None:
+            self.bytes += _NODE_BYTES + _expr_bytes(expr)
+
+    def exhausted(self) -> Optional[str]:
+        """Причина остановки или None, если бюджет запуска не исчерпан."""
+        b = self.budget
+        if b.max_seconds is not None and self.elapsed() > b.max_seconds:
+            return f"time limit reached: {b.max_seconds}s"
+        if b.max_nodes is not None and self.nodes > b.max_nodes:
+            return f"node limit reached: {b.max_nodes}"
+        if b.max_memory_mb is not None and self.bytes > b.max_memory_mb * 1024 * 1024:
+            return f"memory limit reached: {b.max_memory_mb} MB"
+        return None
+
+    # В чекпоинте храним потраченное время, а не момент старта:
+    # monotonic-часы другого процесса несравнимы.
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["started"] = self.elapsed()
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.started = time.monotonic() - state["started"]
+
+
+def _expr_bytes(expr: Expr) -> int:
+    total = 0
+    stack = [expr]
+    while stack:
+        e = stack.pop()
+        total += sys.getsizeof(e)
+        match e:
+            case Ctr(_, args) | FCall(_, args):
+                total += sys.getsizeof(args)
+                stack.extend(args)
+            case Let(bindings, body):
+                stack.extend(v for _, v in bindings)
+                stack.append(body)
+    return total
+
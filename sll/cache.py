@@ -0,0 +1,267 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from sll.ast_nodes import Program, Rule, Expr, TypeExpr
+from sll.matching import renaming_key
+from sll.process_tree import Node, HeapBinding
+from sll.process_graph import rename_expr, rename_pattern, rename_contraction, _expr_vars
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer, _original_rename
+from sll.incremental import IncrementalResidualizer
+from sll.checkpoint import deep_recursion
+from sll.budget import Budget
+from sll.trace import Tracer
+from sll.stream import TreeEvent
+
+# Кэш результатов суперкомпиляции на диске (SQLite).
+# Ключ — хэш содержимого программы, стартовой конфигурации (с точностью до
+# переименования переменных), типов и настроек; значение — готовое дерево процессов
+# и остаточная программа в именах того запуска, который их записал. При попадании
+# с другими именами (add b a после add a b) дерево и программа переименовываются.
+# Размер ограничен: при переполнении выбрасываются давно не использованные записи (LRU).
+
+CACHE_VERSION = 5                 # меняется при изменении формата или алгоритма
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(program: Program, start_expr: Expr, start_var_types: Dict[str, TypeExpr],
+              strategy: str = "HE", gen_type: str = "TOP", global_folding: bool = False,
+              budget: Optional[Budget] = None, lean: bool = False, incremental: bool = False,
+              share_subtrees: bool = False) -> str:
+    """
+    Ключ записи. repr у AST не включает теги и номера строк,
+    поэтому ключ зависит только от содержимого. Стартовая конфигурация входит
+    renaming_key, а типы ее переменных — в порядке первого вхождения: (add a b)
+    и (add b a) с одинаковыми типами дают один ключ.
+    Считать до создания Supercompiler: в режиме TAG он размечает программу.
+    """
+    names = _expr_vars(start_expr)
+    config = renaming_key(start_expr)
+    if config is None:
+        config = repr(start_expr)   # let не сравнивается по переименованию
+        names = sorted(start_var_types)
+    extra = sorted((name, repr(t)) for name, t in start_var_types.items() if name not in names)
+    parts = [
+        f"v{CACHE_VERSION}",
+        repr(program),
+        config,
+        repr([repr(start_var_types.get(name)) for name in names]),
+        repr(extra),
+        strategy,
+        gen_type,
+        f"global_folding={global_folding}",
+        repr(budget if budget is not None else Budget()),
+        f"lean={lean}",       # облегченное дерево не годится для картинки
+        f"incremental={incremental}",   # от дерева остается только каркас
+        f"share_subtrees={share_subtrees}",     # в дереве узлы-ссылки SharedNode
+    ]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    tree: Node
+    residual: Program
+    names: List[str] = field(default_factory=list)     # переменные старта в порядке первого вхождения
+
+    def renamed(self, start_expr: Expr, program: Program) -> Optional['CacheEntry']:
+        """
+        Запись в именах start_expr (переименования того же старта) или None,
+        если новое имя совпало бы с другой переменной дерева.
+        Правила исходной программы, дописанные для непрогнанных узлов, не меняются:
+        их переменные связаны их же образцами и со стартом не связаны.
+        """
+        names = {old: new for old, new in zip(self.names, _expr_vars(start_expr)) if old != new}
+        if not names:
+            return self
+        if (_tree_names(self.tree) - set(self.names)) & set(names.values()):
+            return None
+        _rename_tree(self.tree, names)
+        originals = {_original_rename(r.pattern.name) for r in program.rules}
+        residual = Program([r if r.pattern.name in originals else
+                            Rule(rename_pattern(r.pattern, names), rename_expr(r.body, names), lineno=r.lineno)
+                            for r in self.residual.rules], self.residual.types, self.residual.signatures)
+        return CacheEntry(self.tree, residual, list(names.get(n, n) for n in self.names))
+
+
+def _walk(root) -> List[Node]:
+    result, stack = [], [root]
+    while stack:
+        n = stack.pop()
+        result.append(n)
+        stack.extend(n.children)
+    return result
+
+
+def _tree_names(root) -> set:
+    """Имена переменных в выражениях и типах узлов дерева."""
+    names = set()
+    for n in _walk(root):
+        names.update(n.var_types)
+        names.update(_expr_vars(n.expr))
+    return names
+
+
+def _rename_tree(root, names: Dict[str, str]):
+    """Переименовывает переменные во всех полях узлов (дерево из кэша — своя копия)."""
+    for n in _walk(root):
+        n.expr = rename_expr(n.expr, names)
+        n.var_types = {names.get(k, k): t for k, t in n.var_types.items()}
+        if not n.released:
+            n.heap = [HeapBinding(names.get(h.name, h.name), rename_expr(h.expr, names)) for h in n.heap]
+        if n is not root:
+            n.contraction = rename_contraction(n.contraction, names)
+        if isinstance(n, Node):
+            n.driven_from = rename_expr(n.driven_from, names)
+            n.driven_rule = rename_pattern(n.driven_rule, names)
+            n.gen_alpha = rename_expr(n.gen_alpha, names)
+            n.gen_beta = rename_expr(n.gen_beta, names)
+            n.gen_result = rename_expr(n.gen_result, names)
+
+
+class SupercompilationCache:
+    """
+    Кэш в каталоге directory (файл cache.sqlite).
+    max_bytes ограничивает суммарный размер записей.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, "cache.sqlite")
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        row = self.conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        try:
+            with deep_recursion():
+                entry = pickle.loads(row[0])
+        except Exception:
+            # запись от несовместимой версии кода — считаем промахом
+            self._delete(key)
+            self.misses += 1
+            return None
+        self.conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.conn.commit()
+        self.hits += 1
+        return entry
+
+    def put(self, key: str, tree: Node, residual: Program, names: Optional[List[str]] = None):
+        """names — переменные старта в порядке первого вхождения (для попаданий с другими именами)."""
+        with deep_recursion():
+            data = pickle.dumps(CacheEntry(tree, residual, names or []), protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, data, len(data), time.time()),
+        )
+        self._evict()
+        self.conn.commit()
+
+    def size(self) -> int:
+        """Суммарный размер записей в байтах."""
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def clear(self):
+        self.conn.execute("DELETE FROM entries")
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _delete(self, key: str):
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.conn.commit()
+
+    def _evict(self):
+        """Выбрасывает самые давно использованные записи, пока не влезем в max_bytes."""
+        total = self.size()
+        if total <= self.max_bytes:
+            return
+        rows = self.conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+
+
+def supercompile(program: Program, start_expr: Expr, start_var_types: Dict[str, TypeExpr],
+                 strategy: str = "HE", gen_type: str = "TOP", global_folding: bool = False,
+                 cache: Optional[SupercompilationCache] = None,
+                 checkpoint_path: Optional[str] = None, checkpoint_every: int = 50,
+                 budget: Optional[Budget] = None, tracer: Optional[Tracer] = None,
+                 lean: bool = False, on_event: Optional[Callable[[TreeEvent], None]] = None,
+                 incremental: bool = False, share_subtrees: bool = False):
+    """
+    Полный цикл (дерево + остаточная программа) с кэшем.
+    Возвращает (дерево, остаточная программа, Supercompiler или None при попадании в кэш).
+    С пределом по времени результат зависит от машины, такие запуски не кэшируются.
+    on_event — потребитель событий построения (Supercompiler.iter_build);
+    с ним дерево строится последовательно, при попадании в кэш событий нет.
+    incremental — остаточная программа строится по ходу постройки (sll/incremental.py),
+    от дерева остается каркас; программа та же.
+    share_subtrees — закрытые поддеревья сливаются по ходу постройки (TOP, см. Supercompiler).
+    """
+    if budget is not None and budget.max_seconds is not None:
+        cache = None
+    key = None
+    if cache is not None:
+        key = cache_key(program, start_expr, start_var_types, strategy, gen_type, global_folding,
+                        budget, lean, incremental, share_subtrees)
+        entry = cache.get(key)
+        if entry is not None and not share_subtrees:
+            # узлы-ссылки держат переименование относительно представителя: такие
+            # записи отдаем только в тех же именах
+            entry = entry.renamed(start_expr, program)
+        elif entry is not None and entry.names != _expr_vars(start_expr):
+            entry = None
+        if entry is not None:
+            return entry.tree, entry.residual, None
+
+    sc = Supercompiler(program, strategy=strategy, gen_type=gen_type,
+                       global_folding=global_folding,
+                       checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every,
+                       budget=budget, tracer=tracer, lean=lean, share_subtrees=share_subtrees)
+    if incremental:
+        residualizer = IncrementalResidualizer(sc, program, sc.stats)
+        for event in sc.iter_build(start_expr, start_var_types):
+            residualizer(event)
+            if on_event is not None:
+                on_event(event)
+        residual = residualizer.program
+    else:
+        if on_event is not None:
+            for event in sc.iter_build(start_expr, start_var_types):
+                on_event(event)
+        elif gen_type == "TOP":
+            sc.build_tree(start_expr, start_var_types)
+        else:
+            sc.run_hypercycle(start_expr, start_var_types)
+        residual = Residualizer(sc.tree, program, sc.stats).residualize()
+
+    if cache is not None:
+        cache.put(key, sc.tree, residual, _expr_vars(start_expr))
+    return sc.tree, residual, sc
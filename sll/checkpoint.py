@@ -0,0 +1,47 @@
+import os
+import pickle
+import sys
+import zlib
+
+# Чекпоинты долгих запусков суперкомпилятора.
+# В файл целиком попадает объект Supercompiler: дерево, очередь build_tree,
+# счетчик свежих имен, разметчик тегов и состояние гиперцикла. Один pickle
+# сохраняет общие ссылки между ними (родители, back_link, корни леса).
+# Формат: заголовок и сжатый zlib pickle; запись атомарная (через временный файл).
+
+CHECKPOINT_MAGIC = b"SLLCKPT1"    # меняется при изменении формата
+_PICKLE_RECURSION = 20_000        # глубокие деревья pickle обходит рекурсивно
+
+
+class deep_recursion:
+    """Временно поднимает предел рекурсии для pickle глубоких деревьев."""
+
+    def __enter__(self):
+        self.saved = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(self.saved, _PICKLE_RECURSION))
+
+    def __exit__(self, *exc):
+        sys.setrecursionlimit(self.saved)
+        return False
+
+
+def save_checkpoint(sc, path: str):
+    """Сохраняет состояние суперкомпилятора в path."""
+    with deep_recursion():
+        data = pickle.dumps(sc, protocol=pickle.HIGHEST_PROTOCOL)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(CHECKPOINT_MAGIC)
+        f.write(zlib.compress(data, 6))
+    # Старый чекпоинт остается целым, пока новый не записан до конца
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path: str):
+    """Читает чекпоинт; продолжить построение — Supercompiler.resume."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    if not raw.startswith(CHECKPOINT_MAGIC):
+        raise ValueError(f"{path}: not a supercompiler checkpoint")
+    with deep_recursion():
+        return pickle.loads(zlib.decompress(raw[len(CHECKPOINT_MAGIC):]))
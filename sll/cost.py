@@ -0,0 +1,712 @@
+import math
+from dataclasses import dataclass, field, replace
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sll.ast_nodes import Program, Rule, Pattern, TypeDef, TypeExpr, Expr, Var, Ctr, FCall, IntLit, Let
+from sll.residualizer import Residualizer, entry_name
+
+# Статическая модель стоимости программы: число редукций и выделенных конструкторов
+# (как их считает evaluate в sll/interpreter.py) в зависимости от размера входа.
+#
+# Вход задается не значением, а размером: значение типа размера n — n раз рекурсивный
+# конструктор, затем базовый ([S [S [Z]]] для Nat, список длины n), у нерекурсивных
+# типов (Bool) — конструктор номер n по кругу; сами такие значения строит sample_value.
+# Программа исполняется абстрактно над такими значениями (Shape): размер раскрывается
+# в конструктор, только когда его требует образец правила, поэтому стоимость зависит
+# от размеров, а не от конкретных данных.
+#
+# Вычисление по имени учитывается как в интерпретаторе: результат вызова — отложенное
+# значение со стоимостью pending, она платится, когда образец смотрит на значение или
+# когда значение попадает в нормальную форму результата. Аргумент, которым функция
+# не пользуется, не стоит ничего, а переменная, размноженная в теле, — по разу на копию.
+#
+# Правило выбирается как в интерпретаторе: первое, образец которого подходит без
+# вычислений; если такого нет, вычисляется самый левый отложенный аргумент и правила
+# перебираются снова. Отложенный вызов оплачивается сразу до своей головы: пока голова
+# не конструктор, никакое новое правило подойти не может, так что число шагов то же.
+# Вычисление по значению (evaluate(strict=True)) модель не описывает.
+#
+# Таблицы по размерам считаются по рекуррентностям (Recurrences): стоимость каждого
+# вызова-шаблона как функция размеров его аргументов выводится по правилам программы
+# один раз, а размеры только подставляются в нее. CostModel исполняет программу над
+# конкретными размерами; им оцениваются программы, для которых рекуррентности не
+# выводятся (образец требует голову рекурсивного вызова, как в (add (mul2 x y) y)).
+
+
+class Cost(NamedTuple):
+    """Оценка одного вычисления: редукции и выделенные конструкторы."""
+    reductions: int
+    allocations: int
+
+
+class CostUnknown(Exception):
+    """Оценка не получена: нет правил функции, тупик сопоставления или слишком глубокая рекурсия."""
+
+
+@dataclass(frozen=True)
+class Shape:
+    """
+    Абстрактное значение: известный конструктор с аргументами (ctr задан)
+    или значение заданного размера, конструктор которого еще не раскрыт.
+    pending/pending_allocs — стоимость, которую надо оплатить, чтобы получить голову значения.
+    """
+    ctr: Optional[str] = None
+    args: Tuple['Shape', ...] = ()
+    size: int = 0
+    pending: int = 0
+    pending_allocs: int = 0
+
+    def paid(self) -> 'Shape':
+        return replace(self, pending=0, pending_allocs=0) if self.pending or self.pending_allocs else self
+
+
+class _Account:
+    """Накопитель стоимости одного вызова."""
+    __slots__ = ("reductions", "allocations")
+
+    def __init__(self):
+        self.reductions = 0
+        self.allocations = 0
+
+    def pay(self, shape: Shape) -> Shape:
+        self.reductions += shape.pending
+        self.allocations += shape.pending_allocs
+        return shape.paid()
+
+
+class CostModel:
+    """
+    Абстрактное исполнение программы над размерами входа.
+    Вызовы запоминаются по (функция, абстрактные аргументы), поэтому таблица по
+    размерам 0..N строится за время, близкое к одному прогону самого большого размера.
+    """
+
+    def __init__(self, program: Program, max_depth: int = 150):
+        self.funcs: Dict[str, List[Rule]] = {}
+        for r in program.rules:
+            self.funcs.setdefault(r.pattern.name, []).append(r)
+        self.ctr_types: Dict[str, TypeDef] = {c.name: t for t in program.types for c in t.constructors}
+        self.max_depth = max_depth
+        self._memo: Dict[Tuple[str, Tuple[Shape, ...]], Shape] = {}
+        self._depth = 0
+
+    def estimate(self, expr: Expr, sizes: Dict[str, int]) -> Cost:
+        """
+        Стоимость вычисления expr до нормальной формы; sizes — размер каждой переменной.
+        Конструкторы самого expr — входные данные, как и у evaluate, не считаются.
+        """
+        env = {name: Shape(size=n) for name, n in sizes.items()}
+        acc = _Account()
+        try:
+            self._normal_form(self._eval(expr, env, _Account()), acc)
+        except RecursionError:
+            raise CostUnknown("recursion limit") from None
+        return Cost(acc.reductions, acc.allocations)
+
+    # --- Абстрактное исполнение ---
+
+    def _eval(self, expr: Expr, env: Dict[str, Shape], acc: _Account) -> Shape:
+        """Значение выражения тела; конструкторы тела оплачиваются сразу, вызовы откладываются."""
+        match expr:
+            case Var(name):
+                if name not in env:
+                    raise CostUnknown(f"free variable {name}")
+                return env[name]
+            case Ctr(name, args):
+                acc.allocations += 1
+                return Shape(name, tuple(self._eval(a, env, acc) for a in args))
+            case FCall(name, args):
+                return self._call(name, tuple(self._eval(a, env, acc) for a in args))
+            case Let(bindings, body):
+                inner = dict(env)
+                for name, value in bindings:
+                    inner[name] = self._eval(value, env, acc)
+                return self._eval(body, inner, acc)
+            case IntLit(value):
+                return Shape(str(value))
+            case _:
+                raise CostUnknown(f"unsupported expression {expr}")
+
+    def _call(self, name: str, args: Tuple[Shape, ...]) -> Shape:
+        """Отложенный результат вызова: его голова стоит pending редукций."""
+        key = (name, args)
+        if key in self._memo:
+            return self._memo[key]
+        if name not in self.funcs:
+            raise CostUnknown(f"no rules for {name}")
+        if self._depth >= self.max_depth:
+            raise CostUnknown(f"recursion deeper than {self.max_depth} in {name}")
+
+        self._depth += 1
+        try:
+            acc = _Account()
+            args = list(args)
+            while True:
+                env = None
+                for rule in self.funcs[name]:
+                    env = self._match_rule(rule, args)
+                    if env is not None:
+                        break
+                if env is not None:
+                    break
+                # ни одно правило не подошло — вычисляется самый левый отложенный аргумент
+                if not self._force_leftmost(args, acc):
+                    raise CostUnknown(f"no rule of {name} matches")
+            acc.reductions += 1
+            body = self._eval(rule.body, env, acc)
+            result = replace(body, pending=body.pending + acc.reductions,
+                             pending_allocs=body.pending_allocs + acc.allocations)
+        finally:
+            self._depth -= 1
+        self._memo[key] = result
+        return result
+
+    def _match_rule(self, rule: Rule, args: List[Shape]) -> Optional[Dict[str, Shape]]:
+        env: Dict[str, Shape] = {}
+        for p, a in zip(rule.pattern.params, args):
+            if not self._match(p, a, env):
+                return None
+        return env
+
+    def _match(self, pattern: Expr, shape: Shape, env: Dict[str, Shape]) -> bool:
+        """
+        Сопоставление без вычислений, как match в интерпретаторе: переменная образца
+        подходит к отложенному вызову, конструктор — только к вычисленной голове.
+        """
+        match pattern:
+            case Var(name):
+                if name in env and env[name] != shape:
+                    return False
+                env[name] = shape
+                return True
+            case Ctr(name, params) | Pattern(name, params):
+                if shape.pending:
+                    return False
+                shape = self._unfold(shape, name)
+                return (shape.ctr == name and len(shape.args) == len(params)
+                        and all(self._match(p, a, env) for p, a in zip(params, shape.args)))
+            case _:
+                raise CostUnknown(f"unsupported pattern {pattern}")
+
+    def _force_leftmost(self, args: List[Shape], acc: _Account) -> bool:
+        """Оплачивает самый левый отложенный вызов (в том числе внутри конструктора)."""
+        for i, a in enumerate(args):
+            if a.pending:
+                args[i] = acc.pay(a)
+                return True
+            inner = list(a.args)
+            if self._force_leftmost(inner, acc):
+                args[i] = replace(a, args=tuple(inner))
+                return True
+        return False
+
+    def _unfold(self, shape: Shape, ctr: str) -> Shape:
+        """Конструктор значения размера size (тип берется по конструктору образца)."""
+        if shape.ctr is not None:
+            return shape
+        tdef = self.ctr_types.get(ctr)
+        if tdef is None:
+            raise CostUnknown(f"unknown constructor {ctr}")
+        recursive = [c for c in tdef.constructors if any(a.name == tdef.name for a in c.arg_types)]
+        base = [c for c in tdef.constructors if c not in recursive]
+        n = shape.size
+        c = recursive[0] if n > 0 and recursive else base[n % len(base)]
+        return Shape(c.name, tuple(Shape(size=n - 1 if a.name == tdef.name else n) for a in c.arg_types))
+
+    def _normal_form(self, shape: Shape, acc: _Account):
+        """Нормальная форма результата: оплачиваются все отложенные вызовы внутри."""
+        shape = acc.pay(shape)
+        for a in shape.args:
+            self._normal_form(a, acc)
+
+
+# --- Рекуррентности стоимости ---
+
+@dataclass(frozen=True)
+class _Input:
+    """Входное значение размера n{param} + offset (param None — размер offset); конструктор не раскрыт."""
+    param: Optional[int]
+    offset: int = 0
+
+
+@dataclass(frozen=True)
+class _Data:
+    """Вычисленная голова: конструктор и аргументы (любые из _Input, _Data, _Delayed)."""
+    ctr: str
+    args: Tuple = ()
+
+
+@dataclass(frozen=True)
+class _Delayed:
+    """Отложенный вызов: ничего не стоит, пока не нужна голова или нормальная форма."""
+    name: str
+    args: Tuple = ()
+
+
+class _NotDerivable(Exception):
+    """Рекуррентности не выводятся (голова рекурсивного вызова нужна образцу, слишком много шаблонов)."""
+
+
+@dataclass
+class _Case:
+    """
+    Случай рекуррентности: условия на параметры (точное значение, нижняя граница,
+    остатки по модулю) и стоимость — константа плюс стоимости шаблонов из refs
+    (номер шаблона и размеры его параметров через параметры этого случая).
+    """
+    exact: Dict[int, int] = field(default_factory=dict)
+    lo: Dict[int, int] = field(default_factory=dict)
+    residues: Dict[int, Dict[int, int]] = field(default_factory=dict)
+    reductions: int = 0
+    allocations: int = 0
+    refs: List[Tuple[int, Tuple[_Input, ...]]] = field(default_factory=list)
+    unknown: Optional[str] = None       # путь застревает (нет правил, ни одно не подходит)
+
+    def holds(self, values: Tuple[int, ...]) -> bool:
+        return (all(values[p] == v for p, v in self.exact.items())
+                and all(values[p] >= v for p, v in self.lo.items())
+                and all(values[p] % q == r for p, known in self.residues.items() for q, r in known.items()))
+
+
+class _Path:
+    """
+    Один путь вывода. В точке ветвления (раскрыть ли размер в базовый конструктор,
+    какой остаток по модулю) берется записанное решение или первый вариант, а остальные
+    откладываются префиксами решений — путь с таким префиксом проигрывается заново.
+    """
+
+    def __init__(self, decisions: List[int]):
+        self.decisions = decisions
+        self.pos = 0
+        self.branches: List[List[int]] = []
+        self.case = _Case()
+
+    def _choose(self, n: int) -> int:
+        if self.pos == len(self.decisions):
+            self.branches.extend(self.decisions + [i] for i in range(1, n))
+            self.decisions = self.decisions + [0]
+        self.pos += 1
+        return self.decisions[self.pos - 1]
+
+    def resolve(self, term: _Input) -> _Input:
+        if term.param in self.case.exact:
+            return _Input(None, self.case.exact[term.param] + term.offset)
+        return term
+
+    def _fits(self, param: int, value: int) -> bool:
+        return (value >= self.case.lo.get(param, 0)
+                and all(value % q == r for q, r in self.case.residues.get(param, {}).items()))
+
+    def is_zero(self, term: _Input) -> bool:
+        term = self.resolve(term)
+        if term.param is None:
+            return term.offset == 0
+        target = -term.offset
+        options = ([True] if self._fits(term.param, target) else []) + [False]
+        zero = options[self._choose(len(options))]
+        if zero:
+            self.case.exact[term.param] = target
+            self.case.lo.pop(term.param, None)
+            self.case.residues.pop(term.param, None)
+        else:
+            self.case.lo[term.param] = max(self.case.lo.get(term.param, 0), target + 1)
+        return zero
+
+    def residue(self, term: _Input, q: int) -> int:
+        term = self.resolve(term)
+        if term.param is None:
+            return term.offset % q
+        known = self.case.residues.setdefault(term.param, {})
+        if q not in known:
+            period = math.lcm(q, *known)
+            options = [r for r in range(q)
+                       if any(x % q == r and all(x % k == v for k, v in known.items()) for x in range(period))]
+            known[q] = options[self._choose(len(options))]
+        return (known[q] + term.offset) % q
+
+
+class Recurrences:
+    """
+    Стоимость выражения как система рекуррентностей, выведенная один раз по правилам программы.
+
+    Шаблон — отложенный вызов, в котором размеры входов заменены параметрами n0, n1, ...
+    Его нормальная форма стоит по случаям: правило выбирается, как в CostModel, но
+    раскрытие размера ветвит вывод по условию (n0 = 0 или n0 >= 1, остаток n0 по модулю
+    числа конструкторов), а отложенные вызовы тела не исполняются — они становятся
+    ссылками на свои шаблоны с размерами вида n0-1. Голова вызова, которую требует
+    образец, выводится на месте; если для нее снова нужен тот же вызов (голова рекурсивна),
+    рекуррентности не выводятся, и оценку дает CostModel.
+
+    cost() по размерам только считает: ищет случай каждого шаблона и складывает
+    целые числа, запоминая значения шаблонов между вызовами.
+    """
+
+    MAX_TEMPLATES = 256
+    MAX_CASES = 512
+    MAX_DEPTH = 100000
+
+    def __init__(self, program: Program, expr: Expr, names: List[str]):
+        self.funcs: Dict[str, List[Rule]] = {}
+        for r in program.rules:
+            self.funcs.setdefault(r.pattern.name, []).append(r)
+        self.ctr_types: Dict[str, TypeDef] = {c.name: t for t in program.types for c in t.constructors}
+        self.expr = expr
+        self.names = names
+        self.templates: List[_Delayed] = []
+        self.cases: List[List[_Case]] = []
+        self._ids: Dict[_Delayed, int] = {}
+        self._memo: Dict[Tuple[int, Tuple[int, ...]], Tuple[int, int]] = {}
+        try:
+            self.entry = self._derive(self._entry_path)
+            while len(self.cases) < len(self.templates):
+                call = self.templates[len(self.cases)]
+                self.cases.append(self._derive(lambda path: self._template_path(call, path)))
+        except RecursionError:
+            raise _NotDerivable("recursion limit") from None
+
+    def cost(self, sizes: Dict[str, int]) -> Cost:
+        """Стоимость при размерах переменных sizes."""
+        if any(n not in sizes for n in self.names):
+            raise CostUnknown("size of every variable is required")
+        values = tuple(sizes[n] for n in self.names)
+        case = self._case(self.entry, values)
+        reductions, allocations = case.reductions, case.allocations
+        for tid, terms in case.refs:
+            r, a = self._value((tid, _at(terms, values)))
+            reductions, allocations = reductions + r, allocations + a
+        return Cost(reductions, allocations)
+
+    # --- Вывод ---
+
+    def _derive(self, run) -> List[_Case]:
+        cases, todo = [], [[]]
+        while todo:
+            if len(cases) >= self.MAX_CASES:
+                raise _NotDerivable("too many cases")
+            path = _Path(todo.pop())
+            try:
+                run(path)
+            except CostUnknown as e:
+                path.case.unknown = str(e)
+            cases.append(path.case)
+            todo.extend(path.branches)
+        return cases
+
+    def _entry_path(self, path: _Path):
+        """Конструкторы самого выражения — входные данные и не считаются, как в CostModel.estimate."""
+        env = {n: _Input(i) for i, n in enumerate(self.names)}
+        self._normal_form(self._eval(self.expr, env, _Case()), path)
+
+    def _template_path(self, call: _Delayed, path: _Path):
+        env, rule = self._select(call, path, ())
+        path.case.reductions += 1
+        self._normal_form(self._eval(rule.body, env, path.case), path)
+
+    def _eval(self, expr: Expr, env: Dict[str, object], case: _Case):
+        match expr:
+            case Var(name):
+                if name not in env:
+                    raise CostUnknown(f"free variable {name}")
+                return env[name]
+            case Ctr(name, args):
+                case.allocations += 1
+                return _Data(name, tuple(self._eval(a, env, case) for a in args))
+            case FCall(name, args):
+                return _Delayed(name, tuple(self._eval(a, env, case) for a in args))
+            case Let(bindings, body):
+                inner = dict(env)
+                for name, value in bindings:
+                    inner[name] = self._eval(value, env, case)
+                return self._eval(body, inner, case)
+            case IntLit(value):
+                return _Data(str(value))
+            case _:
+                raise CostUnknown(f"unsupported expression {expr}")
+
+    def _normal_form(self, value, path: _Path):
+        """Входы уже данные; отложенный вызов — ссылка на стоимость его шаблона."""
+        match value:
+            case _Data(_, args):
+                for a in args:
+                    self._normal_form(a, path)
+            case _Delayed():
+                path.case.refs.append(self._template(value, path))
+
+    def _template(self, call: _Delayed, path: _Path) -> Tuple[int, Tuple[_Input, ...]]:
+        """Номер шаблона вызова (регистрирует новый) и размеры его параметров."""
+        terms: Dict[_Input, int] = {}
+
+        def slots(v):
+            match v:
+                case _Input():
+                    term = path.resolve(v)
+                    return _Input(terms.setdefault(term, len(terms)))
+                case _Data(ctr, args):
+                    return _Data(ctr, tuple(slots(a) for a in args))
+                case _Delayed(name, args):
+                    return _Delayed(name, tuple(slots(a) for a in args))
+
+        key = slots(self._fold(call, path))
+        if key not in self._ids:
+            if len(self.templates) >= self.MAX_TEMPLATES:
+                raise _NotDerivable("too many templates")
+            self._ids[key] = len(self.templates)
+            self.templates.append(key)
+        return self._ids[key], tuple(terms)
+
+    def _fold(self, value, path: _Path):
+        """
+        Данные, совпадающие с раскрытием входа, — снова вход: [S n0] — это n0+1, [Z] — 0.
+        Иначе накапливающий параметр ((addAcc x [S y])) порождал бы шаблон на каждом шаге.
+        """
+        match value:
+            case _Input():
+                return path.resolve(value)
+            case _Delayed(name, args):
+                return _Delayed(name, tuple(self._fold(a, path) for a in args))
+        args = tuple(self._fold(a, path) for a in value.args)
+        tdef = self.ctr_types.get(value.ctr)
+        if tdef is not None:
+            recursive = [c for c in tdef.constructors if any(a.name == tdef.name for a in c.arg_types)]
+            base = [c for c in tdef.constructors if c not in recursive]
+            ctr = next(c for c in tdef.constructors if c.name == value.ctr)
+            if recursive and ctr is recursive[0]:
+                inner = [a for a, t in zip(args, ctr.arg_types) if t.name == tdef.name]
+                if isinstance(inner[0], _Input):
+                    size = _Input(inner[0].param, inner[0].offset + 1)
+                    if all(a == (inner[0] if t.name == tdef.name else size) for a, t in zip(args, ctr.arg_types)):
+                        return size
+            elif ctr in base and (not recursive or ctr is base[0]):
+                size = _Input(None, base.index(ctr))
+                if all(a == size for a in args):
+                    return size
+        return _Data(value.ctr, args)
+
+    def _select(self, call: _Delayed, path: _Path, forcing: Tuple[str, ...]):
+        """Правило вызова и подстановка, как в CostModel._call; forcing — вызовы, чьи головы выводятся."""
+        if call.name not in self.funcs:
+            raise CostUnknown(f"no rules for {call.name}")
+        args = list(call.args)
+        while True:
+            for rule in self.funcs[call.name]:
+                env = self._match_rule(rule, args, path)
+                if env is not None:
+                    return env, rule
+            if not self._force_leftmost(args, path, forcing):
+                raise CostUnknown(f"no rule of {call.name} matches")
+
+    def _match_rule(self, rule: Rule, args: List[object], path: _Path) -> Optional[Dict[str, object]]:
+        env: Dict[str, object] = {}
+        for p, a in zip(rule.pattern.params, args):
+            if not self._match(p, a, env, path):
+                return None
+        return env
+
+    def _match(self, pattern: Expr, value, env: Dict[str, object], path: _Path) -> bool:
+        match pattern:
+            case Var(name):
+                if name in env:
+                    raise _NotDerivable(f"non-linear pattern on {name}")
+                env[name] = value
+                return True
+            case Ctr(name, params) | Pattern(name, params):
+                if isinstance(value, _Delayed):
+                    return False
+                if isinstance(value, _Input):
+                    value = self._unfold(value, name, path)
+                return (value.ctr == name and len(value.args) == len(params)
+                        and all(self._match(p, a, env, path) for p, a in zip(params, value.args)))
+            case _:
+                raise CostUnknown(f"unsupported pattern {pattern}")
+
+    def _force_leftmost(self, args: List[object], path: _Path, forcing: Tuple[str, ...]) -> bool:
+        for i, a in enumerate(args):
+            if isinstance(a, _Delayed):
+                args[i] = self._head(a, path, forcing)
+                return True
+            if isinstance(a, _Data):
+                inner = list(a.args)
+                if self._force_leftmost(inner, path, forcing):
+                    args[i] = _Data(a.ctr, tuple(inner))
+                    return True
+        return False
+
+    def _head(self, value, path: _Path, forcing: Tuple[str, ...]):
+        """Голова отложенного вызова; ее стоимость идет в текущий случай."""
+        while isinstance(value, _Delayed):
+            if value.name in forcing:
+                raise _NotDerivable(f"head of {value.name} is recursive")
+            forcing = forcing + (value.name,)
+            env, rule = self._select(value, path, forcing)
+            path.case.reductions += 1
+            value = self._eval(rule.body, env, path.case)
+        return value
+
+    def _unfold(self, value: _Input, ctr: str, path: _Path) -> _Data:
+        """Как CostModel._unfold, но размер — терм: выбор конструктора ветвит путь."""
+        tdef = self.ctr_types.get(ctr)
+        if tdef is None:
+            raise CostUnknown(f"unknown constructor {ctr}")
+        recursive = [c for c in tdef.constructors if any(a.name == tdef.name for a in c.arg_types)]
+        base = [c for c in tdef.constructors if c not in recursive]
+        if not base:
+            raise CostUnknown(f"type {tdef.name} has no base constructor")
+        if recursive:
+            c = base[0] if path.is_zero(value) else recursive[0]
+        else:
+            c = base[path.residue(value, len(base))]
+        return _Data(c.name, tuple(_Input(value.param, value.offset - 1) if a.name == tdef.name else value
+                                   for a in c.arg_types))
+
+    # --- Счет ---
+
+    def _case(self, cases: List[_Case], values: Tuple[int, ...]) -> _Case:
+        case = next((c for c in cases if c.holds(values)), None)
+        if case is None or case.unknown is not None:
+            raise CostUnknown(case.unknown if case else "no case holds")
+        return case
+
+    def _value(self, key: Tuple[int, Tuple[int, ...]]) -> Tuple[int, int]:
+        """Стоимость шаблона при размерах параметров; без рекурсии Python, с памятью."""
+        stack, active = [key], set()
+        while stack:
+            top = stack[-1]
+            if top in self._memo:
+                stack.pop()
+                continue
+            tid, values = top
+            case = self._case(self.cases[tid], values)
+            deps = [(r, _at(terms, values)) for r, terms in case.refs]
+            missing = [d for d in deps if d not in self._memo]
+            if missing:
+                if len(stack) > self.MAX_DEPTH:
+                    raise CostUnknown(f"recursion deeper than {self.MAX_DEPTH}")
+                if top in active or any(d in active for d in missing):
+                    raise CostUnknown(f"{self._show(self.templates[tid])} does not terminate")
+                active.add(top)
+                stack.extend(missing)
+                continue
+            active.discard(top)
+            self._memo[top] = (case.reductions + sum(self._memo[d][0] for d in deps),
+                               case.allocations + sum(self._memo[d][1] for d in deps))
+            stack.pop()
+        return self._memo[key]
+
+    # --- Печать ---
+
+    def __str__(self):
+        lines = [f"{self.expr} = {self._show_cases(self.entry, self.names)}"]
+        params = lambda call: [f"n{i}" for i in range(_arity(call))]
+        lines += [f"{self._show(t, params(t))} = {self._show_cases(c, params(t))}"
+                  for t, c in zip(self.templates, self.cases)]
+        return "\n".join(lines)
+
+    def _show_cases(self, cases: List[_Case], params: List[str]) -> str:
+        shown = []
+        for c in cases:
+            if c.unknown is not None:
+                text = "?"
+            else:
+                text = " + ".join([f"{c.reductions}/{c.allocations}"]
+                                  + [self._show(self.templates[tid], [_show_term(t, params) for t in terms])
+                                     for tid, terms in c.refs])
+            conds = ([f"{params[p]}={v}" for p, v in c.exact.items()]
+                     + [f"{params[p]}>={v}" for p, v in c.lo.items()]
+                     + [f"{params[p]}%{q}={r}" for p, known in c.residues.items() for q, r in known.items()])
+            shown.append(f"{text} if {', '.join(conds)}" if conds else text)
+        return " | ".join(shown)
+
+    def _show(self, value, params: Optional[List[str]] = None) -> str:
+        match value:
+            case _Input():
+                return _show_term(value, params)
+            case _Data(ctr, args):
+                return f"[{' '.join([ctr] + [self._show(a, params) for a in args])}]"
+            case _Delayed(name, args):
+                return f"({' '.join([name] + [self._show(a, params) for a in args])})"
+
+
+def _at(terms: Tuple[_Input, ...], values: Tuple[int, ...]) -> Tuple[int, ...]:
+    return tuple(t.offset if t.param is None else values[t.param] + t.offset for t in terms)
+
+
+def _arity(value) -> int:
+    match value:
+        case _Input(param, _):
+            return param + 1
+        case _Data(_, args) | _Delayed(_, args):
+            return max((_arity(a) for a in args), default=0)
+    return 0
+
+
+def _show_term(term: _Input, params: Optional[List[str]]) -> str:
+    if term.param is None:
+        return str(term.offset)
+    name = params[term.param] if params else f"n{term.param}"
+    return f"{name}{term.offset:+d}" if term.offset else name
+
+
+def recurrences(program: Program, expr: Expr, names: List[str]) -> Optional[Recurrences]:
+    """Рекуррентности стоимости expr от размеров переменных names; None — не выводятся."""
+    try:
+        return Recurrences(program, expr, names)
+    except _NotDerivable:
+        return None
+
+
+def estimate(program: Program, expr: Expr, sizes: Dict[str, int]) -> Optional[Cost]:
+    """Оценка стоимости expr в program при размерах переменных sizes; None — не оценивается."""
+    rec = recurrences(program, expr, list(sizes))
+    try:
+        return rec.cost(sizes) if rec is not None else CostModel(program).estimate(expr, sizes)
+    except CostUnknown:
+        return None
+
+
+def cost_table(program: Program, expr: Expr, sizes: List[int],
+               names: Optional[List[str]] = None) -> List[Optional[Cost]]:
+    """
+    Оценки для каждого размера из sizes (все переменные expr — этого размера).
+    Рекуррентности выводятся один раз на таблицу; если не выводятся — оценивает одна
+    CostModel на всю таблицу, вызовы меньших размеров переиспользуются.
+    """
+    names = names if names is not None else [v.name for v in Residualizer(None)._get_vars(expr)]
+    rec = recurrences(program, expr, names)
+    model = CostModel(program) if rec is None else None
+    table = []
+    for n in sizes:
+        env = {name: n for name in names}
+        try:
+            table.append(rec.cost(env) if rec is not None else model.estimate(expr, env))
+        except CostUnknown:
+            table.append(None)
+    return table
+
+
+def residual_call(program: Program, names: List[str]) -> Optional[FCall]:
+    """Вызов точки входа остаточной программы от исходных переменных (в порядке вхождения)."""
+    entry = entry_name(program)
+    return FCall(entry, [Var(n) for n in names]) if entry is not None else None
+
+
+def sample_value(t: TypeExpr, types, size: int):
+    """
+    Значение типа t размера size: size раз рекурсивный конструктор, затем базовый.
+    У нерекурсивных типов (Bool, Letter) — конструктор номер size по кругу.
+    """
+    tdef = next(d for d in types if d.name == t.name)
+    params = dict(zip(tdef.params, t.params))
+    recursive = [c for c in tdef.constructors if any(a.name == t.name for a in c.arg_types)]
+    base = [c for c in tdef.constructors if c not in recursive]
+
+    def build(k: int):
+        c = recursive[0] if k > 0 and recursive else base[k % len(base)]
+        args = []
+        for a in c.arg_types:
+            if a.name == t.name:
+                args.append(build(k - 1))
+            else:
+                args.append(sample_value(params.get(a.name, a), types, k))
+        return Ctr(c.name, args)
+
+    return build(size)
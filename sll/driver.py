@@ -4,7 +4,9 @@ from typing import List, Optional, Tuple, Dict
 from sll.ast_nodes import Expr, Var, Ctr, FCall, Program, Pattern, IntLit, TypeExpr, Let
 from sll.matching import match as match_term, substitute, \
     MatchSuccess, MatchNarrowing, MatchFail
-from sll.process_tree import Contraction
+from sll.process_tree import Contraction, ContextFrame, Context, plug
+from sll.trace import Tracer, TRACE
+from sll.stats import Stats
 
 
 def _instantiate_type(type_expr: TypeExpr, subst: dict) -> TypeExpr:
@@ -52,8 +54,10 @@ class LetStep(DriveStep):
 
 @dataclass
 class TransientStep(DriveStep):
-    next_expr: Expr
+    next_expr: Optional[Expr]
     rule_pat: Optional[Pattern] = None
+    # Шаг в фокусе вложенного вызова: новый фокус и контекст, next_expr тогда None
+    context: Optional[Context] = None
 
 
 @dataclass
@@ -65,6 +69,8 @@ class DecomposeStep(DriveStep):
 class VariantStep(DriveStep):
     # Возвращаем не только выражение ветки, но и новые типы для нее
     branches: List[Tuple[Expr, Contraction, Dict[str, TypeExpr], Optional[Pattern]]]
+    # Шаг в фокусе вложенного вызова: фокус и контекст каждой ветки (параллельно branches)
+    contexts: Optional[List[Context]] = None
 
 
 @dataclass
@@ -72,26 +78,77 @@ class StopStep(DriveStep):
     pass
 
 
+@dataclass
+class DriveTemplate:
+    """
+    Заготовка шага прогонки для вызова (f x1 ... xn), где все аргументы —
+    попарно различные переменные известных типов.
+    Шаг вычисляется один раз для переменных-заготовок params,
+    а для конкретного вызова только переименовывается.
+
+    params — имена переменных-заготовок (по одной на аргумент)
+    step   — шаг прогонки для (f params...): ветки, сужения, типы свежих
+             переменных и решение о лишней default-ветке уже учтены
+    fresh  — свежие переменные, выданные при вычислении шага (в порядке выдачи)
+    """
+    params: List[str]
+    step: DriveStep
+    fresh: List[str]
+
+
+# --- Контекст вычисления ---
+# Вложенный вызов раскладывается на фокус (редекс) и кадры от внешнего вызова
+# к фокусу (ContextFrame, Context в process_tree). Контекст хранится на узле
+# между шагами: шаг в фокусе не пересобирает и не обходит внешний вызов.
+
+def _narrow(frames: Tuple[ContextFrame, ...], focus: Expr, narrowings: Dict[str, Expr]) -> Context:
+    """Сужение конфигурации: подстановка в фокус и в аргументы кадров вне пути к фокусу."""
+    new_frames = []
+    for frame in frames:
+        call = frame.call
+        args = [arg if i == frame.arg_index else substitute(arg, narrowings) for i, arg in enumerate(call.args)]
+        new_frames.append(ContextFrame(FCall(call.name, args, lineno=call.lineno, tag=call.tag), frame.arg_index))
+    return Context(tuple(new_frames), substitute(focus, narrowings))
+
+
 # --- Драйвер ---
 
 class Driver:
     def __init__(self, program: Program):
         self.program = program
         self.name_gen = NameGen()
+        self.tracer = Tracer()
+        self.stats = Stats()
 
         # Словарь: Имя типа -> Определение (TypeDef)
         # Пример: 'List' -> TypeDef(name='List', constructors=[...])
         self.type_map = {t.name: t for t in program.types}
 
-    def drive(self, expr: Expr, var_types: Dict[str, TypeExpr]) -> DriveStep:
+        # Кэш заготовок: (имя функции, типы аргументов) -> DriveTemplate
+        self.templates: Dict[Tuple[str, Tuple[str, ...]], DriveTemplate] = {}
+
+    def drive(self, expr: Optional[Expr], var_types: Dict[str, TypeExpr],
+              context: Optional[Context] = None) -> DriveStep:
         """
         Главная функция.
         Принимает выражение И известные типы переменных (var_types).
+        context — фокус и контекст, оставленные прошлым шагом во вложенном вызове
+        (TransientStep.context, VariantStep.contexts): тогда expr не нужен,
+        и поиск редекса продолжается от фокуса, а не от внешнего вызова.
         """
+        if context is not None:
+            step = self._drive_in_context(context, var_types)
+        else:
+            step = self._drive_expr(expr, var_types)
+        self.stats.count(f"drive.{type(step).__name__}")
+        return step
+
+    def _drive_expr(self, expr: Expr, var_types: Dict[str, TypeExpr]) -> DriveStep:
         match expr:
             # 0. Let узлы
             case Let(bindings, body):
-                print("[DRIVE] LET matched")
+                if self.tracer.trace:
+                    self.tracer.emit(TRACE, "let", expr=expr)
                 parts = [val for (_, val) in bindings] + [body]
                 return DecomposeStep(parts=parts)
 
@@ -260,11 +317,112 @@ class Driver:
 
         return covered >= all_ctrs
 
+    def _template_key(self, expr: FCall, var_types: Dict[str, TypeExpr]) -> Optional[Tuple[str, Tuple[str, ...]]]:
+        """
+        Ключ заготовки для вызова, если все аргументы — различные типизированные
+        переменные. Иначе None (аргументы частично известны).
+        """
+        names = set()
+        for arg in expr.args:
+            if not isinstance(arg, Var) or arg.name in names or arg.name not in var_types:
+                return None
+            names.add(arg.name)
+        return expr.name, tuple(str(var_types[arg.name]) for arg in expr.args)
+
+    def _build_template(self, expr: FCall, var_types: Dict[str, TypeExpr]) -> DriveTemplate:
+        """Прогоняет (f %0 ... %n) на отдельном генераторе имён и запоминает результат."""
+        params = [f"%{i}" for i in range(len(expr.args))]
+        template_types = {p: var_types[arg.name] for p, arg in zip(params, expr.args)}
+
+        saved_gen = self.name_gen
+        self.name_gen = NameGen()
+        try:
+            step = self._drive_rules(FCall(expr.name, [Var(p) for p in params]), template_types)
+            issued = self.name_gen.counter
+        finally:
+            self.name_gen = saved_gen
+
+        replay = NameGen()
+        fresh = [replay.fresh_var() for _ in range(issued)]
+        return DriveTemplate(params=params, step=step, fresh=fresh)
+
+    def _instantiate_template(self, template: DriveTemplate, expr: FCall,
+                              var_types: Dict[str, TypeExpr]) -> DriveStep:
+        """
+        Переименовывает заготовку под конкретный вызов:
+        заготовки -> аргументы вызова, свежие переменные заготовки -> новые свежие.
+        """
+        # В телах правил стоят сами аргументы вызова (как при обычной прогонке),
+        # в сужениях — новые Var без тегов.
+        body_ren: Dict[str, Expr] = {}
+        narrow_ren: Dict[str, Expr] = {}
+        names: Dict[str, str] = {}
+        for p, arg in zip(template.params, expr.args):
+            body_ren[p] = arg
+            narrow_ren[p] = Var(arg.name)
+            names[p] = arg.name
+        for old in template.fresh:
+            new = self.name_gen.fresh_var()
+            body_ren[old] = narrow_ren[old] = Var(new)
+            names[old] = new
+
+        match template.step:
+            case TransientStep(next_expr, rule_pat):
+                return TransientStep(next_expr=substitute(next_expr, body_ren), rule_pat=rule_pat)
+
+            case VariantStep(branches):
+                new_branches = []
+                for body, contraction, branch_types, applied_pat in branches:
+                    new_types = var_types.copy()
+                    for v_name, t in branch_types.items():
+                        if v_name in names and v_name not in template.params:
+                            new_types[names[v_name]] = t
+
+                    if contraction.narrowings is not None:
+                        narrowings = {names[k]: substitute(v, narrow_ren)
+                                      for k, v in contraction.narrowings.items()}
+                        new_contraction = Contraction(var_name="", pattern=None, narrowings=narrowings)
+                    else:
+                        new_contraction = Contraction(var_name="", pattern=None, is_default=contraction.is_default)
+
+                    new_branches.append((substitute(body, body_ren), new_contraction, new_types, applied_pat))
+                return VariantStep(branches=new_branches)
+
+            case _:
+                return StopStep()
+
     def _drive_call(self, expr: FCall, var_types: Dict[str, TypeExpr]) -> DriveStep:
+        """
+        Прогонка вызова функции.
+        Вызов с переменными-аргументами (обычный случай после обобщения)
+        берётся из кэша заготовок, остальные прогоняются полностью.
+        """
+        key = self._template_key(expr, var_types)
+        if key is None:
+            return self._drive_rules(expr, var_types)
+
+        template = self.templates.get(key)
+        if template is None:
+            self.stats.count("templates.miss")
+            template = self._build_template(expr, var_types)
+            self.templates[key] = template
+        else:
+            self.stats.count("templates.hit")
+        return self._instantiate_template(template, expr, var_types)
+
+    def _drive_rules(self, expr: FCall, var_types: Dict[str, TypeExpr]) -> DriveStep:
+        """Полная прогонка вызова: по правилам, иначе — во вложенном вызове."""
+        step = self._rule_step(expr, var_types)
+        if step is None:
+            return self._drive_nested(expr, var_types)
+        return step
+
+    def _rule_step(self, expr: FCall, var_types: Dict[str, TypeExpr]) -> Optional[DriveStep]:
         """
         Rule-Based Driving для вызова функции.
         Использует полное сужение (full narrowing) по каждому правилу:
         одна ветка = одно правило = все нужные сужения сразу.
+        Возвращает None, если шаг надо делать во вложенном вызове.
         """
         rules = [r for r in self.program.rules if r.pattern.name == expr.name]
 
@@ -272,7 +430,7 @@ class Driver:
         for rule in rules:
             for i, p in enumerate(rule.pattern.params):
                 if not isinstance(p, Var) and i < len(expr.args) and isinstance(expr.args[i], FCall):
-                    return self._drive_nested(expr, var_types)
+                    return None
 
         branches = []
         seen_keys: List[str] = []   # дедупликация веток
@@ -325,7 +483,7 @@ class Driver:
         if branches:
             return VariantStep(branches=branches)
 
-        return self._drive_nested(expr, var_types)
+        return None
 
     def _create_branch(self, expr: FCall, var_name: str, constr_name: str, var_types: Dict[str, TypeExpr]) -> Optional[
         Tuple[Expr, Contraction, Dict[str, TypeExpr], Optional[Pattern]]]:
@@ -378,38 +536,147 @@ class Driver:
         return final_expr, contraction, new_branch_types, None
 
 
+    def _local_step(self, expr: FCall, var_types: Dict[str, TypeExpr]) -> Optional[DriveStep]:
+        """Шаг прогонки в самом вызове expr (без захода во вложенные вызовы) или None."""
+        if self._template_key(expr, var_types) is None:
+            return self._rule_step(expr, var_types)
+        step = self._drive_call(expr, var_types)
+        return None if isinstance(step, StopStep) else step
+
+    def _find_redex(self, expr: FCall, var_types: Dict[str, TypeExpr]
+                    ) -> Optional[Tuple[List[ContextFrame], Expr, DriveStep]]:
+        """
+        Ищет редекс во вложенных вызовах expr слева направо (в глубину).
+        Возвращает контекст (кадры от внешнего вызова к фокусу), фокус и шаг в фокусе.
+        """
+        return self._search([expr], [0], [], var_types)
+
+    def _search(self, calls: List[FCall], positions: List[int], frames: List[ContextFrame],
+                var_types: Dict[str, TypeExpr]) -> Optional[Tuple[List[ContextFrame], Expr, DriveStep]]:
+        """
+        Обход в глубину из состояния: calls — вызовы на пути, positions — следующий
+        аргумент каждого, frames — кадры вызовов выше последнего.
+        Если вложенный вызов не продвигается, пробуем следующий аргумент.
+        Кадры могут держать аргумент пути от прошлых шагов — при возврате к внешнему
+        вызову он пересобирается с актуальным вложенным.
+        """
+        while calls:
+            call = calls[-1]
+            i = positions[-1]
+            while i < len(call.args) and not isinstance(call.args[i], FCall):
+                i += 1
+
+            if i == len(call.args):
+                # В этом вызове редекса нет — возвращаемся к внешнему
+                calls.pop()
+                positions.pop()
+                if frames:
+                    frames.pop()
+                if calls and calls[-1].args[positions[-1] - 1] is not call:
+                    calls[-1] = plug([ContextFrame(calls[-1], positions[-1] - 1)], call)
+                continue
+
+            positions[-1] = i + 1
+            arg = call.args[i]
+            frames.append(ContextFrame(call, i))
+
+            step = self._local_step(arg, var_types)
+            if step is not None:
+                return frames, arg, step
+
+            calls.append(arg)
+            positions.append(0)
+
+        return None
+
     def _drive_nested(self, expr: FCall, var_types: Dict[str, TypeExpr]) -> DriveStep:
-        for i, arg in enumerate(expr.args):
-            if isinstance(arg, FCall):
-                inner_step = self.drive(arg, var_types)
-
-                match inner_step:
-                    case TransientStep(next_expr=nested_next):
-                        new_args = list(expr.args)
-                        new_args[i] = nested_next
-                        return TransientStep(FCall(expr.name, new_args, lineno=expr.lineno, tag=expr.tag))
-
-                    case VariantStep(branches):
-                        new_branches = []
-                        for branch_expr, contraction, branch_var_types, applied_pat in branches:
-
-                            if contraction.narrowings is not None:
-                                # Полное сужение: применяем все сужения к внешнему выражению
-                                global_branch_expr = substitute(expr, contraction.narrowings)
-                            elif contraction.is_default:
-                                # Catch-all: заменяем внутренний FCall его результатом
-                                new_args = list(expr.args)
-                                new_args[i] = branch_expr
-                                global_branch_expr = FCall(expr.name, new_args,
-                                                           lineno=expr.lineno, tag=expr.tag)
-                            else:
-                                # Одиночное сужение (обратная совместимость)
-                                v_name = contraction.var_name
-                                pat = contraction.pattern
-                                constr_expr = Ctr(pat.name, pat.params)
-                                global_branch_expr = substitute(expr, {v_name: constr_expr})
-
-                            new_branches.append((global_branch_expr, contraction, branch_var_types, applied_pat))
-
-                        return VariantStep(branches=new_branches)
+        """
+        Прогонка вложенного вызова: шаг делается только в фокусе,
+        конфигурация дальше хранится как фокус и контекст.
+        """
+        found = self._find_redex(expr, var_types)
+        if found is None:
+            return StopStep()
+        return self._focus_step(*found)
+
+    def _drive_in_context(self, context: Context, var_types: Dict[str, TypeExpr]) -> DriveStep:
+        """
+        Продолжает поиск редекса от фокуса прошлого шага. Левее фокуса редексов
+        уже нет, поэтому проверяем вызов над фокусом, затем сам фокус и вглубь,
+        затем аргументы правее — остальные кадры не трогаем.
+        """
+        frames = list(context.frames)
+        parent = frames.pop()
+        call = plug([parent], context.focus)
+
+        step = self._local_step(call, var_types)
+        if step is not None:
+            # Редекс — вызов над фокусом; для внешнего вызова это обычный шаг
+            return self._focus_step(frames, call, step) if frames else step
+
+        calls = [frame.call for frame in frames] + [call]
+        positions = [frame.arg_index + 1 for frame in frames] + [parent.arg_index]
+        found = self._search(calls, positions, frames, var_types)
+        if found is None:
+            return StopStep()
+        return self._focus_step(*found)
+
+    def _focus_step(self, frames: List[ContextFrame], focus: FCall, inner_step: DriveStep) -> DriveStep:
+        """Шаг в фокусе как шаг конфигурации: выражения веток собираются по контексту."""
+        frames = tuple(frames)
+
+        match inner_step:
+            case TransientStep(next_expr=focus_next):
+                return TransientStep(None, context=Context(frames, focus_next))
+
+            case VariantStep(branches):
+                new_branches = []
+                contexts = []
+                for branch_expr, contraction, branch_var_types, applied_pat in branches:
+
+                    if contraction.narrowings is not None:
+                        # Полное сужение: применяем все сужения к кадрам и фокусу
+                        context = _narrow(frames, focus, contraction.narrowings)
+                    elif contraction.is_default:
+                        # Catch-all: заменяем фокус его результатом
+                        context = Context(frames, branch_expr)
+                    else:
+                        # Одиночное сужение (обратная совместимость)
+                        pat = contraction.pattern
+                        context = _narrow(frames, focus, {contraction.var_name: Ctr(pat.name, pat.params)})
+
+                    new_branches.append((plug(context.frames, context.focus), contraction,
+                                         branch_var_types, applied_pat))
+                    contexts.append(context)
+
+                return VariantStep(branches=new_branches, contexts=contexts)
+
+        return StopStep()
+        frames, inner_step = found
+
+        match inner_step:
+            case TransientStep(next_expr=focus_next):
+                return TransientStep(plug(frames, focus_next))
+
+            case VariantStep(branches):
+                new_branches = []
+                for branch_expr, contraction, branch_var_types, applied_pat in branches:
+
+                    if contraction.narrowings is not None:
+                        # Полное сужение: применяем все сужения к внешнему выражению
+                        global_branch_expr = substitute(expr, contraction.narrowings)
+                    elif contraction.is_default:
+                        # Catch-all: заменяем фокус его результатом
+                        global_branch_expr = plug(frames, branch_expr)
+                    else:
+                        # Одиночное сужение (обратная совместимость)
+                        v_name = contraction.var_name
+                        pat = contraction.pattern
+                        constr_expr = Ctr(pat.name, pat.params)
+                        global_branch_expr = substitute(expr, {v_name: constr_expr})
+
+                    new_branches.append((global_branch_expr, contraction, branch_var_types, applied_pat))
+
+                return VariantStep(branches=new_branches)
+
         return StopStep()
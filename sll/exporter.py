@@ -49,7 +49,8 @@ def to_dot(root: Node, dev_mode=False, start_expr=None) -> str:
     ]
 
     # Карта: Объект Node -> Уникальный ID (строка "n1", "n2"...)
-    # Используем id() объекта, чтобы различать узлы
+    # Ключ — сам узел: Node сравнивается по идентичности,
+    # SharedNode (узлы разделяемых поддеревьев) — по (корень, представитель)
     node_ids = {}
     counter = 0
     aux_counter = 0
@@ -59,7 +60,7 @@ def to_dot(root: Node, dev_mode=False, start_expr=None) -> str:
     processed = set()
 
     # Присваиваем ID корню
-    node_ids[id(root)] = f"n{counter}"
+    node_ids[root] = f"n{counter}"
     counter += 1
 
     # --- Стартовый узел ---
@@ -74,7 +75,7 @@ def to_dot(root: Node, dev_mode=False, start_expr=None) -> str:
             f'fillcolor="lightgreen", color="darkgreen", penwidth=2.0];'
         )
 
-    root_uid = node_ids[id(root)]
+    root_uid = node_ids[root]
     if has_start and has_root_gen:
         # Информация об обобщении — подпись на стрелке, без отдельного ромба
         a = to_tagged_str(root.gen_alpha) if root.gen_alpha else "?"
@@ -86,17 +87,20 @@ def to_dot(root: Node, dev_mode=False, start_expr=None) -> str:
 
     while queue:
         node = queue.pop(0)
-        uid = node_ids[id(node)]
+        uid = node_ids[node]
 
-        if id(node) in processed:
+        if node in processed:
             continue
-        processed.add(id(node))
+        processed.add(node)
 
         is_ref = getattr(node, 'is_basis_ref', False)
 
         style_attr = ""
         if is_ref:
             style_attr = ', style="filled", fillcolor="lightcyan", color="blue", penwidth=2.0'
+        elif getattr(node, 'stopped', False):
+            # Не прогнан: исчерпан бюджет
+            style_attr = ', style="filled,dashed", fillcolor="lightgray", color="gray40"'
         elif isinstance(node.expr, Let):
             # Let-узлы подсвечиваем как в книжке
             style_attr = ', style="filled", fillcolor="lightyellow", color="orange", penwidth=2.0'
@@ -114,20 +118,28 @@ def to_dot(root: Node, dev_mode=False, start_expr=None) -> str:
 
         # 2. Ссылка назад (Folding)
         if node.back_link:
-            target_id = node_ids.get(id(node.back_link))
-            if target_id:
+            target = node.back_link
+            if target not in node_ids:
+                # Глобальная свертка: цель может лежать в ещё не обойденной ветке
+                node_ids[target] = f"n{counter}"
+                counter += 1
+                queue.append(target)
+            target_id = node_ids[target]
+            if any(a == target for a in node.ancestors()):
                 lines.append(f'    {uid} -> {target_id} [style=dashed, color=red, label="Folding"];')
+            else:
+                lines.append(f'    {uid} -> {target_id} [style=dashed, color=purple, label="Sharing"];')
             continue
 
         # 3. Дети
         for child in node.children:
             # Присваиваем ID ребенку, если еще нет
-            if id(child) not in node_ids:
-                node_ids[id(child)] = f"n{counter}"
+            if child not in node_ids:
+                node_ids[child] = f"n{counter}"
                 counter += 1
                 queue.append(child)
 
-            child_id = node_ids[id(child)]
+            child_id = node_ids[child]
 
             # Подпись на ребре (если это ветвление или обобщение)
             edge_label = ""
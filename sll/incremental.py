@@ -0,0 +1,285 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sll.ast_nodes import Program, Rule, Pattern, Expr, Var, Ctr, FCall, Let
+from sll.process_tree import Node
+from sll.residualizer import Residualizer, _original_rename
+from sll.stats import Stats
+from sll.stream import TreeEvent, CLOSED, GENERALIZED, DONE
+
+# Поэтапная резидуализация по событиям Supercompiler.iter_build.
+#
+# Когда поддерево закрывается (CLOSED), для него сразу строятся правила функций
+# его узлов и выражение, которым оно войдет в правило предка; после этого дети
+# узла отрезаются, и законченная часть дерева не держится в памяти до конца постройки.
+# Имена f/g/k в остаточной программе идут в порядке обхода всего дерева, поэтому
+# в правилах поддерева стоят временные имена (@N), а настоящие раздаются в конце
+# (DONE) коротким проходом по записанным правилам — программа та же, что у Residualizer.
+# Обобщение TOP может выбросить уже закрытое поддерево: его записи тогда просто забываются.
+#
+# Работает для build_tree (TOP) без глобальной свертки. Гиперцикл сшивает деревья
+# только при сборке леса, поэтому там (и с глобальной сверткой) программа строится
+# обычным Residualizer по событию DONE.
+
+
+class _Unsafe(Exception):
+    """Результат поддерева зависит от функций, зарегистрированных позже."""
+
+
+class _Fragment:
+    """Скомпилированное закрытое поддерево."""
+    __slots__ = ("seq", "expr", "events", "owned")
+
+    def __init__(self, seq: List[Node], expr: Expr, events: list, owned: List[Node]):
+        self.seq = seq          # вызовы _register_func при обходе поддерева, по порядку
+        self.expr = expr        # _transform корня поддерева
+        self.events = events    # k-функции и исходные вызовы, встреченные в _transform
+        self.owned = owned      # узлы-функции внутри поддерева (их правила в _defs)
+
+
+class IncrementalResidualizer(Residualizer):
+    """
+    Потребитель событий iter_build: ir = IncrementalResidualizer(sc, program);
+    for e in sc.iter_build(...): ir(e). После DONE готовая программа — ir.program.
+    """
+
+    def __init__(self, sc, original_program=None, stats: Stats = None):
+        super().__init__(None, original_program, stats if stats is not None else sc.stats)
+        self.sc = sc
+        self.program: Optional[Program] = None
+        names = [r.pattern.name for r in sc.program.rules]
+        # имя исходной функции вида f1 совпало бы с именем остаточной (см. _rewrite_expr)
+        self.enabled = (sc.gen_type == "TOP" and not sc.global_folding
+                        and not any(re.fullmatch(r"[fgk]\d+", n) for n in names))
+        self._fragments: Dict[Node, _Fragment] = {}
+        self._unsafe: set = set()
+        self._defs: Dict[Node, list] = {}                        # узел -> записанное определение
+        self._sigs: Dict[Node, Tuple[str, List[Var], bool]] = {}  # узел -> (временное имя, параметры, g?)
+        self._k_names: Dict[str, str] = {}                       # ключ let -> временное имя
+        self._k_templates: Dict[str, tuple] = {}                 # ключ let -> (параметры, тело)
+        self._real: Dict[str, str] = {}                          # временное имя -> настоящее
+        self._compiling = False
+        self._recording: list = []
+        self._seq: List[Node] = []
+        self._added: List[Node] = []
+        self._live: set = set()
+        self._tmp_count = 0
+
+    def __call__(self, event: TreeEvent):
+        if event.kind == DONE:
+            self.root = event.node
+            if not self.enabled:
+                self.program = Residualizer(self.root, self.original_program, self.stats).residualize()
+            else:
+                self.program = self.residualize()
+        elif not self.enabled:
+            return
+        elif event.kind == CLOSED:
+            if event.node is not self.sc.tree:     # корень разбирается при сборке
+                with self.stats.timer("residualize"):
+                    self._compile(event.node)
+        elif event.kind == GENERALIZED:
+            self._forget(event.node)
+
+    # --- Закрытые поддеревья ---
+
+    def _compile(self, c: Node):
+        self.root = self.sc.tree
+        if any(ch in self._unsafe for ch in c.children):
+            self._unsafe.difference_update(c.children)
+            self._unsafe.add(c)
+            return
+        self._live = live = self._live_nodes(c)
+        self._compiling = True
+        self._added = []
+        try:
+            self._seq = seq = []
+            self._find_functions(c)
+            for n in seq:
+                if n in live and n not in self._defs:
+                    self.rules = self._recording = []
+                    self._generate_definition(n)
+                    self._defs[n] = self._recording
+            self._recording = events = []
+            expr = self._transform(c)
+        except _Unsafe:
+            for n in self._added:
+                self.node_to_sig.pop(n, None)
+                self._sigs.pop(n, None)
+                self._defs.pop(n, None)
+            self._unsafe.add(c)
+            return
+        finally:
+            self._compiling = False
+            self._live = set()
+            self.rules = []
+
+        owned = [n for n in live if n in self._defs]
+        for ch in c.children:
+            frag = self._fragments.pop(ch, None)
+            if frag is not None:
+                owned.extend(frag.owned)
+        self._fragments[c] = _Fragment(seq, expr, events, owned)
+        self.stats.count("residual.fragments")
+
+        # Законченная часть больше не нужна: остаются c и узлы-функции (их выражения)
+        for n in live:
+            self.stopped_folds.pop(n, None)
+            if n is c or n in self._defs:
+                if n is not c:
+                    n.parent = None
+                n.children = []
+                n.var_types = {}
+                n.release()
+
+    def _live_nodes(self, c: Node) -> set:
+        """Узлы поддерева c, кроме уже скомпилированных частей (их корни включены)."""
+        result = set()
+        stack = [c]
+        while stack:
+            n = stack.pop()
+            result.add(n)
+            if n is c or n not in self._fragments:
+                stack.extend(n.children)
+        return result
+
+    def _forget(self, node: Node):
+        """
+        Узел обобщен: его подпись устарела, а в TOP выброшено его поддерево —
+        забываем скомпилированные части, которые больше не висят в дереве.
+        """
+        self._sigs.pop(node, None)
+        self.node_to_sig.pop(node, None)
+        for c in [c for c in self._fragments if _detached(c)]:
+            for n in self._fragments.pop(c).owned:
+                self._defs.pop(n, None)
+                self._sigs.pop(n, None)
+                self.node_to_sig.pop(n, None)
+        self._unsafe = {c for c in self._unsafe if not _detached(c)}
+
+    # --- Переопределения Residualizer ---
+
+    def _find_functions(self, node: Node):
+        frag = self._fragments.get(node)
+        if frag is None:
+            return super()._find_functions(node)
+        for n in frag.seq:
+            self._register_func(n)
+
+    def _register_func(self, node: Node):
+        if self._compiling:
+            self._seq.append(node)
+            # регистрацию предков (вне поддерева) запомнит seq, их черед — при их обходе
+            if node not in self.node_to_sig and node in self._live:
+                self.node_to_sig[node] = self._ensure_sig(node)
+                self._added.append(node)
+            return
+        # сборка: порядок регистрации тот же, что у Residualizer, имена — по нему
+        if node in self.node_to_sig:
+            return
+        sig = self._sigs.get(node)
+        if sig is None:
+            is_g, params = self._signature(node)
+            sig = self._sigs[node] = (self._new_tmp(), params, is_g)
+        tmp, params, is_g = sig
+        self._real[tmp] = self._new_name(is_g)
+        self.node_to_sig[node] = (tmp, params)
+
+    def _ensure_sig(self, node: Node) -> Tuple[str, List[Var]]:
+        """Временное имя и параметры функции узла (при компиляции, до регистрации)."""
+        sig = self._sigs.get(node)
+        if sig is None:
+            is_g, params = self._signature(node)
+            sig = self._sigs[node] = (self._new_tmp(), params, is_g)
+            self._added.append(node)
+        return sig[:2]
+
+    def _new_tmp(self) -> str:
+        self._tmp_count += 1
+        return f"@{self._tmp_count}"
+
+    def _sig(self, node: Node) -> Tuple[str, List[Var]]:
+        if self._compiling:
+            return self._ensure_sig(node)
+        return super()._sig(node)
+
+    def _generate_definition(self, node: Node):
+        items = self._defs.get(node) if not self._compiling else None
+        if items is None:
+            return super()._generate_definition(node)
+        for item in items:
+            if isinstance(item, Rule):
+                self.rules.append(item)
+            else:
+                self._replay(item)
+
+    def _transform(self, node: Node) -> Expr:
+        frag = self._fragments.get(node)
+        if frag is None:
+            return super()._transform(node)
+        for event in frag.events:
+            self._replay(event)
+        return frag.expr
+
+    def _rewrite_expr(self, expr: Expr) -> Expr:
+        if self._compiling and type(expr) is FCall and not expr.name.startswith("@"):
+            # вызов исходной функции мог бы свернуться на функцию, которой еще нет
+            raise _Unsafe
+        return super()._rewrite_expr(expr)
+
+    def _let_function(self, key: str, params: List[Var], body: Expr) -> str:
+        tmp = self._k_names.setdefault(key, f"@k{len(self._k_names)}")
+        if self._compiling:
+            self._recording.append(("k", key))
+            self._k_templates.setdefault(key, (params, body))
+            return tmp
+        if key not in self.let_cache:
+            self.k_count += 1
+            self.let_cache[key] = tmp
+            self._real[tmp] = f"k{self.k_count}"
+            self.rules.append(Rule(Pattern(tmp, params), body))
+        return tmp
+
+    def _original_name(self, name: str) -> str:
+        if self._compiling:
+            self._recording.append(("orig", name))
+            return _original_rename(name)
+        return super()._original_name(name)
+
+    def _replay(self, event: tuple):
+        if self._compiling:
+            self._recording.append(event)
+        elif event[0] == "k":
+            self._let_function(event[1], *self._k_templates[event[1]])
+        else:
+            self._original_name(event[1])
+
+    def _residualize(self) -> Program:
+        # имена раздаются заново в порядке обхода готового дерева
+        self.node_to_sig.clear()
+        self.rules = []
+        program = super()._residualize()
+        program.rules = [Rule(Pattern(self._real.get(r.pattern.name, r.pattern.name), r.pattern.params),
+                              self._resolve(r.body), lineno=r.lineno) for r in program.rules]
+        return program
+
+    def _resolve(self, expr: Expr) -> Expr:
+        match expr:
+            case FCall(name, args):
+                return type(expr)(self._real.get(name, name), [self._resolve(a) for a in args],
+                                  lineno=expr.lineno, tag=expr.tag)
+            case Ctr(name, args):
+                return Ctr(name, [self._resolve(a) for a in args], lineno=expr.lineno, tag=expr.tag)
+            case Let(bindings, body):
+                return Let([(n, self._resolve(v)) for n, v in bindings], self._resolve(body))
+            case _:
+                return expr
+
+
+def _detached(node: Node) -> bool:
+    """Узел больше не висит в дереве (выброшен обобщением вместе с предком)."""
+    while node.parent is not None:
+        if not any(ch is node for ch in node.parent.children):
+            return True
+        node = node.parent
+    return False
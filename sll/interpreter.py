@@ -1,11 +1,24 @@
-from sll.ast_nodes import FCall, Ctr, Var
-from sll.matching import match, substitute
+from typing import List, Optional, Tuple
 
+from sll.ast_nodes import FCall, Ctr, Var, Expr, Program, Pattern, Rule, Let
+from sll.matching import match, substitute, merge_bindings, MatchSuccess
+from sll.stats import Stats
 
-def step(expr, program):
+
+def _pattern_expr(p):
+    """Вложенный образец остаточной программы (Pattern) — как конструктор для match."""
+    if isinstance(p, Pattern):
+        return Ctr(p.name, [_pattern_expr(a) for a in p.params])
+    return p
+
+
+def step(expr, program, strict: bool = False, fired: Optional[List[Rule]] = None):
     """
     Делает один шаг вычисления.
     Находит первый вызов функции, который можно выполнить, и раскрывает его.
+    strict — вызов по значению: сначала вычисляются аргументы вызова, потом он сам
+    (иначе — по имени: аргумент вычисляется, только если без него не подходит ни одно правило).
+    fired — если задан, в него добавляется примененное правило.
     """
 
     # СЛУЧАЙ 1: Конструктор (например, [S (add ...)])
@@ -14,7 +27,7 @@ def step(expr, program):
     match expr:
         case Ctr(name, args):
             for i, arg in enumerate(args):
-                new_arg = step(arg, program)
+                new_arg = step(arg, program, strict, fired)
                 if new_arg is not None:
                     new_args = list(args)
                     new_args[i] = new_arg
@@ -23,6 +36,11 @@ def step(expr, program):
 
     # СЛУЧАЙ 2: Вызов функции (например, (add [Z] [Z]))
         case FCall(name, args):
+            if strict:
+                new_call = _step_args(expr, program, strict, fired)
+                if new_call is not None:
+                    return new_call
+
             # ШАГ А: Пытаемся найти правило и применить его
             rules = [r for r in program.rules if r.pattern.name == name]
 
@@ -32,28 +50,68 @@ def step(expr, program):
 
                 # Сопоставляем все аргументы
                 for call_arg, pat_arg in zip(args, rule.pattern.params):
-                    res = match(pat_arg, call_arg)
-                    if res is None:
+                    res = match(_pattern_expr(pat_arg), call_arg)
+                    if not isinstance(res, MatchSuccess) or merge_bindings(bindings, res.bindings) is None:
                         match_success = False
                         break
-                    bindings.update(res)
 
                 if match_success:
                     # Нашли правило! Делаем подстановку (rewrite)
+                    if fired is not None:
+                        fired.append(rule)
                     return substitute(rule.body, bindings)
 
-            # ШАГ Б: Проверяем все аргументы слева направо.
-            for i, arg in enumerate(args):
-                if isinstance(arg, FCall):
-                    new_arg = step(arg, program)
-                    if new_arg is not None:
-                        # Мы продвинулись внутри аргумента!
-                        # Возвращаем обновленный внешний вызов
-                        new_args = list(args)
-                        new_args[i] = new_arg
-                        return FCall(name, new_args, lineno=expr.lineno)
-
-            return None # Тупик (Normal Form или ошибка)
+            # ШАГ Б: Проверяем все аргументы слева направо
+            # (и внутри конструкторов: образец может быть вложенным, [S [S x]]).
+            return _step_args(expr, program, strict, fired) # None — тупик (Normal Form или ошибка)
 
         case _:
             return None
+
+
+def _step_args(call: FCall, program, strict: bool, fired: Optional[List[Rule]]):
+    """Шаг в первом слева аргументе вызова, который можно вычислить."""
+    for i, arg in enumerate(call.args):
+        if isinstance(arg, (FCall, Ctr)):
+            new_arg = step(arg, program, strict, fired)
+            if new_arg is not None:
+                # Мы продвинулись внутри аргумента!
+                # Возвращаем обновленный внешний вызов
+                new_args = list(call.args)
+                new_args[i] = new_arg
+                return FCall(call.name, new_args, lineno=call.lineno)
+    return None
+
+
+def evaluate(expr: Expr, program: Program, max_steps: int = 100000,
+             strict: bool = False, stats: Stats = None) -> Tuple[Expr, int]:
+    """
+    Вычисляет expr до нормальной формы (или до max_steps шагов); strict — по значению.
+    Возвращает (результат, число шагов) — число шагов служит мерой стоимости программы.
+    stats — счетчики interpreter.steps и interpreter.allocs (конструкторы в телах
+    примененных правил: столько узлов данных создает шаг).
+    """
+    fired = [] if stats is not None else None
+    steps = 0
+    while steps < max_steps:
+        next_expr = step(expr, program, strict, fired)
+        if next_expr is None:
+            break
+        expr = next_expr
+        steps += 1
+    if stats is not None:
+        stats.count("interpreter.steps", steps)
+        stats.count("interpreter.allocs", sum(_constructors(r.body) for r in fired))
+    return expr, steps
+
+
+def _constructors(expr: Expr) -> int:
+    match expr:
+        case Ctr(_, args):
+            return 1 + sum(_constructors(a) for a in args)
+        case FCall(_, args):
+            return sum(_constructors(a) for a in args)
+        case Let(bindings, body):
+            return sum(_constructors(v) for _, v in bindings) + _constructors(body)
+        case _:
+            return 0
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
 from sll.ast_nodes import Var, Ctr, FCall, IntLit, Expr
 
@@ -154,3 +154,130 @@ def substitute(expr, bindings):
 
         case _:
             return expr
+
+
+def renaming_key(expr: Expr) -> Optional[str]:
+    """
+    Канонический ключ выражения с точностью до переименования переменных:
+    переменные нумеруются в порядке первого вхождения.
+    Ключи равны тогда и только тогда, когда выражения — переименования друг друга.
+    Для выражений с Let возвращает None (они не сравниваются по переименованию).
+    """
+    names: Dict[str, int] = {}
+    parts = []
+
+    def visit(e) -> bool:
+        match e:
+            case Var(name):
+                if name not in names:
+                    names[name] = len(names)
+                parts.append(f"%{names[name]}")
+            case IntLit(value):
+                parts.append(str(value))
+            case Ctr(name, args):
+                parts.append(f"[{name}")
+                if not all(visit(a) for a in args):
+                    return False
+                parts.append("]")
+            case FCall(name, args):
+                parts.append(f"({name}")
+                if not all(visit(a) for a in args):
+                    return False
+                parts.append(")")
+            case _:
+                return False
+        return True
+
+    if not visit(expr):
+        return None
+    return " ".join(parts)
+
+
+# --- Индекс образцов (дерево распознавания) ---
+
+_ANY = "*"
+
+
+def _tokens(expr: Expr, pattern: bool) -> Optional[list]:
+    """
+    Выражение в прямом порядке обхода: (символ, позиция конца подтерма).
+    Переменная образца — _ANY. Для образца с Let — None: match его не примет.
+    """
+    result = []
+
+    def visit(e) -> bool:
+        i = len(result)
+        result.append(None)
+        match e:
+            case Var(_):
+                token = _ANY if pattern else ("V",)
+            case IntLit(value):
+                token = ("I", value)
+            case Ctr(name, args) | FCall(name, args):
+                token = (type(e).__name__, name, len(args))
+                if not all(visit(a) for a in args):
+                    return False
+            case _:
+                if pattern:
+                    return False
+                token = ("?",)
+        result[i] = (token, len(result))
+        return True
+
+    return result if visit(expr) else None
+
+
+class DiscriminationTree:
+    """
+    Индекс образцов для поиска тех, под которые может подойти выражение.
+    Образцы разложены по символам в прямом порядке обхода; переменная образца
+    (ветка _ANY) пропускает целый подтерм выражения. Поиск отбрасывает образцы
+    с другим символом в какой-либо позиции, а окончательную проверку (повторные
+    переменные образца) делает match. Кандидаты выдаются в порядке добавления.
+    """
+
+    def __init__(self):
+        self.root: Dict = {}
+        self.size = 0
+        self._count = 0
+        self._where: Dict[object, Tuple[list, int]] = {}   # значение -> (лист, номер)
+
+    def add(self, pattern: Expr, value):
+        tokens = _tokens(pattern, pattern=True)
+        if tokens is None or value in self._where:
+            return
+        node = self.root
+        for token, _ in tokens:
+            node = node.setdefault(token, {})
+        leaf = node.setdefault(None, [])
+        self._count += 1
+        leaf.append((self._count, value))
+        self._where[value] = (leaf, self._count)
+        self.size += 1
+
+    def remove(self, value):
+        entry = self._where.pop(value, None)
+        if entry is not None:
+            leaf, number = entry
+            leaf.remove((number, value))
+            self.size -= 1
+
+    def candidates(self, expr: Expr) -> list:
+        """Образцы, под которые expr может подойти, в порядке добавления."""
+        tokens = _tokens(expr, pattern=False)
+        found = []
+        stack = [(self.root, 0)]
+        while stack:
+            node, pos = stack.pop()
+            if pos == len(tokens):
+                found.extend(node.get(None, ()))
+                continue
+            token, end = tokens[pos]
+            skip = node.get(_ANY)
+            if skip is not None:
+                stack.append((skip, end))
+            same = node.get(token)
+            if same is not None:
+                stack.append((same, pos + 1))
+        found.sort(key=lambda entry: entry[0])
+        return [value for _, value in found]
@@ -0,0 +1,99 @@
+from typing import Dict, List, Optional, Tuple
+
+from sll.ast_nodes import Program, Rule, Pattern, Expr, Var, Ctr, FCall, Let
+from sll.residualizer import entry_name
+from sll.stats import Stats
+
+# Минимизация остаточной программы: слияние эквивалентных функций.
+#
+# Функции остаточной программы — как состояния автомата: две функции эквивалентны,
+# если их правила совпадают с точностью до переименования переменных, а вызовы
+# в соответствующих местах идут в эквивалентные функции. Так сливаются и взаимно
+# рекурсивные пары (g1 вызывает g2, g3 — g4), которые сравнение правил по именам не видит.
+#
+# Разбиение измельчается, как при минимизации ДКА (Мур): сначала функции делятся по
+# форме правил, где вызовы функций программы стерты до номера блока, затем блоки
+# дробятся по номерам блоков вызываемых функций, пока число блоков растет.
+# Вызовы функций вне программы (исходные функции непрогнанных узлов) сравниваются по имени.
+
+
+def _shape(rules: List[Rule], block: Dict[str, int]) -> str:
+    """Правила функции с точностью до переименования; вызов функции программы — #номер блока."""
+    parts = []
+    for r in rules:
+        names: Dict[str, str] = {}
+
+        def canon(e: Expr) -> str:
+            match e:
+                case Var(n):
+                    return names.setdefault(n, f"%{len(names)}")
+                case Ctr(n, args) | Pattern(n, args):
+                    return f"[{n} {' '.join(canon(a) for a in args)}]"
+                case FCall(n, args):
+                    head = f"#{block[n]}" if n in block else n
+                    return f"({head} {' '.join(canon(a) for a in args)})"
+                case Let(bindings, body):
+                    inner = " ".join(f"{names.setdefault(b, f'%{len(names)}')}={canon(v)}" for b, v in bindings)
+                    return f"(let {inner} in {canon(body)})"
+                case _:
+                    return str(e)
+
+        parts.append(f"{' '.join(canon(p) for p in r.pattern.params)} -> {canon(r.body)}")
+    return "; ".join(parts)
+
+
+def partition(rules: List[Rule]) -> Dict[str, int]:
+    """Номер класса эквивалентности для каждой функции (классы нумеруются по первому правилу)."""
+    funcs: Dict[str, List[Rule]] = {}
+    for r in rules:
+        funcs.setdefault(r.pattern.name, []).append(r)
+
+    block = {name: 0 for name in funcs}
+    count = 1
+    while True:
+        ids: Dict[Tuple[int, str], int] = {}
+        new_block = {name: ids.setdefault((block[name], _shape(fr, block)), len(ids))
+                     for name, fr in funcs.items()}
+        if len(ids) == count:
+            return new_block
+        block, count = new_block, len(ids)
+
+
+def merge_bisimilar(rules: List[Rule], entry: Optional[str] = None) -> Tuple[List[Rule], int]:
+    """
+    Оставляет по одной функции из каждого класса (точку входа — если она в классе,
+    иначе первую по порядку правил) и перенаправляет на нее вызовы остальных.
+    Возвращает (правила, число удаленных функций).
+    """
+    block = partition(rules)
+    representative: Dict[int, str] = {}
+    if entry in block:
+        representative[block[entry]] = entry
+    for name in block:
+        representative.setdefault(block[name], name)
+    same = {name: representative[b] for name, b in block.items() if representative[b] != name}
+    if not same:
+        return rules, 0
+
+    def rename(e: Expr) -> Expr:
+        match e:
+            case FCall(n, args):
+                return FCall(same.get(n, n), [rename(a) for a in args], lineno=e.lineno, tag=e.tag)
+            case Ctr(n, args):
+                return Ctr(n, [rename(a) for a in args], lineno=e.lineno, tag=e.tag)
+            case Let(bindings, body):
+                return Let([(b, rename(v)) for b, v in bindings], rename(body), lineno=e.lineno, tag=e.tag)
+            case _:
+                return e
+
+    return [Rule(r.pattern, rename(r.body), lineno=r.lineno)
+            for r in rules if r.pattern.name not in same], len(same)
+
+
+def minimize(program: Program, entry: Optional[str] = None, stats: Stats = None) -> Program:
+    """Программа с одной функцией на класс эквивалентности; счетчик minimize.merged в stats."""
+    stats = stats if stats is not None else Stats()
+    with stats.timer("minimize"):
+        rules, merged = merge_bisimilar(program.rules, entry or entry_name(program))
+    stats.count("minimize.merged", merged)
+    return Program(rules, program.types, program.signatures)
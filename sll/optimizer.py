@@ -0,0 +1,335 @@
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sll.ast_nodes import Program, Rule, Pattern, Expr, Var, Ctr, FCall, Let
+from sll.matching import substitute
+from sll.minimize import merge_bisimilar
+from sll.residualizer import entry_name
+from sll.stats import Stats
+
+# Оптимизация остаточной программы (после Residualizer).
+#
+# Проходы работают над Program и повторяются, пока что-то меняется:
+#   dead    — удаление функций, недостижимых из точки входа;
+#   inline  — подстановка тел однострочных функций (правило с одними переменными
+#             в образце), вызванных один раз или только передающих вызов дальше;
+#             параметр, который входит в тело несколько раз, подставляется только
+#             переменной или значением — иначе вычисление аргумента повторится;
+#   params  — удаление параметров, которые нигде не используются
+#             (в том числе переданных только в такие же неиспользуемые параметры);
+#   merge   — слияние эквивалентных функций (sll/minimize.py): правила совпадают с точностью
+#             до переименования переменных и эквивалентности вызываемых функций.
+# Точка входа (main, а если его нет — функция первого правила) сохраняет имя и параметры.
+# Порядок правил внутри функции не меняется: интерпретатор берет первое подходящее.
+
+
+def optimize(program: Program, entry: Optional[str] = None, stats: Stats = None,
+             max_rounds: int = 10) -> Program:
+    """
+    Прогоняет проходы PASSES до неподвижной точки (не больше max_rounds кругов).
+    Счетчики optimize.<проход> и время optimize пишутся в stats.
+    """
+    stats = stats if stats is not None else Stats()
+    entry = entry or entry_name(program)
+    if entry is None:
+        return program
+    with stats.timer("optimize"):
+        rules = list(program.rules)
+        stats.count("optimize.rules_before", len(rules))
+        for _ in range(max_rounds):
+            changed = False
+            for name, run in PASSES:
+                rules, n = run(rules, entry)
+                if n:
+                    stats.count(f"optimize.{name}", n)
+                    changed = True
+            if not changed:
+                break
+        stats.count("optimize.rules_after", len(rules))
+    return Program(rules, program.types, program.signatures)
+
+
+# --- Обход выражений ---
+
+def _calls(expr: Expr, out: List[str]):
+    match expr:
+        case FCall(name, args):
+            out.append(name)
+            for a in args:
+                _calls(a, out)
+        case Ctr(_, args):
+            for a in args:
+                _calls(a, out)
+        case Let(bindings, body):
+            for _, v in bindings:
+                _calls(v, out)
+            _calls(body, out)
+
+
+def _map_calls(expr: Expr, fn: Callable[[FCall, List[Expr]], Expr]) -> Expr:
+    """Перестраивает выражение снизу вверх; fn(вызов, новые аргументы) -> новое выражение."""
+    match expr:
+        case FCall(_, args):
+            return fn(expr, [_map_calls(a, fn) for a in args])
+        case Ctr(name, args):
+            return Ctr(name, [_map_calls(a, fn) for a in args], lineno=expr.lineno, tag=expr.tag)
+        case Let(bindings, body):
+            return Let([(n, _map_calls(v, fn)) for n, v in bindings], _map_calls(body, fn),
+                       lineno=expr.lineno, tag=expr.tag)
+        case _:
+            return expr
+
+
+def _by_name(rules: List[Rule]) -> Dict[str, List[Rule]]:
+    result: Dict[str, List[Rule]] = {}
+    for r in rules:
+        result.setdefault(r.pattern.name, []).append(r)
+    return result
+
+
+def _use_counts(rules: List[Rule]) -> Dict[str, int]:
+    names: List[str] = []
+    for r in rules:
+        _calls(r.body, names)
+    counts: Dict[str, int] = {}
+    for n in names:
+        counts[n] = counts.get(n, 0) + 1
+    return counts
+
+
+# --- Проходы ---
+
+def _remove_dead(rules: List[Rule], entry: str) -> Tuple[List[Rule], int]:
+    """Оставляет функции, достижимые из entry по вызовам."""
+    funcs = _by_name(rules)
+    reachable = {entry}
+    stack = [entry]
+    while stack:
+        names: List[str] = []
+        for r in funcs.get(stack.pop(), []):
+            _calls(r.body, names)
+        for n in names:
+            if n in funcs and n not in reachable:
+                reachable.add(n)
+                stack.append(n)
+    dead = set(funcs) - reachable
+    return [r for r in rules if r.pattern.name in reachable], len(dead)
+
+
+def _is_forwarding(body: Expr) -> bool:
+    """Тело только передает вызов: переменная или вызов от переменных и констант."""
+    match body:
+        case Var(_):
+            return True
+        case FCall(_, args):
+            return not any(_has_calls(a) for a in args)
+        case _:
+            return False
+
+
+def _has_calls(expr: Expr) -> bool:
+    names: List[str] = []
+    _calls(expr, names)
+    return bool(names)
+
+
+def _inline_candidate(name: str, funcs: Dict[str, List[Rule]], entry: str) -> Optional[Rule]:
+    """
+    Единственное правило функции с различными переменными в образце,
+    без вызова самой себя и без свободных переменных в теле.
+    """
+    if name == entry or len(funcs.get(name, ())) != 1:
+        return None
+    rule = funcs[name][0]
+    params = rule.pattern.params
+    if not all(isinstance(p, Var) for p in params) or len({p.name for p in params}) != len(params):
+        return None
+    names: List[str] = []
+    _calls(rule.body, names)
+    if name in names or not _free_vars(rule.body) <= {p.name for p in params}:
+        return None
+    return rule
+
+
+def _free_vars(expr: Expr) -> Set[str]:
+    match expr:
+        case Var(name):
+            return {name}
+        case Ctr(_, args) | FCall(_, args):
+            return set().union(*(_free_vars(a) for a in args)) if args else set()
+        case Let(bindings, body):
+            bound = {n for n, _ in bindings}
+            return set().union(*(_free_vars(v) for _, v in bindings)) | (_free_vars(body) - bound)
+        case _:
+            return set()
+
+
+def _occurrences(expr: Expr, var: str) -> int:
+    """Сколько раз свободная переменная var входит в expr."""
+    match expr:
+        case Var(name):
+            return int(name == var)
+        case Ctr(_, args) | FCall(_, args):
+            return sum(_occurrences(a, var) for a in args)
+        case Let(bindings, body):
+            bound = var in {n for n, _ in bindings}
+            return sum(_occurrences(v, var) for _, v in bindings) + (0 if bound else _occurrences(body, var))
+        case _:
+            return 0
+
+
+def _is_value(expr: Expr) -> bool:
+    """Переменная или конструктор от значений: копия ничего не вычисляет."""
+    match expr:
+        case Var(_):
+            return True
+        case Ctr(_, args):
+            return all(_is_value(a) for a in args)
+        case _:
+            return False
+
+
+def _inline(rules: List[Rule], entry: str) -> Tuple[List[Rule], int]:
+    """
+    Подставляет тела однострочных функций, вызванных один раз или передающих вызов.
+    Вызов, где параметр с несколькими вхождениями получает не значение, остается:
+    функция тогда сохраняется ради таких вызовов.
+    """
+    inlined = 0
+    for name in list(_by_name(rules)):
+        funcs = _by_name(rules)
+        rule = _inline_candidate(name, funcs, entry)
+        if rule is None:
+            continue
+        uses = _use_counts(rules).get(name, 0)
+        if uses != 1 and not _is_forwarding(rule.body):
+            continue
+        params = [p.name for p in rule.pattern.params]
+        shared = [i for i, p in enumerate(params) if _occurrences(rule.body, p) > 1]
+        unfolded, kept = 0, 0
+
+        def unfold(call: FCall, args: List[Expr]) -> Expr:
+            nonlocal unfolded, kept
+            if call.name != name or len(args) != len(params):
+                return FCall(call.name, args, lineno=call.lineno, tag=call.tag)
+            if not all(_is_value(args[i]) for i in shared):
+                kept += 1
+                return FCall(call.name, args, lineno=call.lineno, tag=call.tag)
+            unfolded += 1
+            return substitute(rule.body, dict(zip(params, args)))
+
+        # правило самой функции не вызывает ее и остается как есть, если вызовы остались
+        mapped = [r if r.pattern.name == name else Rule(r.pattern, _map_calls(r.body, unfold), lineno=r.lineno)
+                  for r in rules]
+        if not unfolded:
+            continue
+        rules = mapped if kept else [r for r in mapped if r.pattern.name != name]
+        inlined += 1
+    return _absorb_entry(rules, entry, inlined)
+
+
+def _absorb_entry(rules: List[Rule], entry: str, inlined: int) -> Tuple[List[Rule], int]:
+    """
+    Точка входа вида (main x1 .. xn) -> (g x1 .. xn): правила g становятся правилами
+    точки входа (имя и параметры входа не меняются, на вызов меньше).
+    """
+    funcs = _by_name(rules)
+    fr = funcs.get(entry, [])
+    if len(fr) != 1 or not isinstance(fr[0].body, FCall):
+        return rules, inlined
+    params, body = fr[0].pattern.params, fr[0].body
+    target = body.name
+    if (target == entry or target not in funcs or body.args != params
+            or not all(isinstance(p, Var) for p in params)
+            or len({p.name for p in params}) != len(params)
+            or any(len(r.pattern.params) != len(params) for r in funcs[target])):
+        return rules, inlined
+
+    def rename(call: FCall, args: List[Expr]) -> Expr:
+        return FCall(entry if call.name == target else call.name, args, lineno=call.lineno, tag=call.tag)
+
+    # правила входа — первыми: по ним entry_name находит вход без main
+    moved = [Rule(Pattern(entry, r.pattern.params, lineno=r.pattern.lineno), _map_calls(r.body, rename),
+                  lineno=r.lineno) for r in funcs[target]]
+    rest = [Rule(r.pattern, _map_calls(r.body, rename), lineno=r.lineno)
+            for r in rules if r.pattern.name not in (entry, target)]
+    return moved + rest, inlined + 1
+
+
+def _occurs_live(expr: Expr, var: str, dead: Set[Tuple[str, int]]) -> bool:
+    """Входит ли переменная в expr вне аргументов, которые будут удалены."""
+    match expr:
+        case Var(name):
+            return name == var
+        case FCall(name, args):
+            return any(_occurs_live(a, var, dead) for i, a in enumerate(args) if (name, i) not in dead)
+        case Ctr(_, args):
+            return any(_occurs_live(a, var, dead) for a in args)
+        case Let(bindings, body):
+            return (any(_occurs_live(v, var, dead) for _, v in bindings)
+                    or (var not in {n for n, _ in bindings} and _occurs_live(body, var, dead)))
+        case _:
+            return False
+
+
+def _remove_unused_params(rules: List[Rule], entry: str) -> Tuple[List[Rule], int]:
+    """
+    Удаляет параметры, не нужные ни одному правилу: в образце — переменная,
+    а в теле она не встречается или передается только в такие же параметры.
+    Ищется наибольшее такое множество (сначала все кандидаты, затем отсеиваются живые).
+    """
+    funcs = _by_name(rules)
+    dead: Set[Tuple[str, int]] = set()
+    for name, fr in funcs.items():
+        if name == entry:
+            continue
+        arity = len(fr[0].pattern.params)
+        if any(len(r.pattern.params) != arity for r in fr):
+            continue
+        for i in range(arity):
+            if all(isinstance(r.pattern.params[i], Var) for r in fr):
+                dead.add((name, i))
+
+    changed = True
+    while changed:
+        changed = False
+        for name, i in list(dead):
+            for r in funcs[name]:
+                var = r.pattern.params[i].name
+                others = [p for j, p in enumerate(r.pattern.params) if j != i]
+                if _occurs_live(r.body, var, dead) or any(var in _pattern_vars(p) for p in others):
+                    dead.discard((name, i))
+                    changed = True
+                    break
+
+    if not dead:
+        return rules, 0
+
+    def drop(call: FCall, args: List[Expr]) -> Expr:
+        return FCall(call.name, [a for i, a in enumerate(args) if (call.name, i) not in dead],
+                     lineno=call.lineno, tag=call.tag)
+
+    result = []
+    for r in rules:
+        params = [p for i, p in enumerate(r.pattern.params) if (r.pattern.name, i) not in dead]
+        result.append(Rule(Pattern(r.pattern.name, params, lineno=r.pattern.lineno),
+                           _map_calls(r.body, drop), lineno=r.lineno))
+    return result, len(dead)
+
+
+def _pattern_vars(expr: Expr) -> Set[str]:
+    match expr:
+        case Var(name):
+            return {name}
+        case Ctr(_, args) | Pattern(_, args):
+            return set().union(*(_pattern_vars(a) for a in args)) if args else set()
+        case _:
+            return set()
+
+
+# Порядок проходов: удаление параметров открывает слияние, слияние — подстановку
+PASSES: List[Tuple[str, Callable[[List[Rule], str], Tuple[List[Rule], int]]]] = [
+    ("dead", _remove_dead),
+    ("inline", _inline),
+    ("params", _remove_unused_params),
+    ("merge", merge_bisimilar),
+]
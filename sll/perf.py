@@ -0,0 +1,202 @@
+import json
+import math
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from sll.budget import Budget
+from sll.cache import supercompile
+from sll.interpreter import evaluate
+from sll.parser import parse
+from sll.stats import Stats
+from sll.workloads import Workload, calibrate, chain, acc, alphabet
+
+# Регрессионные замеры производительности: фиксированные входы суперкомпилятора
+# и интерпретатора, счетчики Stats и время фаз против базы bench/baselines/perf.json.
+#
+# Счетчики детерминированы и сравниваются всегда (sll/test_perf.py); время — в единицах
+# calibrate(), лучшее из нескольких повторов, и только по запросу: на общей машине оно
+# шумит. Регрессия — рост сверх TOLERANCE (и сверх TIME_FLOOR для времени);
+# уменьшение регрессией не считается. Каждая регрессия приписана фазе (PHASES),
+# чтобы было видно, что стало хуже: прогонка, свисток, обобщение, остаточная программа...
+# База обновляется так: python bench/perf.py --save.
+
+BASELINE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "baselines", "perf.json")
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "samples")
+
+TOLERANCE: Dict[str, float] = {"counters": 0.0, "timers": 1.0}
+TIME_FLOOR = 0.5    # единиц calibrate(): более мелкие прибавки — шум
+
+# префикс счетчика -> фаза (имена фаз — как у таймеров Stats)
+PHASES: Dict[str, str] = {
+    "drive.": "drive",
+    "folds": "fold",
+    "whistles": "whistle",
+    "generalizations": "generalize",
+    "residual.": "residualize",
+    "interpreter.": "interpret",
+}
+
+
+def phase_of(counter: str) -> str:
+    """Фаза, к которой относится счетчик; узлы, шаги и прочее — build."""
+    for prefix, phase in PHASES.items():
+        if counter.startswith(prefix):
+            return phase
+    return "build"
+
+
+@dataclass
+class PerfWorkload:
+    """Вход замера: суперкомпиляция (strategy, gen_type) или, при interpret, вычисление."""
+    name: str
+    workload: Workload
+    strategy: str = "HE"
+    gen_type: str = "TOP"
+    max_steps: int = 100
+    interpret: bool = False
+
+
+def _sample(fname: str, entry: str) -> Workload:
+    """Функция entry из samples/fname с переменными x1..xn по сигнатуре."""
+    with open(os.path.join(SAMPLES_DIR, fname), encoding="utf-8") as f:
+        code = f.read()
+    sig = next(s for s in parse(code).signatures if s.name == entry)
+    names = [f"x{i + 1}" for i in range(len(sig.arg_types))]
+    return Workload(f"{fname[:-4]}:{entry}", code, f"({entry} {' '.join(names)})",
+                    {v: str(t) for v, t in zip(names, sig.arg_types)})
+
+
+def _nat(n: int) -> str:
+    return "[Z]" if n == 0 else f"[S {_nat(n - 1)}]"
+
+
+def _letters(names: List[str]) -> str:
+    text = "[Nil]"
+    for name in reversed(names):
+        text = f"[Cons [{name}] {text}]"
+    return text
+
+
+def _applied(workload: Workload, expr: str) -> Workload:
+    """Та же программа с замкнутым выражением expr — вход интерпретатора."""
+    return Workload(workload.name, workload.code, expr, {})
+
+
+def workloads() -> List[PerfWorkload]:
+    addeqadd = _sample("test_3.sll", "addeqadd")
+    mul2 = _sample("test_2.sll", "mul2")
+    letters8 = [f"C{i % 8 + 1}" for i in range(64)]
+    chain8 = chain(8)
+    return [
+        *(PerfWorkload(f"addeqadd {s}/{g}", addeqadd, s, g) for s in ("HE", "TAG") for g in ("TOP", "BOTTOM")),
+        PerfWorkload("mul2 HE/BOTTOM", mul2, "HE", "BOTTOM"),
+        PerfWorkload("mul2 TAG/TOP", mul2, "TAG", "TOP"),
+        PerfWorkload("commute TAG/BOTTOM", _sample("commute.sll", "main"), "TAG", "BOTTOM"),
+        PerfWorkload("chain8 HE/TOP", chain8),
+        PerfWorkload("alphabet16 TAG/TOP", alphabet(16), "TAG", "TOP"),
+        PerfWorkload("acc2 HE/TOP", acc(2), max_steps=60),
+        PerfWorkload("eval mul2 8x8", _applied(mul2, f"(mul2 {_nat(8)} {_nat(8)})"), interpret=True),
+        PerfWorkload("eval chain8 64", _applied(chain8, f"(sub8 (sub7 (sub6 (sub5 (sub4 (sub3 (sub2 (sub1 "
+                                                        f"{_letters([f'L{i % 9}' for i in range(64)])}"
+                                                        f"))))))))"), interpret=True),
+        PerfWorkload("eval alphabet8 64", _applied(alphabet(8), f"(eqlists {_letters(letters8)} "
+                                                                f"{_letters(letters8)})"), interpret=True),
+    ]
+
+
+def _run(w: PerfWorkload) -> Stats:
+    program, expr, types = w.workload.parsed()
+    if not w.interpret:
+        _, _, sc = supercompile(program, expr, types, strategy=w.strategy, gen_type=w.gen_type,
+                                budget=Budget(max_steps=w.max_steps))
+        return sc.stats
+    stats = Stats()
+    with stats.timer("interpret"):
+        evaluate(expr, program, stats=stats)
+    return stats
+
+
+def measure(w: PerfWorkload, repeat: int = 1, unit: Optional[float] = None) -> dict:
+    """
+    {"counters": ..., "timers": ...}: счетчики первого запуска, время каждой фазы —
+    лучшее из repeat запусков, в единицах unit (без unit — время не меряется).
+    """
+    stats = _run(w)
+    result = {"counters": dict(sorted(stats.counters.items())), "timers": {}}
+    if unit is None:
+        return result
+    best = dict(stats.timers)
+    for _ in range(repeat - 1):
+        for phase, seconds in _run(w).timers.items():
+            best[phase] = min(best.get(phase, math.inf), seconds)
+    result["timers"] = {phase: round(seconds / unit, 3) for phase, seconds in sorted(best.items())}
+    return result
+
+
+def run_suite(repeat: int = 1, timings: bool = False) -> Dict[str, dict]:
+    """Замеры всех workloads() по имени."""
+    unit = calibrate() if timings else None
+    return {w.name: measure(w, repeat, unit) for w in workloads()}
+
+
+@dataclass
+class Regression:
+    workload: str
+    phase: str
+    metric: str         # имя счетчика или "time"
+    was: float
+    now: float
+
+    def __str__(self):
+        growth = f"+{(self.now / self.was - 1) * 100:.0f}%" if self.was else "new"
+        if self.metric == "time":
+            return f"{self.workload}: {self.phase} time {self.was:.2f} -> {self.now:.2f} units ({growth})"
+        return f"{self.workload}: {self.phase} {self.metric} {self.was:g} -> {self.now:g} ({growth})"
+
+
+def compare(current: Dict[str, dict], baseline: Dict[str, dict],
+            tolerance: Optional[Dict[str, float]] = None) -> List[Regression]:
+    """
+    Регрессии current против baseline (оба — как у run_suite). Сравниваются только
+    входы и метрики, которые есть в обоих: новый счетчик — не регрессия.
+    """
+    tol = {**TOLERANCE, **(tolerance or {})}
+    found = []
+    for name, now in current.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for counter, was in base["counters"].items():
+            value = now["counters"].get(counter)
+            if value is not None and value > was * (1 + tol["counters"]):
+                found.append(Regression(name, phase_of(counter), counter, was, value))
+        for phase, was in base.get("timers", {}).items():
+            value = now["timers"].get(phase)
+            if value is not None and value > was * (1 + tol["timers"]) and value - was > TIME_FLOOR:
+                found.append(Regression(name, phase, "time", was, value))
+    return found
+
+
+def by_phase(regressions: List[Regression]) -> str:
+    """Отчет для сообщения об ошибке: фазы, в которых что-то выросло, и что именно."""
+    phases: Dict[str, List[Regression]] = {}
+    for r in regressions:
+        phases.setdefault(r.phase, []).append(r)
+    lines = [f"regressed phases: {', '.join(phases)}"]
+    for phase, items in phases.items():
+        lines.append(f"[{phase}]")
+        lines.extend(f"  {r}" for r in items)
+    return "\n".join(lines)
+
+
+def load_baseline(path: str = BASELINE) -> Dict[str, dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results: Dict[str, dict], path: str = BASELINE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1, ensure_ascii=False)
+        f.write("\n")
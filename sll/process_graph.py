@@ -0,0 +1,483 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sll.ast_nodes import Expr, Var, Ctr, FCall, IntLit, Let, Pattern
+from sll.process_tree import Node, Contraction
+
+
+# --- Переименование ---
+
+def rename_expr(expr: Optional[Expr], names: Dict[str, str]) -> Optional[Expr]:
+    """Переименовывает переменные (и имена let-связываний) по словарю names."""
+    if expr is None or not names:
+        return expr
+    match expr:
+        case Var(name):
+            return Var(names.get(name, name), lineno=expr.lineno, tag=expr.tag)
+        case Ctr(name, args):
+            return Ctr(name, [rename_expr(a, names) for a in args], lineno=expr.lineno, tag=expr.tag)
+        case FCall(name, args):
+            return FCall(name, [rename_expr(a, names) for a in args], lineno=expr.lineno, tag=expr.tag)
+        case Let(bindings, body):
+            return Let([(names.get(n, n), rename_expr(e, names)) for n, e in bindings],
+                       rename_expr(body, names), lineno=expr.lineno, tag=expr.tag)
+        case _:
+            return expr
+
+
+def rename_pattern(p, names: Dict[str, str]):
+    """Переименовывает переменные образца (параметры — Var, Ctr или вложенные Pattern)."""
+    if isinstance(p, Pattern):
+        return Pattern(p.name, [rename_pattern(a, names) for a in p.params], lineno=p.lineno)
+    return rename_expr(p, names)
+
+
+def rename_contraction(c: Optional[Contraction], names: Dict[str, str]) -> Optional[Contraction]:
+    if c is None or not names:
+        return c
+    pattern = None
+    if c.pattern is not None:
+        pattern = Pattern(c.pattern.name, [rename_expr(p, names) for p in c.pattern.params])
+    narrowings = None
+    if c.narrowings is not None:
+        narrowings = {names.get(k, k): rename_expr(v, names) for k, v in c.narrowings.items()}
+    return Contraction(var_name=names.get(c.var_name, c.var_name), pattern=pattern,
+                       value=rename_expr(c.value, names), narrowings=narrowings,
+                       is_default=c.is_default)
+
+
+# --- Канонический ключ поддерева ---
+
+class _KeyBuilder:
+    """
+    Строит ключ поддерева с точностью до переименования:
+    все имена переменных нумеруются в порядке первого вхождения при обходе.
+    """
+
+    def __init__(self):
+        self.names: Dict[str, int] = {}
+        self.order: List[str] = []
+        self.parts: List[str] = []
+
+    def name(self, n: str) -> str:
+        if n not in self.names:
+            self.names[n] = len(self.names)
+            self.order.append(n)
+        return f"%{self.names[n]}"
+
+    def expr(self, e: Optional[Expr]):
+        if e is None:
+            self.parts.append("_")
+            return
+        tag = f"{{{e.tag}}}" if e.tag is not None else ""
+        match e:
+            case Var(n):
+                self.parts.append(self.name(n) + tag)
+            case IntLit(v):
+                self.parts.append(f"{v}{tag}")
+            case Ctr(n, args) | FCall(n, args):
+                self.parts.append(("[" if isinstance(e, Ctr) else "(") + n + tag)
+                for a in args:
+                    self.expr(a)
+                self.parts.append("]" if isinstance(e, Ctr) else ")")
+            case Let(bindings, body):
+                self.parts.append("(let" + tag)
+                for n, val in bindings:
+                    self.parts.append(self.name(n))
+                    self.expr(val)
+                self.parts.append("in")
+                self.expr(body)
+                self.parts.append(")")
+            case _:
+                self.parts.append(str(e))
+
+    def contraction(self, c: Optional[Contraction]):
+        if c is None:
+            self.parts.append("c_")
+            return
+        self.parts.append(f"c{int(c.is_default)}")
+        self.parts.append(self.name(c.var_name) if c.var_name else "_")
+        if c.pattern is not None:
+            self.parts.append(c.pattern.name)
+            for p in c.pattern.params:
+                self.expr(p)
+        self.expr(c.value)
+        if c.narrowings is not None:
+            self.parts.append("n")
+            for k, v in c.narrowings.items():
+                self.parts.append(self.name(k))
+                self.expr(v)
+
+    def node(self, n: Node):
+        """Поля самого узла, кроме сужения на входе и обратной ссылки."""
+        self.parts.append("{")
+        self.expr(n.expr)
+        for v in _expr_vars(n.expr):
+            self.parts.append(str(n.var_types.get(v)))
+        self.parts.append(f"b{int(n.is_basis_ref)}s{int(n.stopped)}u{int(n.unfolded)}")
+        self.parts.append(str(n.driven_rule))
+        for e in (n.driven_from, n.gen_alpha, n.gen_beta, n.gen_result):
+            self.expr(e)
+        self.parts.append(str(len(n.children)))
+
+
+def _subtree_key(root: Node, preorder: Dict[Node, int]) -> Tuple[str, List[str]]:
+    """Ключ поддерева root и имена переменных в каноническом порядке."""
+    kb = _KeyBuilder()
+    base = preorder[root]
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        kb.node(n)
+        if n is not root:
+            kb.contraction(n.contraction)
+        if n.back_link is not None:
+            kb.parts.append(f"@{preorder[n.back_link] - base}")
+        stack.extend(reversed(n.children))
+    return " ".join(kb.parts), kb.order
+
+
+def _expr_vars(expr: Expr) -> List[str]:
+    result = []
+    stack = [expr]
+    while stack:
+        e = stack.pop()
+        match e:
+            case Var(n):
+                if n not in result:
+                    result.append(n)
+            case Ctr(_, args) | FCall(_, args):
+                stack.extend(reversed(args))
+            case Let(bindings, body):
+                stack.append(body)
+                stack.extend(reversed([val for _, val in bindings]))
+    return result
+
+
+# --- Общие поддеревья ---
+
+class SharedNode:
+    """
+    Узел разделяемого поддерева.
+    Хранит только ссылку на узел-представителя target и переименование names
+    (имя у представителя -> имя в этом месте графа).
+    Отдаёт тот же интерфейс, что и Node (expr, children, contraction, back_link, ...),
+    вычисляя поля по представителю. Heap/stack/bag законченного поддерева не хранятся.
+
+    Корень разделяемого поддерева (anchor) стоит в children своего родителя;
+    узлы внутри создаются на лету и сравниваются по (anchor, target).
+    """
+    __slots__ = ("_target", "_anchor", "_names", "_parent", "_contraction", "share_key")
+
+    def __init__(self, target: Node, anchor: Optional['SharedNode'] = None,
+                 names: Optional[Dict[str, str]] = None,
+                 parent: Optional[Node] = None, contraction: Optional[Contraction] = None):
+        self._target = target
+        self._anchor = anchor if anchor is not None else self
+        self._names = names if names is not None else self._anchor._names
+        self._parent = parent
+        self._contraction = contraction
+        self.share_key = None
+
+    def _view(self, target: Node) -> 'SharedNode':
+        anchor = self._anchor
+        if target is anchor._target:
+            return anchor
+        return SharedNode(target, anchor)
+
+    def __eq__(self, other):
+        return (isinstance(other, SharedNode) and other._anchor is self._anchor
+                and other._target is self._target)
+
+    def __hash__(self):
+        return hash((id(self._anchor), id(self._target)))
+
+    @property
+    def expr(self) -> Expr:
+        return rename_expr(self._target.expr, self._names)
+
+    @property
+    def var_types(self):
+        names = self._names
+        return {names.get(k, k): t for k, t in self._target.var_types.items()}
+
+    @property
+    def children(self) -> List['SharedNode']:
+        return [self._view(c) for c in self._target.children]
+
+    @property
+    def parent(self):
+        if self._anchor is self:
+            return self._parent
+        return self._view(self._target.parent)
+
+    @parent.setter
+    def parent(self, value):
+        self._anchor._parent = value
+
+    @property
+    def contraction(self) -> Optional[Contraction]:
+        if self._anchor is self:
+            return self._contraction
+        return rename_contraction(self._target.contraction, self._names)
+
+    @property
+    def back_link(self):
+        t = self._target.back_link
+        return self._view(t) if t is not None else None
+
+    @property
+    def is_basis_ref(self) -> bool:
+        return self._target.is_basis_ref
+
+    @property
+    def stopped(self) -> bool:
+        return self._target.stopped
+
+    @property
+    def unfolded(self) -> bool:
+        return self._target.unfolded
+
+    @property
+    def driven_rule(self):
+        return self._target.driven_rule
+
+    @property
+    def driven_from(self):
+        return rename_expr(self._target.driven_from, self._names)
+
+    @property
+    def gen_alpha(self):
+        return rename_expr(self._target.gen_alpha, self._names)
+
+    @property
+    def gen_beta(self):
+        return rename_expr(self._target.gen_beta, self._names)
+
+    @property
+    def gen_result(self):
+        return rename_expr(self._target.gen_result, self._names)
+
+    @property
+    def heap(self):
+        return []
+
+    @property
+    def stack(self):
+        return []
+
+    @property
+    def context(self):
+        return None
+
+    @property
+    def bag(self):
+        return None
+
+    @property
+    def released(self) -> bool:
+        return True
+
+    def release(self):
+        pass
+
+    def leaves(self) -> List['SharedNode']:
+        return Node.leaves(self)
+
+    def ancestors(self) -> List:
+        return Node.ancestors(self)
+
+    def __str__(self):
+        return Node.__str__(self)
+
+
+@dataclass
+class CompactionStats:
+    nodes_before: int = 0
+    nodes_after: int = 0
+    shared_subtrees: int = 0
+
+
+def compact(root: Node, min_size: int = 2) -> CompactionStats:
+    """
+    Сжимает законченное дерево процессов в граф:
+    поддеревья, совпадающие с уже встреченными с точностью до переименования,
+    заменяются узлами SharedNode, ссылающимися на первое вхождение.
+    Разделяются только замкнутые поддеревья: все обратные ссылки изнутри
+    ведут внутрь и снаружи внутрь ссылок нет.
+    Корень (и корни леса PROGRAM_FOREST) остаются обычными узлами.
+    """
+    stats = CompactionStats()
+
+    # Прямой порядок обхода и размеры поддеревьев
+    preorder: Dict[Node, int] = {}
+    order: List[Node] = []
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        preorder[n] = len(order)
+        order.append(n)
+        stack.extend(reversed(n.children))
+    size: Dict[Node, int] = {}
+    for n in reversed(order):
+        size[n] = 1 + sum(size[c] for c in n.children)
+    stats.nodes_before = len(order)
+
+    # Поддеревья, которые пересекает какая-нибудь обратная ссылка
+    crossed = set()
+    for n in order:
+        t = n.back_link
+        if t is None:
+            continue
+        if t not in preorder:
+            # ссылка за пределы дерева: незамкнуты все предки n
+            crossed.update(n.ancestors())
+            crossed.add(n)
+            continue
+        t_path = {t, *t.ancestors()}
+        curr = n
+        while curr is not None and curr not in t_path:
+            crossed.add(curr)
+            curr = curr.parent
+        lca = curr
+        curr = t
+        while curr is not None and curr is not lca:
+            crossed.add(curr)
+            curr = curr.parent
+
+    is_forest = isinstance(root.expr, FCall) and root.expr.name == "PROGRAM_FOREST"
+    pinned = {root, *(root.children if is_forest else [])}
+
+    index: Dict[str, Tuple[Node, List[str]]] = {}
+    work: List[Tuple[Node, bool]] = [(root, False)]
+    while work:
+        n, inside_rep = work.pop()
+        eligible = n not in pinned and n not in crossed and size[n] >= min_size
+        if eligible:
+            key, names = _subtree_key(n, preorder)
+            found = index.get(key)
+            if found is not None and not inside_rep:
+                rep, rep_names = found
+                renaming = {a: b for a, b in zip(rep_names, names) if a != b}
+                stub = SharedNode(rep, names=renaming, parent=n.parent, contraction=n.contraction)
+                siblings = n.parent.children
+                siblings[next(i for i, c in enumerate(siblings) if c is n)] = stub
+                stats.shared_subtrees += 1
+                continue
+            if found is None:
+                index[key] = (n, names)
+                inside_rep = True
+        for c in reversed(n.children):
+            work.append((c, inside_rep))
+
+    stats.nodes_after = count_stored(root)
+    return stats
+
+
+class SubtreeSharing:
+    """
+    Слияние во время постройки (Supercompiler(share_subtrees=True)): поддерево,
+    которое только что закрылось, сравнивается с уже закрытыми и, если совпало
+    с точностью до переименования, сразу заменяется SharedNode — его узлы
+    освобождаются, не дожидаясь конца постройки, как у compact.
+    Закрытое поддерево больше не меняется (обобщение TOP выбрасывает поддерево alpha
+    целиком, а не переписывает его), поэтому на него можно ссылаться.
+    Представителем становится только поддерево без SharedNode внутри:
+    ссылки на ссылки не строятся.
+
+    Ключ собирается снизу вверх: поля узла, сужения детей и номера их ключей
+    (share_key ребенка кладет его собственный close), поэтому закрытие узла не обходит
+    поддерево. Обходятся только совпавшие по номеру поддеревья — чтобы сверить их
+    полными ключами и найти переименование; совпавшее поддерево тут же отпускается.
+    """
+
+    def __init__(self, min_size: int = 2):
+        self.min_size = min_size
+        self.ids: Dict[str, int] = {}       # ключ узла -> номер
+        self.index: Dict[int, list] = {}    # номер -> [представитель, его полный ключ и имена или None]
+
+    def reset(self):
+        """Новое дерево: представители прошлого больше не нужны."""
+        self.ids = {}
+        self.index = {}
+
+    def close(self, node: Node) -> Optional[SharedNode]:
+        """
+        Закрылось поддерево node (его родитель еще не закрыт, дети уже закрыты).
+        Кладет в node.share_key (номер ключа, на сколько уровней выше node ведут
+        обратные ссылки изнутри, есть ли внутри SharedNode, размер) и возвращает
+        узел-ссылку, которая заменила node в children родителя, или None.
+        """
+        if node.parent is None:
+            for c in node.children:
+                c.share_key = None
+            return None
+        kb = _KeyBuilder()
+        kb.node(node)
+        # свертка — только на предков, поэтому ссылка задается числом уровней вверх
+        reach = 0
+        if node.back_link is not None:
+            reach = node.depth - node.back_link.depth
+            kb.parts.append(f"@{reach}")
+        size, has_stub = 1, False
+        for c in node.children:
+            if c.share_key is None:
+                return None     # у ребенка нет ключа — поддерево не сравнить
+            key_id, child_reach, child_stub, child_size = c.share_key
+            c.share_key = None  # дальше нужен только номер в ключе родителя
+            kb.contraction(c.contraction)
+            kb.parts.append(f"#{key_id}")
+            for v in _expr_vars(c.expr):
+                kb.parts.append(kb.name(v))
+            reach = max(reach, child_reach - 1)
+            size += child_size
+            has_stub = has_stub or child_stub
+        key_id = self.ids.setdefault(" ".join(kb.parts), len(self.ids))
+        node.share_key = (key_id, reach, has_stub, size)
+        # обратные ссылки изнутри должны вести внутрь (внутрь ссылок снаружи нет:
+        # свертка — только на предков, а они у незакрытых узлов не закрыты)
+        if reach > 0 or size < self.min_size:
+            return None
+        found = self.index.get(key_id)
+        if found is None:
+            if not has_stub:
+                self.index[key_id] = [node, None]
+            return None
+        rep, rep_key = found
+        if rep_key is None:
+            rep_key = found[1] = _closed_key(rep)
+        key = _closed_key(node)
+        if key is None or rep_key is None or key[0] != rep_key[0]:
+            return None     # номера совпали, а имена разошлись: поддеревья разные
+        renaming = {a: b for a, b in zip(rep_key[1], key[1]) if a != b}
+        stub = SharedNode(rep, names=renaming, parent=node.parent, contraction=node.contraction)
+        stub.share_key = (key_id, 0, True, size)
+        siblings = node.parent.children
+        siblings[next(i for i, c in enumerate(siblings) if c is node)] = stub
+        return stub
+
+
+def _closed_key(root: Node) -> Optional[Tuple[str, List[str]]]:
+    """_subtree_key поддерева, все обратные ссылки которого ведут внутрь; иначе None."""
+    preorder: Dict[Node, int] = {}
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        preorder[n] = len(preorder)
+        stack.extend(reversed(n.children))
+    if any(n.back_link is not None and n.back_link not in preorder for n in preorder):
+        return None
+    return _subtree_key(root, preorder)
+
+
+def count_stored(root: Node) -> int:
+    """Число хранимых узлов Node (SharedNode-ссылки считаются по одному)."""
+    count = 0
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        count += 1
+        if isinstance(n, SharedNode):
+            continue
+        stack.extend(n.children)
+    return count
@@ -1,6 +1,6 @@
 from dataclasses import dataclass, field
 from typing import List, Optional, Tuple, Dict
-from sll.ast_nodes import Expr, Pattern, TypeExpr
+from sll.ast_nodes import Expr, Pattern, TypeExpr, FCall
 from collections import Counter
 
 
@@ -42,10 +42,43 @@ class StackFrame:
     tag: Optional[int]
     kind: str = "GEN"
 
-@dataclass(eq=False)
-class Node:
+@dataclass(frozen=True)
+class ContextFrame:
     """
-    Узел дерева суперкомпиляции.
+    Кадр контекста вычисления вложенного вызова: call ждет значения аргумента arg_index.
+    Сам этот аргумент кадр не читает (в call на его месте может остаться выражение
+    до шагов в фокусе) — его дает следующий кадр или фокус.
+    """
+    call: FCall
+    arg_index: int
+
+    @property
+    def tag(self) -> Optional[int]:
+        return self.call.tag
+
+
+@dataclass(frozen=True)
+class Context:
+    """Конфигурация вложенного вызова между шагами прогонки: фокус (редекс) и кадры от внешнего вызова к нему."""
+    frames: Tuple[ContextFrame, ...]
+    focus: Expr
+
+
+def plug(frames, focus: Expr) -> Expr:
+    """Вставляет фокус обратно в контекст: пересобираются только вызовы на пути к фокусу."""
+    result = focus
+    for frame in reversed(frames):
+        new_args = list(frame.call.args)
+        new_args[frame.arg_index] = result
+        result = FCall(frame.call.name, new_args, lineno=frame.call.lineno, tag=frame.call.tag)
+    return result
+
+
+@dataclass(eq=False, slots=True)
+class LeanNode:
+    """
+    Узел дерева суперкомпиляции без полей для картинки (Supercompiler(lean=True)).
+    Поля driven_from, driven_rule, gen_* читаются как None.
     """
     expr: Expr                          # Выражение в текущем состоянии
 
@@ -54,6 +87,9 @@ class Node:
 
     heap: List[HeapBinding] = field(default_factory=list)
     stack: List[StackFrame] = field(default_factory=list)
+    # Фокус и контекст, если выражение — вложенный вызов с редексом внутри; живет между
+    # шагами прогонки узла (верх стека K для мешка тегов), после шагов в фокусе expr — None
+    context: Optional[Context] = None
 
     bag: Optional[Counter] = None        # Мешок тегов (для свистка)
 
@@ -66,17 +102,21 @@ class Node:
     # Ссылка назад (для сворачивания графа)
     back_link: Optional['Node'] = None
 
-    driven_from: Optional[Expr] = None
-    driven_rule: Optional[Pattern] = None
-
-    gen_alpha: Optional[Expr] = None   # что было до обобщения
-    gen_beta: Optional[Expr] = None    # на чем свистнули
-    gen_result: Optional[Expr] = None  # во что обобщили
-
     is_basis_ref: bool = False         # узел является ссылкой на корень другого дерева в лесу
+    stopped: bool = False              # не прогнан: исчерпан бюджет (остается вызовом исходной программы)
+    unfolded: bool = False             # был шаг развертки (TransientStep)
+    depth: int = 0                     # расстояние до корня (ставит add_child; для Budget.max_depth)
+    share_key: Optional[tuple] = None  # ключ закрытого поддерева до закрытия родителя (SubtreeSharing)
+
+    driven_from = None
+    driven_rule = None
+    gen_alpha = None
+    gen_beta = None
+    gen_result = None
 
     def add_child(self, node: 'Node', contraction: Optional[Contraction] = None):
         node.parent = self
+        node.depth = self.depth + 1
         node.contraction = contraction
 
         node.heap = list(self.heap)
@@ -98,6 +138,12 @@ class Node:
         for name, e in bindings:
             self.heap.append(HeapBinding(name=name, expr=e))
 
+    def plug_focus(self) -> Expr:
+        """Собирает expr из фокуса и контекста после шагов в фокусе (один раз на серию шагов)."""
+        if self.expr is None:
+            self.expr = plug(self.context.frames, self.context.focus)
+        return self.expr
+
     def __str__(self):
         types_str = ", ".join(f"{k}:{v.name}" for k, v in self.var_types.items())
         return f"Node({self.expr}) {{{types_str}}}"
@@ -120,4 +166,29 @@ class Node:
         while curr:
             res.append(curr)
             curr = curr.parent
-        return res
\ No newline at end of file
+        return res
+
+    def release(self):
+        """Отпускает мешок тегов и контекст законченного узла (для свистка они больше не нужны)."""
+        self.bag = None
+        self.heap = None
+        self.stack = None
+        self.context = None
+
+    @property
+    def released(self) -> bool:
+        return self.heap is None
+
+
+@dataclass(eq=False, slots=True)
+class Node(LeanNode):
+    """
+    Узел дерева суперкомпиляции.
+    Поля driven_*/gen_* нужны только для картинки (exporter.to_dot).
+    """
+    driven_from: Optional[Expr] = None
+    driven_rule: Optional[Pattern] = None
+
+    gen_alpha: Optional[Expr] = None   # что было до обобщения
+    gen_beta: Optional[Expr] = None    # на чем свистнули
+    gen_result: Optional[Expr] = None  # во что обобщили
\ No newline at end of file
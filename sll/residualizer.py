@@ -1,20 +1,119 @@
-from typing import List, Dict, Tuple
+import re
+from typing import List, Dict, Optional, Tuple
 from sll.ast_nodes import Program, Rule, Pattern, Expr, Var, Ctr, FCall, IntLit, Let
 from sll.process_tree import Node
-from sll.matching import substitute, match, MatchSuccess
+from sll.matching import substitute, match, MatchSuccess, DiscriminationTree
 from sll.supercompiler import _is_renaming
+from sll.stats import Stats
+
+
+class _OriginalCall(FCall):
+    """Вызов исходной функции из непрогнанного узла: _rewrite_expr его не сворачивает."""
+
+
+def _plain_calls(expr: Expr) -> Expr:
+    match expr:
+        case Ctr(name, args):
+            return Ctr(name, [_plain_calls(a) for a in args], lineno=expr.lineno, tag=expr.tag)
+        case FCall(name, args):
+            return FCall(name, [_plain_calls(a) for a in args], lineno=expr.lineno, tag=expr.tag)
+        case _:
+            return expr
+
+
+def _renamed_calls(expr: Expr, names: Dict[str, str]) -> Expr:
+    match expr:
+        case Ctr(name, args):
+            return Ctr(name, [_renamed_calls(a, names) for a in args], lineno=expr.lineno, tag=expr.tag)
+        case FCall(name, args):
+            return FCall(names.get(name, name), [_renamed_calls(a, names) for a in args],
+                         lineno=expr.lineno, tag=expr.tag)
+        case _:
+            return expr
+
+
+class _SigTable(dict):
+    """
+    node_to_sig вместе с индексом выражений узлов-функций: _rewrite_expr находит
+    функцию вызова одним поиском в дереве распознавания, а не перебором всех функций.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.index = DiscriminationTree()
+
+    def __setitem__(self, node, sig):
+        if node not in self and isinstance(node.expr, FCall):
+            self.index.add(node.expr, node)
+        super().__setitem__(node, sig)
+
+    def __delitem__(self, node):
+        super().__delitem__(node)
+        self.index.remove(node)
+
+    def pop(self, node, *default):
+        self.index.remove(node)
+        return super().pop(node, *default)
+
+    def clear(self):
+        super().clear()
+        self.index = DiscriminationTree()
+
+
+def _occurrences(expr: Expr, name: str) -> int:
+    match expr:
+        case Var(n):
+            return int(n == name)
+        case Ctr(_, args) | FCall(_, args):
+            return sum(_occurrences(a, name) for a in args)
+        case Let(bindings, body):
+            return sum(_occurrences(v, name) for _, v in bindings) + _occurrences(body, name)
+        case _:
+            return 0
+
+
+def _has_call(expr: Expr) -> bool:
+    match expr:
+        case FCall(_, _):
+            return True
+        case Ctr(_, args):
+            return any(_has_call(a) for a in args)
+        case Let(_, _):
+            return True
+        case _:
+            return False
+
+
+def _original_rename(name: str) -> str:
+    if name == "main" or re.fullmatch(r"[fgk]\d+", name):
+        return f"{name}_orig"
+    return name
+
+
+def entry_name(program: Program) -> Optional[str]:
+    """Точка входа остаточной программы: main (лес гиперцикла) или функция первого правила."""
+    if not program.rules:
+        return None
+    if any(r.pattern.name == "main" for r in program.rules):
+        return "main"
+    return program.rules[0].pattern.name
 
 
 class Residualizer:
-    def __init__(self, tree_root: Node, original_program=None):
+    def __init__(self, tree_root: Node, original_program=None, stats: Stats = None):
         self.root = tree_root
         self.original_program = original_program
+        # Счетчики и время резидуализации; обычно — Supercompiler.stats того же запуска
+        self.stats = stats if stats is not None else Stats()
         self.rules: List[Rule] = []
-        self.node_to_sig: Dict[Node, Tuple[str, List[Var]]] = {}
+        self.node_to_sig: Dict[Node, Tuple[str, List[Var]]] = _SigTable()
         self.f_count = 0
         self.g_count = 0
         self.k_count = 0
         self.let_cache: Dict[str, str] = {}
+        # Исходные функции, которые вызываются из непрогнанных (stopped) узлов
+        self.original_calls: Dict[str, str] = {}
+        self.stopped_folds: Dict[Node, Node] = {}   # непрогнанный узел -> предок, на который он свернут
 
     def _rewrite_expr(self, expr: Expr) -> Expr:
         match expr:
@@ -24,16 +123,16 @@ class Residualizer:
             case Ctr(name, args):
                 return Ctr(name, [self._rewrite_expr(a) for a in args], lineno=expr.lineno, tag=expr.tag)
 
+            case _OriginalCall():
+                return expr
+
             case FCall(_, _):
-                for target in self.node_to_sig.keys():
-                    if not isinstance(target.expr, FCall):
-                        continue
-                    if isinstance(expr, FCall) and target.expr.name != expr.name:
-                        continue
+                # первая по порядку регистрации функция, частным случаем которой является вызов
+                self.stats.count("residual.lookups")
+                for target in self.node_to_sig.index.candidates(expr):
                     m = match(target.expr, expr)
-
                     if isinstance(m, MatchSuccess):
-                        return self._call_registered(target, expr)
+                        return self._call_registered(target, expr, m)
 
                 return FCall(expr.name, [self._rewrite_expr(a) for a in expr.args], lineno=expr.lineno, tag=expr.tag)
 
@@ -44,31 +143,34 @@ class Residualizer:
                 # 2) резидуализируем body
                 new_body = self._rewrite_expr(body)
 
-                # 3) кэш, чтобы одинаковые let не плодили 100 функций
+                # 3) кэш, чтобы одинаковые let не плодили 100 функций;
+                #    свободные переменные body (не из let) — тоже параметры k
                 key = str(Let(new_bindings, new_body))
-                if key in self.let_cache:
-                    kname = self.let_cache[key]
-                else:
-                    self.k_count += 1
-                    kname = f"k{self.k_count}"
-                    self.let_cache[key] = kname
-
-                    # k(h1,h2,...) -> body
-                    params = [Var(name) for name, _ in new_bindings]
-                    self.rules.append(Rule(Pattern(kname, params), new_body))
+                bound = {name for name, _ in new_bindings}
+                free = [v for v in self._get_vars(new_body) if v.name not in bound]
+                kname = self._let_function(key, [Var(name) for name, _ in new_bindings] + free, new_body)
 
-                # 4) let ... in ... заменяем на вызов k(e1,e2,...)
-                args = [val for _, val in new_bindings]
+                # 4) let ... in ... заменяем на вызов k(e1,e2,...,свободные переменные)
+                args = [val for _, val in new_bindings] + free
                 return FCall(kname, args, lineno=getattr(expr, "lineno", 0), tag=getattr(expr, "tag", None))
 
             case _:
                 return expr
 
 
-    def _call_registered(self, target: Node, current_expr: Expr) -> Expr:
-        func_name, params = self.node_to_sig[target]
+    def _let_function(self, key: str, params: List[Var], body: Expr) -> str:
+        """Имя k-функции для let с ключом key; k(h1,h2,...) -> body создается при первой встрече."""
+        if key not in self.let_cache:
+            self.k_count += 1
+            self.let_cache[key] = f"k{self.k_count}"
+            self.rules.append(Rule(Pattern(self.let_cache[key], params), body))
+        return self.let_cache[key]
 
-        m = match(target.expr, current_expr)
+    def _call_registered(self, target: Node, current_expr: Expr, m=None) -> Expr:
+        func_name, params = self._sig(target)
+
+        if m is None:
+            m = match(target.expr, current_expr)
         if not isinstance(m, MatchSuccess):
             return FCall(func_name, self._get_vars(current_expr))
 
@@ -76,6 +178,16 @@ class Residualizer:
         return FCall(func_name, args)
 
     def residualize(self) -> Program:
+        with self.stats.timer("residualize"):
+            program = self._residualize()
+        self.stats.count("residual.functions", len(self.node_to_sig))
+        self.stats.count("residual.rules", len(program.rules))
+        return program
+
+    def _sig(self, node: Node) -> Tuple[str, List[Var]]:
+        return self.node_to_sig[node]
+
+    def _residualize(self) -> Program:
         if isinstance(self.root.expr, FCall) and self.root.expr.name == "PROGRAM_FOREST":
             roots = self.root.children
             if not roots:
@@ -95,6 +207,10 @@ class Residualizer:
                         break
 
             entry_name = "main"
+            if start_root not in self.node_to_sig:
+                # корень без ветвлений (например, не прогнанный) — своя функция
+                self._register_func(start_root)
+                self._generate_definition(start_root)
             start_sig_name, start_params = self.node_to_sig[start_root]
             self.rules.insert(
                 0,
@@ -102,6 +218,7 @@ class Residualizer:
                      FCall(start_sig_name, list(start_params)))
             )
 
+            self._finish_original_calls()
             return Program(self.rules, self._original_types(), [])
 
         # обычный режим
@@ -109,6 +226,7 @@ class Residualizer:
         for node in list(self.node_to_sig.keys()):
             self._generate_definition(node)
         self._generate_root_entry()
+        self._finish_original_calls()
         return Program(self.rules, self._original_types(), [])
 
     @staticmethod
@@ -133,8 +251,14 @@ class Residualizer:
                 if ch.back_link:
                     self._register_func(ch.back_link)
             return
+        if node.stopped:
+            target = self._stopped_fold_target(node)
+            if target is not None:
+                self.stopped_folds[node] = target
+                self._register_func(target)
+
         must_be_function = False
-        if node is self.root:
+        if node == self.root:
             must_be_function = True
 
         # G-функция (Ветвление)
@@ -154,20 +278,25 @@ class Residualizer:
 
     def _register_func(self, node: Node):
         if node in self.node_to_sig: return
-        vars_in_expr = self._get_vars(node.expr)
+        is_g, vars_in_expr = self._signature(node)
+        self.node_to_sig[node] = (self._new_name(is_g), vars_in_expr)
+
+    def _signature(self, node: Node) -> Tuple[bool, List[Var]]:
+        """(g-функция ли это, параметры) для функции узла."""
+        vars_in_expr = self._get_vars(self._stopped_source(node) if node.stopped else node.expr)
 
         is_g = any(
             c.contraction and self._is_pattern_contraction(c.contraction)
             for c in node.children
         )
+        return is_g, vars_in_expr
 
+    def _new_name(self, is_g: bool) -> str:
         if is_g:
             self.g_count += 1
-            name = f"g{self.g_count}"
-        else:
-            self.f_count += 1
-            name = f"f{self.f_count}"
-        self.node_to_sig[node] = (name, vars_in_expr)
+            return f"g{self.g_count}"
+        self.f_count += 1
+        return f"f{self.f_count}"
 
     def _generate_definition(self, node: Node):
         name, params = self.node_to_sig[node]
@@ -204,14 +333,13 @@ class Residualizer:
                 self.rules.append(Rule(pat, body))
         else:
             pat = Pattern(name, params)
-            if not node.children:
+            if node.stopped:
+                body = self._stopped_expr(node)
+            elif not node.children:
                 body = self._rewrite_expr(node.expr)
             elif node.children[0].contraction and not self._is_pattern_contraction(node.children[0].contraction):
                 # Generalization case (MSG let-binding)
-                bindings = {}
-                for child in node.children:
-                    bindings[child.contraction.var_name] = self._transform(child)
-                body = self._rewrite_expr(substitute(node.expr, bindings))
+                body = self._let_expr(node)
             elif isinstance(node.expr, Ctr):
                 new_args = [self._transform(c) for c in node.children]
                 body = Ctr(node.expr.name, new_args)
@@ -261,21 +389,157 @@ class Residualizer:
         if node in self.node_to_sig:
             return self._call_registered(node, node.expr)
 
+        if node in self.stopped_folds:
+            return self._call_registered(self.stopped_folds[node], node.expr)
+
+        if node.stopped:
+            return self._stopped_expr(node)
+
+        # обобщение раньше конструктора, как в _generate_definition: у [P v1 v1] дети — let
+        if node.children and node.children[0].contraction and node.children[0].contraction.pattern is None:
+            return self._let_expr(node)
+
         if isinstance(node.expr, Ctr) and node.children:
              new_args = [self._transform(c) for c in node.children]
              return Ctr(node.expr.name, new_args)
 
-        if node.children and node.children[0].contraction and node.children[0].contraction.pattern is None:
-            bindings = {}
-            for c in node.children:
-                bindings[c.contraction.var_name] = self._transform(c)
-            return self._rewrite_expr(substitute(node.expr, bindings))
-
         if len(node.children) == 1:
              return self._transform(node.children[0])
 
         return self._rewrite_expr(node.expr)
 
+    def _let_expr(self, node: Node) -> Expr:
+        """
+        Узел обобщения (MSG): node.expr со значениями let-детей.
+        Значение подставляется, если переменная входит в node.expr не больше раза
+        или значение — данные без вызовов; иначе подстановка размножила бы вычисление,
+        и такие значения остаются let (k-функцией): вычисляются один раз при вызове k.
+        """
+        inline: Dict[str, Expr] = {}
+        shared = []
+        for c in node.children:
+            name, value = c.contraction.var_name, self._transform(c)
+            if _occurrences(node.expr, name) > 1 and _has_call(value):
+                shared.append((name, value))
+            else:
+                inline[name] = value
+        body = substitute(node.expr, inline)
+        if shared:
+            return self._rewrite_expr(Let(shared, body))
+        return self._rewrite_expr(body)
+
+    # --- Непрогнанные узлы (исчерпан бюджет) ---
+
+    @staticmethod
+    def _let_children(node: Node) -> List[Node]:
+        """Дети отложенного обобщения TOP: значения let-переменных узла."""
+        return [c for c in node.children
+                if c.contraction and c.contraction.pattern is None and c.contraction.value is not None]
+
+    @staticmethod
+    def _stopped_fold_target(node: Node):
+        """
+        Предок, частным случаем которого является непрогнанный узел, если между
+        ними был шаг развертки — тогда вызов предка продвигает вычисление, как
+        обычная свертка. Без развертки (или без такого предка) — None.
+        """
+        if not isinstance(node.expr, FCall) or Residualizer._let_children(node):
+            return None
+        progress = False
+        n = node
+        while n.parent is not None:
+            progress = progress or n.unfolded
+            n = n.parent
+            if (progress and isinstance(n.expr, FCall) and n.expr.name == node.expr.name
+                    and isinstance(match(n.expr, node.expr), MatchSuccess)):
+                return n
+        return None
+
+    def _stopped_source(self, node: Node) -> Expr:
+        """Конфигурация непрогнанного узла целиком (let-переменные подставлены)."""
+        bindings = {c.contraction.var_name: c.expr for c in self._let_children(node)}
+        return substitute(node.expr, bindings) if bindings else node.expr
+
+    def _stopped_expr(self, node: Node) -> Expr:
+        """
+        Непрогнанный узел остается выражением над исходной программой.
+        Его вызовы не сворачиваются на функции остаточной программы: _rewrite_expr
+        мог бы свернуть узел на предка без единого шага прогонки (бесконечный цикл).
+        Определения исходных функций допишет _finish_original_calls.
+        """
+        bindings = {c.contraction.var_name: self._transform(c) for c in self._let_children(node)}
+        return self._original_call_expr(node.expr, bindings)
+
+    def _original_call_expr(self, expr: Expr, bindings: Dict[str, Expr]) -> Expr:
+        match expr:
+            case Var(name):
+                return bindings.get(name, expr)
+            case Ctr(name, args):
+                return Ctr(name, [self._original_call_expr(a, bindings) for a in args],
+                           lineno=expr.lineno, tag=expr.tag)
+            case FCall(name, args):
+                return _OriginalCall(self._original_name(name),
+                                     [self._original_call_expr(a, bindings) for a in args],
+                                     lineno=expr.lineno, tag=expr.tag)
+            case Let(let_bindings, body):
+                inner = {name: self._original_call_expr(val, bindings) for name, val in let_bindings}
+                return self._original_call_expr(body, {**bindings, **inner})
+            case _:
+                return expr
+
+    def _original_name(self, name: str) -> str:
+        """Имя исходной функции в остаточной программе (main, fN, gN, kN заняты)."""
+        if name not in self.original_calls:
+            self.original_calls[name] = _original_rename(name)
+        return self.original_calls[name]
+
+    def _finish_original_calls(self):
+        """
+        Дописывает определения исходных функций, достижимых из непрогнанных узлов
+        и из вызовов, которые _rewrite_expr не свернул ни на одну функцию (тела
+        k-функций над непрогнанными узлами), и превращает _OriginalCall обратно в FCall.
+        """
+        if self.original_program is not None:
+            self._adopt_leaked_calls()
+        if self.original_calls and self.original_program is not None:
+            by_name: Dict[str, List[Rule]] = {}
+            for rule in self.original_program.rules:
+                by_name.setdefault(rule.pattern.name, []).append(rule)
+
+            # original_calls пополняется по ходу: тела тоже вызывают исходные функции
+            done = set()
+            while len(done) < len(self.original_calls):
+                name = next(n for n in self.original_calls if n not in done)
+                done.add(name)
+                for rule in by_name.get(name, []):
+                    self.rules.append(Rule(Pattern(self._original_name(name), rule.pattern.params),
+                                           self._original_call_expr(rule.body, {}), lineno=rule.lineno))
+
+        if self.original_calls:
+            self.rules = [Rule(r.pattern, _plain_calls(r.body), lineno=r.lineno) for r in self.rules]
+
+    def _adopt_leaked_calls(self):
+        """Вызовы исходных функций, у которых нет правил в остаточной программе, — в original_calls."""
+        defined = {r.pattern.name for r in self.rules}
+        source = {r.pattern.name for r in self.original_program.rules}
+        leaked: Dict[str, str] = {}
+
+        def visit(e: Expr):
+            match e:
+                case Ctr(_, args):
+                    for a in args:
+                        visit(a)
+                case FCall(name, args):
+                    if not isinstance(e, _OriginalCall) and name not in defined and name in source:
+                        leaked.setdefault(name, self._original_name(name))
+                    for a in args:
+                        visit(a)
+
+        for r in self.rules:
+            visit(r.body)
+        if any(old != new for old, new in leaked.items()):
+            self.rules = [Rule(r.pattern, _renamed_calls(r.body, leaked), lineno=r.lineno) for r in self.rules]
+
     def _original_types(self):
         if self.original_program is not None:
             return self.original_program.types
@@ -0,0 +1,59 @@
+import json
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+# Счетчики и время по фазам суперкомпиляции.
+# Supercompiler, Driver и Residualizer пишут в общий объект Stats:
+#   counters — узлы, шаги, свертки, свистки, обобщения, шаги прогонки по типам...
+#   timers   — суммарное время фаз в секундах (build, drive, fold, whistle,
+#              generalize, msg, residualize, export). Фазы вложены: build
+#              включает drive, fold и т.д., generalize включает msg.
+
+
+class Stats:
+    """Отчет о запуске: счетчики и суммарное время фаз."""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.timers: Dict[str, float] = {}
+        self._open: Dict[str, int] = {}         # фаза -> сколько ее секундомеров сейчас идет
+        self._since: Dict[str, float] = {}      # фаза -> когда открылся первый из них
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+        Секундомер фазы name: with stats.timer("drive"): ...
+        Каждый вызов — свой секундомер. Пока идет хоть один секундомер фазы, время
+        идет один раз: вложенные и перемежающиеся входы (генераторы iter_build) не
+        складывают один и тот же промежуток дважды.
+        """
+        if self._open.get(name, 0) == 0:
+            self._since[name] = time.perf_counter()
+        self._open[name] = self._open.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            self._open[name] -= 1
+            if self._open[name] == 0:
+                self.timers[name] = self.timers.get(name, 0.0) + time.perf_counter() - self._since[name]
+
+    def to_dict(self) -> dict:
+        return {
+            "counters": dict(sorted(self.counters.items())),
+            "timers": {k: round(v, 6) for k, v in sorted(self.timers.items())},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def __getstate__(self):
+        return {"counters": self.counters, "timers": self.timers}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.counters.update(state["counters"])
+        self.timers.update(state["timers"])
@@ -0,0 +1,37 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from sll.process_tree import Node
+
+# События потоковой постройки дерева процессов (Supercompiler.iter_build/aiter_build).
+# В отличие от трассировки (sll/trace.py), события несут сами узлы: потребитель
+# (живой экспорт, индикатор прогресса, поэтапная остаточная программа) читает их
+# между шагами, пока дерево строится. Узлы живые — их поля меняются на следующих шагах;
+# закрытое поддерево (CLOSED) больше не меняется.
+
+CREATED = "created"          # создан узел
+DRIVEN = "driven"            # узел прогнан шагом step (тип шага драйвера)
+FOLDED = "folded"            # узел свернут на target (предка или узел другой ветки)
+GENERALIZED = "generalized"  # узел обобщен по target; в TOP старое поддерево узла выброшено
+STOPPED = "stopped"          # узел остался непрогнанным (исчерпан бюджет)
+CLOSED = "closed"            # поддерево узла закончено и больше не изменится
+DONE = "done"                # построение закончено, node — готовое дерево (или лес)
+
+# Гиперцикл (BOTTOM) при сборке леса обрезает до ссылок (is_basis_ref) ветки,
+# совпадающие с корнями других деревьев, — это уже после CLOSED; итог — в DONE.
+
+
+@dataclass(slots=True)
+class TreeEvent:
+    kind: str
+    node: Node
+    target: Optional[Node] = None
+    step: Optional[str] = None
+
+    def __str__(self):
+        text = f"{self.kind} {self.node.expr}"
+        if self.step is not None:
+            text += f" [{self.step}]"
+        if self.target is not None:
+            text += f" -> {self.target.expr}"
+        return text
@@ -1,14 +1,25 @@
-from typing import Dict, Optional, List
+import asyncio
+import copy
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterator, Optional, List
 
 from sll.ast_nodes import Program, Expr, FCall, TypeExpr, Var, IntLit, Ctr, Let
 from sll.he import he
 from sll.msg import msg, natural_key
-from sll.process_tree import Node, Contraction
+from sll.process_tree import Node, LeanNode, Contraction
 from sll.driver import Driver, TransientStep, DecomposeStep, VariantStep, StopStep, DriveStep, LetStep
-from sll.matching import match, MatchSuccess
+from sll.matching import match, MatchSuccess, renaming_key
 from sll.preprocessor import add_tags, Tagger
 from sll.bag_of_tags import TagBag
 from sll.tagging import TagAllocator
+from sll.process_graph import compact, CompactionStats, SubtreeSharing, SharedNode, _expr_vars
+from sll.tree_store import TreeStore
+from sll.checkpoint import save_checkpoint, load_checkpoint
+from sll.budget import Budget, BudgetMeter
+from sll.trace import Tracer, INFO, DEBUG, TRACE
+from sll.stats import Stats
+from sll.stream import TreeEvent, CREATED, DRIVEN, FOLDED, GENERALIZED, STOPPED, CLOSED, DONE
 
 
 def _find_renaming_ancestor(node: Node) -> Node | None:
@@ -27,6 +38,29 @@ def _remove_children_from_unprocessed(node: Node, unprocessed: list):
         _remove_children_from_unprocessed(child, unprocessed)
 
 
+def _release(node: Node):
+    """
+    Отпускает законченный узел облегченного дерева: мешок тегов, контекст и типы
+    переменных, которых нет в его выражении. Типы всего контекста ветки нужны только
+    при прогонке узла и обобщении (предки незаконченных узлов сами не закончены);
+    остаточной программе и гиперциклу хватает типов переменных выражения.
+    """
+    node.release()
+    types = node.var_types
+    node.var_types = {v: types[v] for v in _expr_vars(node.expr) if v in types}
+
+
+def _subtree_size(node: Node) -> int:
+    """Число узлов в поддереве (по children, без обратных ссылок)."""
+    size = 0
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        size += 1
+        stack.extend(n.children)
+    return size
+
+
 def _is_renaming(t1: Expr, t2: Expr) -> bool:
     """
     Проверяет, является ли t1 переименованием t2.
@@ -37,15 +71,102 @@ def _is_renaming(t1: Expr, t2: Expr) -> bool:
     return isinstance(res1, MatchSuccess) and isinstance(res2, MatchSuccess)
 
 
+class BasisRegistry:
+    """
+    Реестр базисных конфигураций гиперцикла: канонический ключ -> корень дерева.
+    Ключ не зависит от имен переменных ((fab v3) и (fab v7) — одна конфигурация).
+    """
+
+    def __init__(self):
+        self.roots: Dict[str, Node] = {}
+
+    @staticmethod
+    def key(expr: Expr) -> str:
+        key = renaming_key(expr)
+        return key if key is not None else str(expr)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.roots
+
+    def add(self, key: str, root: Node):
+        self.roots[key] = root
+
+
+@dataclass
+class _HypercycleState:
+    """Состояние гиперцикла между деревьями (сохраняется в чекпоинт)."""
+    start_expr: Expr
+    start_var_types: Dict[str, TypeExpr]
+    registry: BasisRegistry = field(default_factory=BasisRegistry)
+    queued: set = field(default_factory=set)       # ключи, уже поставленные в очередь
+    pending: deque = field(default_factory=deque)  # (выражение, типы) в очереди, уже размеченные
+    start_canon: Optional[str] = None
+    started: bool = False
+    finishing: bool = False
+
+
 class Supercompiler:
-    def __init__(self, program: Program, strategy: str = "HE", gen_type: str = "TOP"):
+    def __init__(self, program: Program, strategy: str = "HE", gen_type: str = "TOP",
+                 global_folding: bool = False,
+                 checkpoint_path: Optional[str] = None, checkpoint_every: int = 50,
+                 budget: Optional[Budget] = None, tracer: Optional[Tracer] = None,
+                 lean: bool = False, share_subtrees: bool = False):
         self.program = program
         self.driver = Driver(program)
+        # События построения (sll/trace.py); по умолчанию трассировка выключена
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.driver.tracer = self.tracer
+        # Счетчики и время фаз (sll/stats.py), общие с драйвером
+        self.stats = Stats()
+        self.driver.stats = self.stats
         self.hypercycle_roots: Dict[str, Node] = {}
         self.tree: Optional[Node] = None
         self.strategy = strategy
         self.gen_type = gen_type
 
+        # Глобальная свертка: узел сворачивается не только на предка,
+        # но и на любой уже прогнанный узел дерева с той же конфигурацией.
+        # Дерево процессов становится DAG.
+        self.global_folding = global_folding
+        self._config_index: Dict[str, Node] = {}   # канонический ключ -> первый прогнанный узел
+        self.shared_refs: List[Node] = []          # узлы, свернутые на узлы других веток
+        self.saved_nodes = 0                       # узлы, которые не пришлось строить повторно
+
+        # Чекпоинты: состояние циклов build_tree/run_hypercycle хранится в self
+        # и раз в checkpoint_every шагов сохраняется в checkpoint_path (см. resume).
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+        self._since_checkpoint = 0
+        self._queue: Optional[list] = None                 # очередь текущего build_tree
+        self._steps = 0
+        self._max_steps = 100
+        self._hyper: Optional[_HypercycleState] = None     # текущий гиперцикл
+
+        # Бюджет запуска; счетчик заводится в build_tree/run_hypercycle
+        self.budget = budget if budget is not None else Budget()
+        self._meter = BudgetMeter(self.budget)
+
+        # Облегченный режим: узлы без полей для картинки (LeanNode), а мешки тегов
+        # и heap/stack законченных узлов отпускаются сразу (см. _release_finished).
+        # Остаточная программа та же, что и в обычном режиме.
+        self.lean = lean
+        self._node_cls = LeanNode if lean else Node
+        self._release_early = lean and not global_folding   # глобальная свертка возвращает узлы в очередь
+
+        # Потоковая постройка (iter_build): события шага копятся здесь и отдаются
+        # после шага; _closed — закрытые поддеревья, чьи родители еще не закрыты.
+        self._events: Optional[List[TreeEvent]] = None
+        self._closed: Optional[set] = None
+
+        # Граф процессов во время постройки: закрытое поддерево, совпавшее с уже
+        # закрытым, сразу заменяется ссылкой (sll/process_graph.py, SubtreeSharing).
+        # Только TOP: в BOTTOM лес после гиперцикла еще обрезается (_prune_forest),
+        # его сжимает compact_tree. Глобальная свертка возвращает узлы в очередь — с ней нет.
+        self._sharing: Optional[SubtreeSharing] = None
+        if share_subtrees and gen_type == "TOP" and not global_folding:
+            self._sharing = SubtreeSharing()
+            self._closed = set()
+
         # Если выбрана стратегия TAG, нам нужно один раз разметить всю программу
         self.tag_allocator = None
         if self.strategy == 'TAG':
@@ -54,88 +175,435 @@ class Supercompiler:
 
     def _find_global_root(self, node: Node) -> Node | None:
         """
-        Ищет, совпадает ли узел с одним из корней в лесу базисных конфигураций.
+        Ищет, совпадает ли узел (с точностью до переименования)
+        с одним из корней в лесу базисных конфигураций.
         """
-        for root in self.hypercycle_roots.values():
-            if node is root:
-                continue
-
-            if _is_renaming(node.expr, root.expr):
-                return root
-        return None
+        key = renaming_key(node.expr)
+        if key is None:
+            return None
+        root = self.hypercycle_roots.get(key)
+        if root is node:
+            return None
+        return root
 
-    def build_tree(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr], max_steps:int = 100):
+    def build_tree(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr], max_steps: Optional[int] = None):
         """Строит дерево процессов для заданного выражения.
         start_expr: Начальное выражение для суперкомпиляции.
         start_var_types: Типы переменных начального выражения.
+        max_steps: Предел шагов (по умолчанию budget.max_steps).
+        """
+        if self._hyper is None:
+            self._meter = BudgetMeter(self.budget)
+        if max_steps is None:
+            max_steps = self.budget.max_steps
+        self._start_build(start_expr, start_var_types, max_steps, tag=True)
+        self._drive_queue()
+
+    def _build_tagged(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr]):
+        """build_tree для выражения, которое уже размечено (_tag_basis)."""
+        for _ in self._build_tagged_steps(start_expr, start_var_types):
+            pass
+
+    def _build_tagged_steps(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr]):
+        """_build_tagged по шагам (генератор); возвращает корень дерева."""
+        self._start_build(start_expr, start_var_types, self.budget.max_steps, tag=False)
+        yield from self._drive_steps()
+        return self.tree
+
+    def iter_build(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr]) -> Iterator[TreeEvent]:
+        """
+        Строит дерево (build_tree для TOP, гиперцикл для BOTTOM) и по ходу отдает
+        события построения (sll/stream.py). События шага отдаются после шага, когда
+        дерево согласовано. Последнее событие — DONE с готовым деревом (оно же в self.tree).
+        Строится последовательно: в пуле узлы были бы копиями, а не живыми узлами дерева.
+        С глобальной сверткой закрытые поддеревья могут вернуться в очередь, CLOSED не выдается.
         """
-        if self.strategy == 'TAG' and self.tag_allocator is not None:
+        for events in self._stream(start_expr, start_var_types):
+            yield from events
+
+    async def aiter_build(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr]) -> AsyncIterator[TreeEvent]:
+        """iter_build для asyncio: после каждого шага управление отдается циклу событий."""
+        for events in self._stream(start_expr, start_var_types):
+            for event in events:
+                yield event
+            await asyncio.sleep(0)
+
+    def _stream(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr]):
+        """Потоковая постройка: после каждого шага — список его событий."""
+        self._events = []
+        self._closed = None if self.global_folding else set()
+        try:
+            self._meter = BudgetMeter(self.budget)
+            if self.gen_type == "TOP":
+                self._start_build(start_expr, start_var_types, self.budget.max_steps, tag=True)
+                steps = self._drive_steps()
+            else:
+                self._hyper = _HypercycleState(start_expr, start_var_types)
+                steps = self._hypercycle_steps()
+            for _ in steps:
+                yield self._take_events()
+            self._events.append(TreeEvent(DONE, self.tree))
+            yield self._take_events()
+        finally:
+            self._events = None
+            self._closed = set() if self._sharing is not None else None
+
+    def _take_events(self) -> List[TreeEvent]:
+        events = self._events
+        self._events = []
+        return events
+
+    def _tag_basis(self, expr: Expr):
+        if tag_needed := (self.strategy == 'TAG' and self.tag_allocator is not None):
+            self.tag_allocator.process_expr(expr)
+        return tag_needed
+
+    def _start_build(self, start_expr: Expr, start_var_types: Dict[str, TypeExpr], max_steps: int, tag: bool):
+        if tag:
             # Размечаем и входное выражение тоже, чтобы у него появились теги
-            self.tag_allocator.process_expr(start_expr)
+            self._tag_basis(start_expr)
 
         self.tree = self._create_node(start_expr, start_var_types)
+        if self._closed:
+            self._closed.clear()    # дерево прошлой базисной конфигурации
+        if self._sharing is not None:
+            self._sharing.reset()
+        self._config_index = {}
+        self.shared_refs = []
+        self.saved_nodes = 0
 
         # Очередь необработанных узлов
-        unprocessed = [self.tree]
-        steps = 0
+        self._queue = [self.tree]
+        self._steps = 0
+        self._max_steps = max_steps
+
+    def _drive_queue(self):
+        """Основной цикл build_tree. Его состояние лежит в self, чтобы пережить чекпоинт."""
+        for _ in self._drive_steps():
+            pass
+
+    def _drive_steps(self):
+        """Цикл build_tree по шагам (генератор): yield после каждого шага."""
+        unprocessed = self._queue
         while unprocessed:
-            steps += 1
-            if steps > max_steps:
-                print(f"[STOP] step limit reached: {max_steps}")
-                print(f"[STOP] queue size={len(unprocessed)}")
-                print(f"[STOP] next node would be: {unprocessed[0].expr}")
+            with self.stats.timer("build"):
+                more = self._drive_step(unprocessed)
+            if not more:
                 break
-            beta = unprocessed.pop(0)
+            yield
+
+        with self.stats.timer("build"):
+            self._queue = None
+            if self.lean:
+                stack = [self.tree]
+                while stack:
+                    n = stack.pop()
+                    if isinstance(n, SharedNode):
+                        continue
+                    _release(n)
+                    stack.extend(n.children)
+            if self.global_folding:
+                self.saved_nodes = sum(_subtree_size(ref.back_link) - 1 for ref in self.shared_refs)
+            if self._sharing is not None:
+                # представители выброшенных обобщением поддеревьев и узлы готового дерева
+                self._sharing.reset()
+                self._closed.clear()
+
+    def _drive_step(self, unprocessed: list) -> bool:
+        """Один шаг цикла build_tree. False — бюджет исчерпан."""
+        self._checkpoint_tick()
+        reason = self._budget_exhausted()
+        if reason:
+            if self.tracer.info:
+                self.tracer.emit(INFO, "stop", reason=reason, queue=len(unprocessed),
+                                 next=unprocessed[0].expr)
+            # из этого чекпоинта можно продолжить с большим бюджетом
+            self._save_checkpoint()
+            # Остаток очереди уйдет в остаточную программу вызовами исходной
+            stopped = list(unprocessed)
+            for n in stopped:
+                n.stopped = True
+            self.stats.count("stopped", len(stopped))
+            if self._events is not None:
+                unprocessed.clear()
+                for n in stopped:
+                    self._events.append(TreeEvent(STOPPED, n))
+                    self._release_finished(n, unprocessed)
+            return False
+        beta = unprocessed.pop(0)
+        if self.budget.max_depth is not None and beta.depth > self.budget.max_depth:
+            if self.tracer.info:
+                self.tracer.emit(INFO, "stop", reason="depth limit reached", at=beta.expr)
+            beta.stopped = True
+            self.stats.count("stopped")
+            if self._events is not None:
+                self._events.append(TreeEvent(STOPPED, beta))
+                self._release_finished(beta, unprocessed)
+            return True
+        self._steps += 1
+        self.stats.count("steps")
+        self._process_node(beta, unprocessed)
+        return True
 
-            # --- Шаг А: Свертка (Folding/Renaming) ---
-            # Одинаково для обеих стратегий
-            ancestor = _find_renaming_ancestor(beta)
-            if ancestor:
-                beta.back_link = ancestor
-                print(f"[FOLD] beta={beta.expr}  -> alpha={ancestor.expr}")
-                continue
+    def _budget_exhausted(self) -> Optional[str]:
+        if self._steps + 1 > self._max_steps:
+            return f"step limit reached: {self._max_steps}"
+        return self._meter.exhausted()
 
-            # --- Шаг Б: Прогонка (Driving) ---
-            step = self.driver.drive(beta.expr, beta.var_types)
-            print(f"[DRIVE] at {beta.expr}  step={type(step).__name__}")
+    # --- Чекпоинты ---
 
-            # Если это простое упрощение (TransientStep) — делаем его сразу
-            while isinstance(step, TransientStep):
+    def _checkpoint_tick(self):
+        if self.checkpoint_path is None:
+            return
+        self._since_checkpoint += 1
+        if self._since_checkpoint >= self.checkpoint_every:
+            self._save_checkpoint()
+
+    def _save_checkpoint(self):
+        if self.checkpoint_path is None:
+            return
+        if self._hyper is not None and self._hyper.finishing:
+            return  # сборка леса короткая, ее не сохраняем
+        self._since_checkpoint = 0
+        save_checkpoint(self, self.checkpoint_path)
+        if self.tracer.info:
+            self.tracer.emit(INFO, "checkpoint", path=self.checkpoint_path, steps=self._steps)
+
+    @classmethod
+    def resume(cls, path: str, max_steps: Optional[int] = None,
+               budget: Optional[Budget] = None, tracer: Optional[Tracer] = None) -> 'Supercompiler':
+        """
+        Загружает чекпоинт и доводит прерванный build_tree/run_hypercycle до конца.
+        Результат тот же, что и у непрерванного запуска.
+        max_steps — новый предел шагов для прерванного дерева (если оно упёрлось в старый).
+        budget — новый бюджет на остаток запуска (потраченное время и узлы учитываются).
+        tracer — трассировщик (в чекпоинт он не попадает).
+        """
+        sc = load_checkpoint(path)
+        sc._events = None                   # чекпоинт мог быть записан из iter_build
+        sc._closed = set() if sc._sharing is not None else None
+        if tracer is not None:
+            sc.tracer = sc.driver.tracer = tracer
+        if budget is not None:
+            sc.budget = sc._meter.budget = budget
+            if max_steps is None:
+                max_steps = budget.max_steps
+        if max_steps is not None and sc._queue is not None:
+            sc._max_steps = max_steps
+        if sc._hyper is not None:
+            with sc.stats.timer("hypercycle"):
+                sc._hypercycle_loop(in_progress=sc._queue is not None)
+        elif sc._queue is not None:
+            sc._drive_queue()
+        return sc
+
+    def _process_node(self, beta: Node, unprocessed: list):
+        """Один шаг построения дерева: свертка, прогонка или обобщение узла beta."""
+        # --- Шаг А: Свертка (Folding/Renaming) ---
+        # Одинаково для обеих стратегий
+        with self.stats.timer("fold"):
+            ancestor = _find_renaming_ancestor(beta)
+        if ancestor:
+            beta.back_link = ancestor
+            beta.context = None
+            self.stats.count("folds")
+            if self.tracer.debug:
+                self.tracer.emit(DEBUG, "fold", beta=beta.expr, alpha=ancestor.expr)
+            if self._events is not None:
+                self._events.append(TreeEvent(FOLDED, beta, ancestor))
+            self._release_finished(beta, unprocessed)
+            return
+
+        # --- Шаг Б: Прогонка (Driving) ---
+        with self.stats.timer("drive"):
+            step = self.driver.drive(beta.expr, beta.var_types, beta.context)
+        if self.tracer.debug:
+            self.tracer.emit(DEBUG, "drive", at=beta.expr, step=type(step).__name__)
+
+        # Если это простое упрощение (TransientStep) — делаем его сразу
+        while isinstance(step, TransientStep):
+            if self._events is not None:
+                self._events.append(TreeEvent(DRIVEN, beta, step=type(step).__name__))
+            with self.stats.timer("drive"):
                 self._drive_node_with_step(beta, step, unprocessed)
-                step = self.driver.drive(beta.expr, beta.var_types)
-                print(f"[DRIVE*] at {beta.expr}  step={type(step).__name__}")
+                step = self.driver.drive(beta.expr, beta.var_types, beta.context)
+            if self.tracer.trace:
+                self.tracer.emit(TRACE, "transient", at=beta.plug_focus(), step=type(step).__name__)
                 if self.strategy == "TAG":
-                    print(f"[BAG] expr={beta.expr} bag={beta.bag} heap={len(beta.heap)} stack={len(beta.stack)}")
+                    self.tracer.emit(TRACE, "bag", expr=beta.expr, bag=beta.bag,
+                                     heap=len(beta.heap), stack=len(beta.stack))
+        # Шаги в фокусе меняли только фокус: выражение узла собираем один раз
+        beta.plug_focus()
 
+        with self.stats.timer("fold"):
             ancestor = _find_renaming_ancestor(beta)
-            if ancestor:
-                beta.back_link = ancestor
-                print(f"[FOLD*] beta={beta.expr}  -> alpha={ancestor.expr}")
-                continue
+        if ancestor:
+            beta.back_link = ancestor
+            beta.context = None
+            self.stats.count("folds")
+            if self.tracer.debug:
+                self.tracer.emit(DEBUG, "fold", beta=beta.expr, alpha=ancestor.expr)
+            if self._events is not None:
+                self._events.append(TreeEvent(FOLDED, beta, ancestor))
+            self._release_finished(beta, unprocessed)
+            return
 
-            # --- Шаг В: Свисток (Whistle) ---
-            # Здесь происходит выбор: HE или TAG
+        if self.global_folding:
+            with self.stats.timer("fold"):
+                shared = self._find_shared_config(beta)
+            if shared:
+                beta.back_link = shared
+                beta.context = None
+                self.shared_refs.append(beta)
+                self.stats.count("shares")
+                if self.tracer.debug:
+                    self.tracer.emit(DEBUG, "share", beta=beta.expr, target=shared.expr)
+                if self._events is not None:
+                    self._events.append(TreeEvent(FOLDED, beta, shared))
+                return
+
+        # --- Шаг В: Свисток (Whistle) ---
+        # Здесь происходит выбор: HE или TAG
+        with self.stats.timer("whistle"):
             dangerous_alpha = self._find_embedding_ancestor(beta)
-            if dangerous_alpha:
-                print(f"[WHISTLE] alpha={dangerous_alpha.expr}  beta={beta.expr}  strategy={self.strategy}")
+        if dangerous_alpha:
+            self.stats.count("whistles")
+            if self.tracer.debug:
+                self.tracer.emit(DEBUG, "whistle", alpha=dangerous_alpha.expr, beta=beta.expr,
+                                 strategy=self.strategy, gen_type=self.gen_type)
+            with self.stats.timer("generalize"):
                 if self.gen_type == 'TOP':
-                    print(f"[GEN] alpha={dangerous_alpha.expr}  beta={beta.expr} gen_type={self.gen_type}")
                     did_gen = self._generalize(dangerous_alpha, beta, unprocessed)
                 else:
-                    print(f"[GEN] alpha={dangerous_alpha.expr}  beta={beta.expr} gen_type={self.gen_type}")
                     self._generalize_bottom(dangerous_alpha, beta, unprocessed)
                     did_gen = True
-                if did_gen:
-                    continue
-                # did_gen=False: обобщение отложено, прогоняем beta нормально
+            if did_gen:
+                self.stats.count("generalizations")
+                return
+            # did_gen=False: обобщение отложено, прогоняем beta нормально
 
+        if self._events is not None:
+            self._events.append(TreeEvent(DRIVEN, beta, step=type(step).__name__))
+        with self.stats.timer("drive"):
             self._drive_node_with_step(beta, step, unprocessed)
+        beta.context = None                 # у веток свои контексты
+        self._release_finished(beta, unprocessed)
+        if self.global_folding:
+            self._register_config(beta)
+
+    def _release_finished(self, node: Node, unprocessed: list):
+        """
+        Если поддерево узла закончено (все дети закончены, сам он не в очереди):
+        lean — отпускаем его мешок и контекст, share_subtrees — заменяем ссылкой
+        на такое же закрытое поддерево, iter_build — выдаем CLOSED;
+        затем так же поднимаемся к предкам.
+        Предком обобщаемого узла (alpha) законченный узел быть не может:
+        у alpha есть незаконченный потомок. Узел с детьми попадает в очередь только
+        при обобщении (alpha в TOP, beta в BOTTOM), и всегда в ее начало.
+        """
+        closed = self._closed
+        if closed is None:
+            if not self._release_early:
+                return
+            finished = lambda c: c.released
+        else:
+            finished = closed.__contains__
+        front = unprocessed[0] if unprocessed else None
+        while node is not None and node is not front and all(finished(c) for c in node.children):
+            if self._release_early:
+                _release(node)
+            if closed is not None:
+                # закрытому родителю дети в наборе больше не нужны
+                closed.difference_update(node.children)
+                if self._sharing is not None:
+                    stub = self._sharing.close(node)
+                    if stub is not None:
+                        node = stub
+                        self.stats.count("shared_subtrees")
+                closed.add(node)
+                if self._events is not None:
+                    self._events.append(TreeEvent(CLOSED, node))
+            node = node.parent
+
+    def _msg(self, t1: Expr, t2: Expr):
+        with self.stats.timer("msg"):
+            return msg(t1, t2)
+
+    def _find_shared_config(self, node: Node) -> Node | None:
+        """Ищет уже прогнанный узел (в любой ветке) с той же конфигурацией."""
+        if not isinstance(node.expr, FCall):
+            return None
+        key = renaming_key(node.expr)
+        if key is None:
+            return None
+        return self._config_index.get(key)
+
+    def _register_config(self, node: Node):
+        """Запоминает прогнанный узел как представителя своей конфигурации."""
+        if not isinstance(node.expr, FCall):
+            return
+        key = renaming_key(node.expr)
+        if key is not None and key not in self._config_index:
+            self._config_index[key] = node
+
+    def _unshare_subtree(self, alpha: Node, unprocessed: list):
+        """
+        alpha обобщается, его поддерево выбрасывается.
+        Убираем из индекса alpha и его потомков, а узлы других веток,
+        ссылавшиеся на них, возвращаем в очередь.
+        """
+        removed = set()
+        stack = [alpha]
+        while stack:
+            n = stack.pop()
+            removed.add(id(n))
+            stack.extend(n.children)
+
+        self._config_index = {k: n for k, n in self._config_index.items() if id(n) not in removed}
+
+        kept = []
+        for ref in self.shared_refs:
+            if id(ref) in removed:
+                continue
+            if id(ref.back_link) in removed:
+                ref.back_link = None
+                unprocessed.append(ref)
+                continue
+            kept.append(ref)
+        self.shared_refs = kept
+
+    def compact_tree(self, min_size: int = 2) -> CompactionStats:
+        """
+        Сжимает построенное дерево в граф процессов: повторяющиеся
+        (с точностью до переименования) замкнутые поддеревья хранятся один раз.
+        Вызывается после build_tree/run_hypercycle; остаточная программа не меняется.
+        """
+        return compact(self.tree, min_size=min_size)
+
+    def pack_tree(self) -> TreeStore:
+        """
+        Переносит построенное дерево в параллельные массивы (sll/tree_store.py):
+        self.tree становится видом на корень хранилища, узлы Node освобождаются.
+        Вызывается после build_tree/run_hypercycle; остаточная программа не меняется.
+        """
+        index: Dict[Node, int] = {}
+        store = TreeStore.pack(self.tree, index)
+        self.tree = store.root
+        self.hypercycle_roots = {k: store.node(index[n]) for k, n in self.hypercycle_roots.items()
+                                 if n in index}
+        self.shared_refs = [store.node(index[n]) for n in self.shared_refs]
+        self._config_index = {}
+        return store
 
     def _create_node(self, expr: Expr, var_types: Dict[str, TypeExpr]) -> Node:
         """Создает узел и сразу считает мешок тегов, если нужно."""
-        node = Node(expr, var_types)
+        node = self._node_cls(expr, var_types)
+        self._meter.add_node(expr)
+        self.stats.count("nodes")
         if self.strategy == 'TAG':
             node.bag = TagBag.collect(node)
+        if self._events is not None:
+            self._events.append(TreeEvent(CREATED, node))
         return node
 
     def _drive_node_with_step(self, node: Node, step: DriveStep, unprocessed: list):
@@ -148,14 +616,19 @@ class Supercompiler:
             case LetStep(bindings, body):
                 node.extend_heap(bindings)
                 node.expr = body
+                node.context = None
                 if self.strategy == "TAG":
                     node.bag = TagBag.collect(node)
                 return
 
-            case TransientStep(next_expr, rule_pat):
-                node.driven_from = node.expr
-                node.driven_rule = rule_pat
+            case TransientStep(next_expr, rule_pat, context):
+                if not self.lean:
+                    node.driven_from = node.plug_focus()
+                    node.driven_rule = rule_pat
+                node.unfolded = True
+                # Шаг в фокусе: expr соберется из контекста после серии шагов
                 node.expr = next_expr
+                node.context = context
 
                 if self.strategy == "TAG":
                     node.bag = TagBag.collect(node)
@@ -173,15 +646,18 @@ class Supercompiler:
                         child.bag = TagBag.collect(child)
                     new_children.append(child)
 
-            case VariantStep(branches):
+            case VariantStep(branches, contexts):
                 node.push_frame(getattr(node.expr, "tag", None), kind="CASE")
                 if self.strategy == "TAG":
                     node.bag = TagBag.collect(node)
 
-                for expr_branch, contraction, branch_types, applied_pat in branches:
+                for i, (expr_branch, contraction, branch_types, applied_pat) in enumerate(branches):
                     child = self._create_node(expr_branch, var_types=branch_types)
-                    child.driven_rule = applied_pat
+                    if not self.lean:
+                        child.driven_rule = applied_pat
                     node.add_child(child, contraction)
+                    if contexts is not None:
+                        child.context = contexts[i]
                     if self.strategy == "TAG":
                         child.bag = TagBag.collect(child)
                     new_children.append(child)
@@ -222,7 +698,7 @@ class Supercompiler:
         4. Создаем новых детей для alpha из подстановки (let-binding).
         """
         # 1. Считаем MSG
-        res = msg(alpha.expr, beta.expr)
+        res = self._msg(alpha.expr, beta.expr)
 
         # если TOP не даёт прогресса, уходим в BOTTOM
         if isinstance(res.gen, Var):
@@ -237,6 +713,10 @@ class Supercompiler:
         if _is_renaming(alpha.expr, res.gen):
             if _is_renaming(beta.expr, alpha.expr):
                 beta.back_link = alpha
+                beta.context = None
+                if self._events is not None:
+                    self._events.append(TreeEvent(FOLDED, beta, alpha))
+                    self._release_finished(beta, unprocessed)
                 return True
             return False  # сигнал: обобщение не выполнено, прогнать beta нормально
 
@@ -245,9 +725,12 @@ class Supercompiler:
             self._generalize_bottom(alpha, beta, unprocessed)
             return True
 
-        alpha.gen_alpha = old_alpha_expr
-        alpha.gen_beta = beta.expr
-        alpha.gen_result = res.gen
+        if not self.lean:
+            alpha.gen_alpha = old_alpha_expr
+            alpha.gen_beta = beta.expr
+            alpha.gen_result = res.gen
+        if self._events is not None:
+            self._events.append(TreeEvent(GENERALIZED, alpha, beta))
 
         # 2. Обновляем узел alpha
         # print(f"GENERALIZATION: {alpha.expr} AND {beta.expr} -> {res.gen}")
@@ -263,7 +746,11 @@ class Supercompiler:
             if inferred is not None:
                 alpha.var_types[v_name] = inferred
 
+        if self.global_folding:
+            self._unshare_subtree(alpha, unprocessed)
         _remove_children_from_unprocessed(alpha, unprocessed)
+        if self._closed:
+            self._forget_closed(alpha)
         alpha.children = []  # Очищаем историю (забываем путь, который привел к beta)
         alpha.back_link = None
 
@@ -285,6 +772,14 @@ class Supercompiler:
         unprocessed.insert(0, alpha)
         return True
 
+    def _forget_closed(self, alpha: Node):
+        """Убирает из набора закрытых узлы выброшенного поддерева alpha."""
+        stack = list(alpha.children)
+        while stack:
+            n = stack.pop()
+            self._closed.discard(n)
+            stack.extend(n.children)
+
     def _collect_type_sub(self, template: TypeExpr, actual: TypeExpr, sub: dict):
         """Собирает подстановку типовых параметров: template[param=actual]."""
         if not template.params and template.name[0].islower():
@@ -325,7 +820,7 @@ class Supercompiler:
         строим Let по beta-контексту и возвращаем beta в очередь,
         чтобы driver разложил Let на детей.
         """
-        res = msg(alpha.expr, beta.expr)
+        res = self._msg(alpha.expr, beta.expr)
 
         # Книжный случай: разные головы -> MSG дырка -> делаем контекстный Let по beta
         if isinstance(res.gen, Var) and isinstance(beta.expr, FCall):
@@ -339,11 +834,16 @@ class Supercompiler:
                 bindings.append((h, arg))
                 hole_vars.append(Var(h))
 
-            beta.gen_alpha = alpha.expr
-            beta.gen_beta = beta.expr
-            beta.gen_result = Let(bindings=bindings, body=FCall(f_name, hole_vars))
+            let_expr = Let(bindings=bindings, body=FCall(f_name, hole_vars))
+            if not self.lean:
+                beta.gen_alpha = alpha.expr
+                beta.gen_beta = beta.expr
+                beta.gen_result = let_expr
+            if self._events is not None:
+                self._events.append(TreeEvent(GENERALIZED, beta, alpha))
 
-            beta.expr = beta.gen_result
+            beta.expr = let_expr
+            beta.context = None
             if self.strategy == "TAG":
                 beta.bag = TagBag.collect(beta)
 
@@ -351,15 +851,19 @@ class Supercompiler:
             return
 
         # Обычный путь (MSG сохраняет структуру)
-        beta.gen_alpha = alpha.expr
-        beta.gen_beta = beta.expr
-        beta.gen_result = res.gen
+        if not self.lean:
+            beta.gen_alpha = alpha.expr
+            beta.gen_beta = beta.expr
+            beta.gen_result = res.gen
+        if self._events is not None:
+            self._events.append(TreeEvent(GENERALIZED, beta, alpha))
 
         bindings = []
         for v_name in sorted(res.sub2.keys(), key=natural_key):
             bindings.append((v_name, res.sub2[v_name]))
 
         beta.expr = Let(bindings=bindings, body=res.gen)
+        beta.context = None
 
         if self.strategy == "TAG":
             beta.bag = TagBag.collect(beta)
@@ -374,50 +878,81 @@ class Supercompiler:
         Ключевой момент: конфигурации идентифицируются по КАНОНИЧЕСКОМУ корню
         (после нормализации/прогонки внутри build_tree).
         """
+        self._hyper = _HypercycleState(start_expr, start_var_types)
+        self._meter = BudgetMeter(self.budget)
+        with self.stats.timer("hypercycle"):
+            self._hypercycle_loop()
 
-        processed_configs: dict[str, Node] = {}
-
-        queue: list[tuple[Expr, dict]] = [(start_expr, start_var_types)]
-
-        start_canon: str | None = None
-
-        while queue:
-            current_expr, current_types = queue.pop(0)
-
-            # 1) Строим дерево для текущего выражения
-            self.build_tree(current_expr, current_types)
+    def _hypercycle_loop(self, in_progress: bool = False):
+        """
+        Цикл гиперцикла по очереди базисных конфигураций.
+        in_progress: дерево очередной конфигурации прервано чекпоинтом и его надо достроить.
+        """
+        for _ in self._hypercycle_steps(in_progress):
+            pass
+
+    def _hypercycle_steps(self, in_progress: bool = False):
+        """_hypercycle_loop по шагам построения деревьев (генератор)."""
+        h = self._hyper
+        processed_configs = h.registry
+
+        if not h.started:
+            h.queued.add(processed_configs.key(h.start_expr))
+            self._tag_basis(h.start_expr)
+            h.pending.append((h.start_expr, h.start_var_types))
+            h.started = True
+
+        while in_progress or h.pending:
+            self._checkpoint_tick()
+
+            # 1) Строим (или получаем готовое) дерево для очередной конфигурации
+            if in_progress:
+                yield from self._drive_steps()
+                in_progress = False
+            else:
+                expr, var_types = h.pending.popleft()
+                self.tree = yield from self._build_tagged_steps(expr, var_types)
 
             # 2) Канонический ключ = фактический корень после прогонки/нормализации
-            canon = str(self.tree.expr)
+            canon = processed_configs.key(self.tree.expr)
 
             # запоминаем канон старта (важно для add3!)
-            if start_canon is None and _is_renaming(self.tree.expr, start_expr):
-                start_canon = canon
+            if h.start_canon is None and _is_renaming(self.tree.expr, h.start_expr):
+                h.start_canon = canon
 
             # 3) Если уже обработано — ничего не делаем
             if canon in processed_configs:
                 continue
 
-            print(f"  Hypercycle: processing config {canon}")
-            processed_configs[canon] = self.tree
+            if self.tracer.info:
+                self.tracer.emit(INFO, "hypercycle", config=self.tree.expr)
+            processed_configs.add(canon, self.tree)
+            self.stats.count("basis_configs")
 
-            # 4) Собираем базисные конфигурации (цели backlink'ов) и добавляем в очередь
+            # 4) Собираем базисные конфигурации (цели backlink'ов) и добавляем в очередь.
+            # Выражение копируем: build_tree переразмечает его теги,
+            # и это не должно задевать уже построенное дерево.
             for base_node in self._find_all_backlink_targets(self.tree):
-                b_canon = str(base_node.expr)
-                if b_canon not in processed_configs:
-                    queue.append((base_node.expr, base_node.var_types))
+                b_canon = processed_configs.key(base_node.expr)
+                if b_canon not in processed_configs and b_canon not in h.queued:
+                    h.queued.add(b_canon)
+                    expr = copy.deepcopy(base_node.expr)
+                    self._tag_basis(expr)
+                    h.pending.append((expr, base_node.var_types))
+
+        h.finishing = True
 
         # 5) Фиксируем лес
-        self.hypercycle_roots = processed_configs
+        self.hypercycle_roots = processed_configs.roots
 
         # 6) Выбираем стартовый корень корректно:
         # если start_canon не нашёлся (редко), берём корень по канону после build_tree(start_expr)
-        if start_canon is None:
+        if h.start_canon is None:
             # пересоберём один раз, чтобы узнать канон старта
-            self.build_tree(start_expr, start_var_types)
-            start_canon = str(self.tree.expr)
+            self.build_tree(h.start_expr, h.start_var_types)
+            h.start_canon = processed_configs.key(self.tree.expr)
 
-        self.tree = self.hypercycle_roots[start_canon]
+        self.tree = self.hypercycle_roots[h.start_canon]
 
         # 7) Обрезаем ссылки на другие корни и собираем PROGRAM_FOREST
         self._prune_forest()
@@ -428,13 +963,15 @@ class Supercompiler:
             forest_root.add_child(root_node)
 
         self.tree = forest_root
+        self._hyper = None
 
     def _prune_forest(self):
         """
         Проходит по всем построенным деревьям и обрезает ветки,
         которые совпадают с корнями других деревьев.
         """
-        print("--- Pruning Forest ---")
+        if self.tracer.info:
+            self.tracer.emit(INFO, "prune", roots=len(self.hypercycle_roots))
         for root_node in self.hypercycle_roots.values():
             self._prune_node_recursive(root_node)
 
@@ -452,14 +989,18 @@ class Supercompiler:
             self._prune_node_recursive(child)
 
     def _find_all_backlink_targets(self, root: Node) -> List[Node]:
-        """Собирает все узлы, на которые КТО-ТО ссылается через back_link."""
-        targets = set()
+        """
+        Собирает все узлы, на которые КТО-ТО ссылается через back_link.
+        Порядок — порядок первой ссылки при обходе дерева, чтобы очередь
+        гиперцикла (и лес) не зависели от адресов объектов.
+        """
+        targets: Dict[Node, None] = {}
 
         def collect(node: Node):
             if node.back_link:
-                targets.add(node.back_link)
+                targets.setdefault(node.back_link)
             for child in node.children:
                 collect(child)
 
         collect(root)
-        return list(targets)
\ No newline at end of file
+        return list(targets)
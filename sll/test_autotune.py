@@ -0,0 +1,106 @@
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.autotune import autotune, share_budget, CANDIDATES
+from sll.budget import Budget
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (mul [Nat] [Nat]) -> [Nat] :
+    (mul [Z] y) -> [Z]
+  | (mul [S x] y) -> (add (mul x y) y) .
+"""
+
+EQ = """
+type [Bool] : True | False .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+# без времени: выбор не зависит от машины
+NO_TIME = {"cost": 1.0, "nodes": 0.05, "time": 0.0}
+
+
+def _expr(text):
+    return Parser(tokenize(text)).parse_expr()
+
+
+class TestAutotune(unittest.TestCase):
+
+    def setUp(self):
+        self.prog = parse(CODE)
+        self.nat = TypeExpr("Nat", [])
+
+    def test_1_cheapest_residual_wins(self):
+        result = autotune(self.prog, _expr("(add (add a b) c)"), {v: self.nat for v in "abc"},
+                          weights=NO_TIME)
+        self.assertEqual(len(result.candidates), len(CANDIDATES))
+        costs = [c.cost for c in result.candidates if c.cost is not None]
+        self.assertEqual(result.best.cost, min(costs))
+        self.assertIs(result.best, result.candidates[0])
+        self.assertIsNotNone(result.best.residual)
+        scores = [c.score for c in result.candidates if c.cost is not None]   # неоцененные — в конце
+        self.assertEqual(scores, sorted(scores))
+        self.assertIn(f"{result.best.name} wins", result.summary())
+
+    def test_2_reason_names_decisive_metric(self):
+        result = autotune(self.prog, _expr("(add a b)"), {"a": self.nat, "b": self.nat}, weights=NO_TIME)
+        best, runner = result.candidates[:2]
+        self.assertIn(runner.name, result.reason())
+        if best.cost != runner.cost:
+            self.assertIn(f"{best.cost} estimated reductions vs {runner.cost}", result.reason())
+        elif best.nodes != runner.nodes:
+            self.assertIn(f"{best.nodes} tree nodes vs {runner.nodes}", result.reason())
+        else:
+            self.assertIn("ties", result.reason())
+
+    def test_3_shared_budget(self):
+        budget = Budget(max_steps=50, max_seconds=8.0, max_nodes=1000, max_memory_mb=100.0)
+        share = share_budget(budget, 4, 1)
+        self.assertEqual((share.max_steps, share.max_seconds, share.max_nodes, share.max_memory_mb),
+                         (50, 2.0, 250, 25.0))
+        self.assertEqual(share_budget(budget, 4, 4).max_seconds, 8.0)
+        self.assertEqual(share_budget(budget, 4, 2).max_seconds, 4.0)
+        self.assertIsNone(share_budget(Budget(), 4, 1).max_seconds)
+
+    def test_4_parallel_same_choice(self):
+        expr = _expr("(mul a b)")
+        types = {"a": self.nat, "b": self.nat}
+        sequential = autotune(self.prog, expr, types, weights=NO_TIME)
+        parallel = autotune(self.prog, expr, types, workers=2, weights=NO_TIME)
+        self.assertEqual([c.name for c in parallel.candidates], [c.name for c in sequential.candidates])
+        self.assertEqual(str(parallel.best.residual), str(sequential.best.residual))
+
+    def test_5_wrong_residual_dropped(self):
+        """TAG/TOP на (mul a b) дает неверную программу: она выбывает, какой бы дешевой ни была."""
+        result = autotune(self.prog, _expr("(mul a b)"), {"a": self.nat, "b": self.nat}, weights=NO_TIME)
+        wrong = next(c for c in result.candidates if c.name == "TAG/TOP")
+        self.assertTrue(wrong.error.startswith("wrong result on (mul "))
+        self.assertIs(result.candidates[-1], wrong)
+        self.assertIsNone(result.best.error)
+        self.assertIn("TAG/TOP", result.summary())
+        # кандидаты размечали свои копии, а не программу вызывающего
+        self.assertTrue(all(r.body.tag is None for r in self.prog.rules))
+
+    def test_6_check_by_value(self):
+        """
+        По имени (eq (add a b) (add b a)) дает [False] правилом (eq x y), не вычисляя
+        аргументов; остаточная программа дает [True], как и вычисление по значению.
+        """
+        prog = parse(CODE + EQ)
+        result = autotune(prog, _expr("(eq (add a b) (add b a))"), {"a": self.nat, "b": self.nat},
+                          weights=NO_TIME)
+        self.assertTrue(all(c.error is None for c in result.candidates), result.summary())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.budget import Budget
+from sll.trace import Tracer, ListSink, INFO
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+
+fun (main [Nat]) -> [Nat] :
+    (main x) -> (add x x) .
+"""
+
+ORIGINAL_EQ_ADD = [
+    "(eq [Z] [Z]) -> [True]",
+    "(eq [S x] [S y]) -> (eq x y)",
+    "(eq x y) -> [False]",
+    "(add [Z] y) -> y",
+    "(add [S x] y) -> [S (add x y)]",
+]
+
+
+class TestBudget(unittest.TestCase):
+
+    def setUp(self):
+        self.prog = parse(CODE)
+        self.nat = TypeExpr("Nat", [])
+
+    def run_sc(self, expr_text, var_names, budget, gen_type="TOP", strategy="HE"):
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        var_types = {v: self.nat for v in var_names}
+        sink = ListSink()
+        sc = Supercompiler(self.prog, strategy=strategy, gen_type=gen_type, budget=budget,
+                           tracer=Tracer(sink, INFO))
+        if gen_type == "TOP":
+            sc.build_tree(start_expr, var_types)
+        else:
+            sc.run_hypercycle(start_expr, var_types)
+        rules = [str(r).rstrip(";") for r in Residualizer(sc.tree, self.prog).residualize().rules]
+        stops = [fields for _, event, fields in sink.events if event == "stop"]
+        return sc, rules, stops
+
+    def test_1_step_limit(self):
+        """Корень не успел прогнаться: остаточная программа — вызов исходной."""
+        sc, rules, stops = self.run_sc("(eq (add a b) c)", "abc", Budget(max_steps=3))
+        self.assertEqual(stops[0]["reason"], "step limit reached: 3")
+        self.assertEqual(rules[0], "(f1 a b c) -> (eq (add a b) c)")
+        self.assertCountEqual(rules[1:], ORIGINAL_EQ_ADD)
+
+    def test_2_node_limit_no_self_fold(self):
+        """Непрогнанная ветка не сворачивается на свою же функцию (бесконечный цикл)."""
+        sc, rules, stops = self.run_sc("(eq (add a b) c)", "abc", Budget(max_nodes=5), gen_type="BOTTOM")
+        self.assertEqual(stops[0]["reason"], "node limit reached: 5")
+        self.assertIn("(g1 [S v1] b c) -> (eq (add [S v1] b) c)", rules)
+        for r in ORIGINAL_EQ_ADD:
+            self.assertIn(r, rules)
+
+    def test_3_depth_limit(self):
+        """Глубокие узлы не прогоняются, остальные ветки строятся как обычно."""
+        sc, rules, stops = self.run_sc("(eq (add a b) c)", "abc", Budget(max_depth=2))
+        self.assertEqual(stops, [{"reason": "depth limit reached", "at": "(add v7 b)"}])
+        self.assertIn("(g1 [S v5] [S v6]) -> (g1 v5 v6)", rules)
+        self.assertIn("(g2 [S v7] b) -> [S (add v7 b)]", rules)
+        self.assertNotIn("(eq x y) -> [False]", rules)  # eq не нужна
+
+    def test_4_time_limit(self):
+        sc, rules, stops = self.run_sc("(add a b)", "ab", Budget(max_seconds=0))
+        self.assertTrue(stops[0]["reason"].startswith("time limit reached"))
+        self.assertTrue(sc.tree.stopped)
+        self.assertEqual(rules[0], "(f1 a b) -> (add a b)")
+
+    def test_5_original_name_clash(self):
+        """Исходная main не путается с точкой входа остаточной программы."""
+        sc, rules, _ = self.run_sc("(main a)", "a", Budget(max_nodes=0), gen_type="BOTTOM")
+        self.assertEqual(rules[:2], ["(main a) -> (f1 a)", "(f1 a) -> (main_orig a)"])
+        self.assertIn("(main_orig x) -> (add x x)", rules)
+
+    def test_6_memory_limit(self):
+        sc, rules, stops = self.run_sc("(eq (add a b) c)", "abc", Budget(max_memory_mb=0.001))
+        self.assertTrue(stops[0]["reason"].startswith("memory limit reached"))
+        self.assertGreater(sc._meter.bytes, 1024)
+
+    def test_7_depth_kept_on_nodes(self):
+        """Глубина записана в узле при создании и совпадает с расстоянием до корня."""
+        sc, _, _ = self.run_sc("(eq (add a b) c)", "abc", Budget(max_depth=4))
+        stack = [sc.tree]
+        while stack:
+            n = stack.pop()
+            self.assertEqual(n.depth, len(n.ancestors()))
+            stack.extend(n.children)
+
+    def test_8_originals_behind_let(self):
+        """
+        Непрогнанное тело let (TAG/BOTTOM) становится телом k-функции с вызовами
+        исходных функций: их определения тоже попадают в остаточную программу.
+        """
+        _, rules, _ = self.run_sc("(eq (add (add a b) c) (add a (add b c)))", "abc", Budget(),
+                                  gen_type="BOTTOM", strategy="TAG")
+        self.assertTrue(any(r.startswith("(k1 ") and "(eq (add" in r for r in rules))
+        for r in ORIGINAL_EQ_ADD:
+            self.assertIn(r, rules)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import time
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.cache import SupercompilationCache, supercompile, cache_key
+from sll.exporter import to_dot
+from sll.ast_nodes import TypeExpr
+from sll.budget import Budget
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+"""
+
+
+class TestSupercompilationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = os.path.join(self.tmp.name, "cache")
+        self.nat = TypeExpr("Nat", [])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_sc(self, cache, expr_text="(add (add a b) c)", strategy="HE", gen_type="TOP"):
+        prog = parse(CODE)
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        var_types = {v: self.nat for v in ("a", "b", "c", "v1") if v in expr_text}
+        return supercompile(prog, start_expr, var_types, strategy=strategy,
+                            gen_type=gen_type, cache=cache)
+
+    def test_1_hit_returns_same_result(self):
+        cache = SupercompilationCache(self.dir)
+        tree1, res1, sc1 = self.run_sc(cache)
+        self.assertIsNotNone(sc1)
+
+        # Новый объект кэша — как новый запуск main.py
+        cache2 = SupercompilationCache(self.dir)
+        tree2, res2, sc2 = self.run_sc(cache2)
+        self.assertIsNone(sc2)
+        self.assertEqual(cache2.hits, 1)
+        self.assertEqual(str(res2), str(res1))
+        self.assertEqual(to_dot(tree2), to_dot(tree1))
+
+    def test_2_key_depends_on_settings(self):
+        prog = parse(CODE)
+        expr = Parser(tokenize("(add a b)")).parse_expr()
+        types = {"a": self.nat, "b": self.nat}
+        base = cache_key(prog, expr, types)
+        self.assertEqual(cache_key(parse(CODE), Parser(tokenize("(add a b)")).parse_expr(), types), base)
+        self.assertNotEqual(cache_key(prog, expr, types, strategy="TAG"), base)
+        self.assertNotEqual(cache_key(prog, expr, types, gen_type="BOTTOM"), base)
+        # с точностью до переименования — тот же ключ; (add a a) — другой
+        self.assertEqual(cache_key(prog, Parser(tokenize("(add b a)")).parse_expr(), types), base)
+        self.assertNotEqual(cache_key(prog, Parser(tokenize("(add a a)")).parse_expr(), types), base)
+        self.assertNotEqual(cache_key(prog, expr, {"a": self.nat, "b": TypeExpr("Bool", [])}), base)
+
+        cache = SupercompilationCache(self.dir)
+        self.run_sc(cache)
+        _, _, sc = self.run_sc(cache, strategy="TAG")
+        self.assertIsNotNone(sc)
+        self.assertEqual(len(cache), 2)
+
+    def test_3_lru_eviction(self):
+        cache = SupercompilationCache(self.dir)
+        self.run_sc(cache, "(add a b)")
+        one = cache.size()
+
+        # Помещаются ровно две записи
+        cache.max_bytes = int(one * 2.5)
+        time.sleep(0.01)
+        self.run_sc(cache, "(add [S a] b)")
+        time.sleep(0.01)
+        self.run_sc(cache, "(add a b)")         # попадание: запись становится свежей
+        time.sleep(0.01)
+        self.run_sc(cache, "(add a [S b])")     # вытесняет (add [S a] b)
+
+        self.assertEqual(len(cache), 2)
+        _, _, sc = self.run_sc(cache, "(add a b)")
+        self.assertIsNone(sc)
+        _, _, sc = self.run_sc(cache, "(add [S a] b)")
+        self.assertIsNotNone(sc)
+
+    def test_4_renamed_hit(self):
+        """(add b a) после (add a b) — попадание, дерево и программа в именах b, a."""
+        cache = SupercompilationCache(self.dir)
+        self.run_sc(cache, "(add a b)")
+        tree, res, sc = self.run_sc(cache, "(add b a)")
+        self.assertIsNone(sc)
+        self.assertEqual(cache.hits, 1)
+
+        fresh_tree, fresh_res, _ = self.run_sc(None, "(add b a)")
+        self.assertEqual(str(res), str(fresh_res))
+        self.assertEqual(to_dot(tree), to_dot(fresh_tree))
+
+        # новое имя совпало бы со свежей переменной дерева: строим заново
+        _, _, sc = self.run_sc(cache, "(add v1 a)")
+        self.assertIsNotNone(sc)
+
+        # правила add, дописанные для непрогнанных узлов, — в своих именах x, y,
+        # хотя старт переименован x -> y
+        prog, budget = parse(CODE), Budget(max_steps=1)
+        for text in ("(add (add x b) x)", "(add (add y b) y)"):
+            start_expr = Parser(tokenize(text)).parse_expr()
+            types = {v: self.nat for v in ("b", "x", "y") if v in text}
+            _, res, sc = supercompile(prog, start_expr, types, budget=budget, cache=cache)
+            _, fresh_res, _ = supercompile(prog, start_expr, types, budget=budget)
+            self.assertEqual(str(res), str(fresh_res))
+        self.assertIsNone(sc)
+        self.assertIn("(add [S x] y) -> [S (add x y)]", str(res))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import sll.supercompiler as supercompiler
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.checkpoint import save_checkpoint
+from sll.exporter import to_dot
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "run.ckpt")
+        self.nat = TypeExpr("Nat", [])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_sc(self, expr_text, var_names, strategy="HE", gen_type="TOP", max_steps=100, **kw):
+        prog = parse(CODE)
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        var_types = {v: self.nat for v in var_names}
+        sc = Supercompiler(prog, strategy=strategy, gen_type=gen_type, **kw)
+        if gen_type == "TOP":
+            sc.build_tree(start_expr, var_types, max_steps=max_steps)
+        else:
+            sc.run_hypercycle(start_expr, var_types)
+        return sc
+
+    @staticmethod
+    def result(sc):
+        return str(Residualizer(sc.tree, sc.program).residualize()), to_dot(sc.tree, dev_mode=True)
+
+    def resume(self, path, **kw):
+        return Supercompiler.resume(path, **kw)
+
+    def assert_resumes_everywhere(self, expr_text, var_names, **kw):
+        """Продолжение с любого из промежуточных чекпоинтов дает тот же результат."""
+        expected = self.result(self.run_sc(expr_text, var_names, **kw))
+
+        snapshots = []
+
+        def keep(sc, path):
+            save_checkpoint(sc, path)
+            snapshots.append(f"{path}.{len(snapshots)}")
+            shutil.copy(path, snapshots[-1])
+
+        with mock.patch.object(supercompiler, "save_checkpoint", keep):
+            sc = self.run_sc(expr_text, var_names, checkpoint_path=self.path, checkpoint_every=2, **kw)
+        self.assertEqual(self.result(sc), expected)
+        self.assertGreater(len(snapshots), 1)
+
+        for snap in snapshots:
+            self.assertEqual(self.result(self.resume(snap)), expected, snap)
+
+    def test_1_build_tree(self):
+        for strategy in ("HE", "TAG"):
+            self.assert_resumes_everywhere("(add (add a b) c)", ["a", "b", "c"], strategy=strategy)
+
+    def test_2_hypercycle(self):
+        expr = "(eq (add (add a b) c) (add a (add b c)))"
+        self.assert_resumes_everywhere(expr, ["a", "b", "c"], gen_type="BOTTOM")
+        self.assert_resumes_everywhere(expr, ["a", "b", "c"], gen_type="BOTTOM", strategy="TAG")
+
+    def test_3_resume_after_step_limit(self):
+        """Упёрлись в max_steps — продолжаем с большим пределом, как будто его и не было."""
+        expected = self.result(self.run_sc("(eq (add a b) c)", ["a", "b", "c"]))
+        self.run_sc("(eq (add a b) c)", ["a", "b", "c"], max_steps=4, checkpoint_path=self.path)
+        self.assertEqual(self.result(self.resume(self.path, max_steps=100)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
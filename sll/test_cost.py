@@ -0,0 +1,139 @@
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.cache import supercompile
+from sll.cost import Cost, CostModel, CostUnknown, estimate, cost_table, recurrences, residual_call
+from sll.interpreter import evaluate
+from sll.matching import substitute
+from sll.stats import Stats
+from sll.ast_nodes import Ctr, TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+type [List a] : Nil | Cons a [List a] .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+
+fun (double [Nat]) -> [Nat] :
+    (double x) -> (add x x) .
+
+fun (first [Nat] [Nat]) -> [Nat] :
+    (first x y) -> x .
+
+fun (len [List Nat]) -> [Nat] :
+    (len [Nil]) -> [Z]
+  | (len [Cons h t]) -> [S (len t)] .
+
+fun (addAcc [Nat] [Nat]) -> [Nat] :
+    (addAcc [Z] y) -> y
+  | (addAcc [S x] y) -> (addAcc x [S y]) .
+
+fun (mul [Nat] [Nat]) -> [Nat] :
+    (mul [Z] y) -> [Z]
+  | (mul [S x] y) -> (add (mul x y) y) .
+"""
+
+
+def _expr(text):
+    return Parser(tokenize(text)).parse_expr()
+
+
+def _nat(n):
+    return Ctr("Z", []) if n == 0 else Ctr("S", [_nat(n - 1)])
+
+
+def _measure(program, expr, values):
+    stats = Stats()
+    result, _ = evaluate(substitute(expr, values), program, stats=stats)
+    return result, Cost(stats.counters["interpreter.steps"], stats.counters["interpreter.allocs"])
+
+
+class TestCost(unittest.TestCase):
+
+    def setUp(self):
+        self.prog = parse(CODE)
+
+    def test_1_linear_in_size(self):
+        """add: n+1 редукций и n конструкторов, как у интерпретатора."""
+        table = cost_table(self.prog, _expr("(add a b)"), list(range(6)))
+        self.assertEqual(table, [Cost(n + 1, n) for n in range(6)])
+        for n in range(6):
+            _, measured = _measure(self.prog, _expr("(add a b)"), {"a": _nat(n), "b": _nat(n)})
+            self.assertEqual(table[n], measured)
+
+    def test_2_call_by_name(self):
+        """Аргумент, которым не пользуются, ничего не стоит; размноженный — по разу на копию."""
+        self.assertEqual(estimate(self.prog, _expr("(first a (add a a))"), {"a": 3}), Cost(1, 0))
+        cost = estimate(self.prog, _expr("(double (add a a))"), {"a": 2})
+        _, measured = _measure(self.prog, _expr("(double (add a a))"), {"a": _nat(2)})
+        self.assertEqual(cost, measured)
+        self.assertGreater(cost.reductions, 1 + 2 * estimate(self.prog, _expr("(add a a)"), {"a": 2}).reductions)
+
+    def test_3_rule_choice_like_interpreter(self):
+        """(eq x y) -> [False] подходит к невычисленным аргументам раньше, чем они вычисляются."""
+        expr = _expr("(eq (add a [S [Z]]) (add [S [Z]] a))")
+        for n in range(4):
+            _, measured = _measure(self.prog, expr, {"a": _nat(n)})
+            self.assertEqual(estimate(self.prog, expr, {"a": n}), measured)
+            self.assertEqual(measured.reductions, 1)
+
+    def test_4_lists(self):
+        """Размер списка — длина; элементы раскрываются только образцом."""
+        self.assertEqual(cost_table(self.prog, _expr("(len xs)"), [0, 3]), [Cost(1, 1), Cost(4, 4)])
+
+    def test_5_unknown(self):
+        self.assertIsNone(estimate(self.prog, _expr("(add a b)"), {"a": 1}))      # b без размера
+        self.assertIsNone(estimate(self.prog, _expr("(mult a a)"), {"a": 1}))     # нет правил
+
+    def test_6_residual_programs_match_interpreter(self):
+        nat = TypeExpr("Nat", [])
+        checked = 0
+        for text in ("(add (add a b) c)", "(eq (add a b) (add b a))", "(double (add a b))"):
+            names = [v for v in ("a", "b", "c") if v in text]
+            for strategy in ("HE", "TAG"):
+                for gen_type in ("TOP", "BOTTOM"):
+                    _, residual, _ = supercompile(self.prog, _expr(text), {v: nat for v in names},
+                                                  strategy=strategy, gen_type=gen_type)
+                    call = residual_call(residual, names)
+                    table = cost_table(residual, call, list(range(4)), names)
+                    for n, cost in enumerate(table):
+                        result, measured = _measure(residual, call, {v: _nat(n) for v in names})
+                        if cost is None or not isinstance(result, Ctr):
+                            continue
+                        with self.subTest(expr=text, strategy=strategy, gen_type=gen_type, n=n):
+                            self.assertEqual(cost, measured)
+                            checked += 1
+        self.assertGreater(checked, 20)
+
+    def test_7_recurrences(self):
+        """Рекуррентности выводятся один раз; размер в тысячу — без исполнения и без предела глубины."""
+        rec = recurrences(self.prog, _expr("(add a b)"), ["a", "b"])
+        self.assertIn("(add n0 n1) = 1/0 if n0=0 | 1/1 + (add n0-1 n1) if n0>=1", str(rec))
+        self.assertEqual(rec.cost({"a": 1000, "b": 3}), Cost(1001, 1000))
+        with self.assertRaises(CostUnknown):      # абстрактное исполнение упирается в max_depth
+            CostModel(self.prog).estimate(_expr("(add a b)"), {"a": 1000, "b": 3})
+        # накапливающий параметр: [S y] снова вход размера n1+1, шаблон один
+        rec = recurrences(self.prog, _expr("(addAcc a b)"), ["a", "b"])
+        self.assertEqual(len(rec.templates), 1)
+        for n in range(5):
+            _, measured = _measure(self.prog, _expr("(addAcc a b)"), {"a": _nat(n), "b": _nat(n)})
+            self.assertEqual(rec.cost({"a": n, "b": n}), measured)
+
+    def test_8_recursive_head_falls_back(self):
+        """Образец add требует голову (mul x y): рекуррентностей нет, оценивает CostModel."""
+        self.assertIsNone(recurrences(self.prog, _expr("(mul a b)"), ["a", "b"]))
+        for n in range(4):
+            _, measured = _measure(self.prog, _expr("(mul a b)"), {"a": _nat(n), "b": _nat(n)})
+            self.assertEqual(estimate(self.prog, _expr("(mul a b)"), {"a": n, "b": n}), measured)
+
+
+if __name__ == '__main__':
+    unittest.main()
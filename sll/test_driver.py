@@ -1,6 +1,6 @@
 import unittest
 from sll.parser import parse, Parser, tokenize
-from sll.driver import Driver, TransientStep, DecomposeStep, VariantStep, StopStep
+from sll.driver import Driver, TransientStep, DecomposeStep, VariantStep, StopStep, plug
 from sll.ast_nodes import TypeExpr
 
 # Программа для тестов (Комментарии исправлены на << >>)
@@ -134,6 +134,79 @@ class TestRuleBasedDriver(unittest.TestCase):
         self.assertEqual(len(step.branches), 2) # Z и S
         print("✅ Тест на порядок правил прошел успешно (ветвление вместо False)")
 
+    def test_template_cached_and_renamed(self):
+        """
+        (add a b) и (add c d) прогоняются по одной заготовке:
+        результат совпадает с полной прогонкой, свежие переменные не повторяются.
+        """
+        nat = TypeExpr("Nat", [])
+        var_types = {"a": nat, "b": nat, "c": nat, "d": nat}
+
+        step1 = self.driver.drive(self._expr("(add a b)"), var_types)
+        step2 = self.driver.drive(self._expr("(add c d)"), var_types)
+        self.assertEqual(len(self.driver.templates), 1)
+
+        reference = Driver(self.prog)
+        ref1 = reference._drive_rules(self._expr("(add a b)"), var_types)
+        ref2 = reference._drive_rules(self._expr("(add c d)"), var_types)
+
+        for step, ref in ((step1, ref1), (step2, ref2)):
+            self.assertIsInstance(step, VariantStep)
+            for (e, c, t, _), (re, rc, rt, _) in zip(step.branches, ref.branches):
+                self.assertEqual(str(e), str(re))
+                self.assertEqual(c.narrowings, rc.narrowings)
+                self.assertEqual(t, rt)
+        self.assertEqual(self.driver.name_gen.counter, reference.name_gen.counter)
+
+    def test_template_not_used_for_known_args(self):
+        """(eq x x) и (add [Z] y) — аргументы частично известны, заготовка не строится"""
+        nat = TypeExpr("Nat", [])
+        self.driver.drive(self._expr("(eq x x)"), {"x": nat})
+        self.driver.drive(self._expr("(add [Z] y)"), {"y": nat})
+        self.assertEqual(self.driver.templates, {})
+
+    def test_deep_nested_focus(self):
+        """
+        (add (add (add [Z] a) b) c): редекс лежит на глубине 2.
+        Контекст — два кадра от внешнего вызова к фокусу; шаг меняет только фокус.
+        """
+        expr = self._expr("(add (add (add [Z] a) b) c)")
+        frames, focus, inner = self.driver._find_redex(expr, {})
+
+        self.assertEqual([f.arg_index for f in frames], [0, 0])
+        self.assertEqual(str(frames[-1].call), "(add (add [Z] a) b)")
+        self.assertEqual(str(focus), "(add [Z] a)")
+        self.assertIsInstance(inner, TransientStep)
+        self.assertEqual(str(plug(frames, inner.next_expr)), "(add (add a b) c)")
+
+        step = self.driver.drive(expr, {})
+        self.assertIsInstance(step, TransientStep)
+        self.assertIsNone(step.next_expr)
+        self.assertIs(step.context.frames[0].call, expr)
+        self.assertEqual(str(step.context.focus), "a")
+        self.assertEqual(str(plug(step.context.frames, step.context.focus)), "(add (add a b) c)")
+
+    def test_resume_from_context(self):
+        """
+        Следующий шаг продолжается от фокуса прошлого: редекс — вызов над ним (add a b),
+        ветки те же, что при прогонке собранного выражения, у каждой свой фокус.
+        """
+        nat = TypeExpr("Nat", [])
+        types = {"a": nat, "b": nat, "c": nat}
+        expr = self._expr("(add (add (add [Z] a) b) c)")
+        first = self.driver.drive(expr, types)
+        step = self.driver.drive(None, types, first.context)
+
+        reference = Driver(self.prog)
+        ref = reference.drive(plug(first.context.frames, first.context.focus), types)
+
+        self.assertIsInstance(step, VariantStep)
+        self.assertEqual([str(e) for e, _, _, _ in step.branches], [str(e) for e, _, _, _ in ref.branches])
+        self.assertEqual([str(c.focus) for c in step.contexts], ["(add [Z] b)", "(add [S v1] b)"])
+        for context, (branch_expr, _, _, _) in zip(step.contexts, step.branches):
+            self.assertEqual([f.arg_index for f in context.frames], [0])
+            self.assertEqual(plug(context.frames, context.focus), branch_expr)
+
 
 if __name__ == '__main__':
     unittest.main()
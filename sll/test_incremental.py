@@ -0,0 +1,110 @@
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.incremental import IncrementalResidualizer
+from sll.cache import supercompile
+from sll.budget import Budget
+from sll.stream import CLOSED
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+ASSOC = "(eq (add (add a b) c) (add a (add b c)))"
+
+
+def _size(root):
+    count = 0
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        count += 1
+        stack.extend(n.children)
+    return count
+
+
+class TestIncrementalResidualizer(unittest.TestCase):
+
+    def setUp(self):
+        self.nat = TypeExpr("Nat", [])
+
+    def inputs(self, expr_text):
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        return start_expr, {v: self.nat for v in ("a", "b", "c") if v in expr_text}
+
+    def batch(self, expr_text, **kw):
+        prog = parse(CODE)
+        sc = Supercompiler(prog, **kw)
+        expr, types = self.inputs(expr_text)
+        if sc.gen_type == "TOP":
+            sc.build_tree(expr, types)
+        else:
+            sc.run_hypercycle(expr, types)
+        return str(Residualizer(sc.tree, prog).residualize())
+
+    def incremental(self, expr_text, on_event=None, **kw):
+        prog = parse(CODE)
+        sc = Supercompiler(prog, **kw)
+        residualizer = IncrementalResidualizer(sc, prog)
+        for event in sc.iter_build(*self.inputs(expr_text)):
+            residualizer(event)
+            if on_event is not None:
+                on_event(sc, event)
+        return sc, str(residualizer.program)
+
+    def test_1_same_program(self):
+        for expr in ("(add (add a b) c)", "(eq a [S a])", ASSOC):
+            for strategy in ("HE", "TAG"):
+                for lean in (False, True):
+                    with self.subTest(expr=expr, strategy=strategy, lean=lean):
+                        _, program = self.incremental(expr, strategy=strategy, lean=lean)
+                        self.assertEqual(program, self.batch(expr, strategy=strategy))
+
+    def test_2_stopped_nodes(self):
+        for steps in (3, 7, 12):
+            _, program = self.incremental(ASSOC, budget=Budget(max_steps=steps))
+            self.assertEqual(program, self.batch(ASSOC, budget=Budget(max_steps=steps)))
+
+    def test_3_closed_subtrees_are_cut(self):
+        """Закрытые поддеревья отрезаются по ходу постройки; от дерева остается каркас."""
+        sizes = []
+
+        def on_event(sc, event):
+            if event.kind == CLOSED:
+                sizes.append(_size(sc.tree))
+
+        sc, _ = self.incremental(ASSOC, on_event=on_event)
+        self.assertGreater(sc.stats.counters["residual.fragments"], 0)
+        self.assertLess(_size(sc.tree), sc.stats.counters["nodes"])
+        self.assertLess(max(sizes), sc.stats.counters["nodes"])
+
+    def test_4_fallback(self):
+        """Гиперцикл и глобальная свертка: программа строится целиком по DONE."""
+        sc, program = self.incremental(ASSOC, gen_type="BOTTOM")
+        self.assertEqual(program, self.batch(ASSOC, gen_type="BOTTOM"))
+        self.assertNotIn("residual.fragments", sc.stats.counters)
+        _, program = self.incremental(ASSOC, global_folding=True)
+        self.assertEqual(program, self.batch(ASSOC, global_folding=True))
+
+    def test_5_supercompile(self):
+        expr, types = self.inputs(ASSOC)
+        _, residual, sc = supercompile(parse(CODE), expr, types, incremental=True)
+        self.assertEqual(str(residual), self.batch(ASSOC))
+        self.assertGreater(sc.stats.counters["residual.fragments"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
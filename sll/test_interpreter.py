@@ -9,7 +9,7 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 from sll.parser import parse, tokenize, Parser
-from sll.interpreter import step
+from sll.interpreter import step, evaluate
 from sll.ast_nodes import FCall, Ctr
 
 class TestInterpreter(unittest.TestCase):
@@ -194,5 +194,28 @@ class TestInterpreter(unittest.TestCase):
         print(f"Step 3: {expr}")
         self.assertTrue(str(expr) == "[Z]")
 
+    def test_7_strict_evaluation(self):
+        """
+        Тест 7: strict — вызов по значению. Аргумент считается один раз до подстановки,
+        по имени — в каждой копии: (double (inc [Z])) -> (add (inc [Z]) (inc [Z])).
+        """
+        code = """
+        type [Nat] : Z | S [Nat].
+        fun (inc [Nat]) -> [Nat]: (inc x) -> [S x].
+        fun (add [Nat] [Nat]) -> [Nat]:
+            (add [Z] y) -> y |
+            (add [S x] y) -> [S (add x y)].
+        fun (double [Nat]) -> [Nat]: (double x) -> (add x x).
+        """
+        prog = parse(code)
+        expr = self.parse_expr_helper("(double (inc [Z]))")
+
+        self.assertEqual(str(step(expr, prog, strict=True)), "(double [S [Z]])")
+        lazy, lazy_steps = evaluate(expr, prog)
+        eager, eager_steps = evaluate(expr, prog, strict=True)
+        self.assertEqual(str(lazy), "[S [S [Z]]]")
+        self.assertEqual(str(eager), str(lazy))
+        self.assertLess(eager_steps, lazy_steps)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
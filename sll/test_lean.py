@@ -0,0 +1,108 @@
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.process_tree import Node, LeanNode
+from sll.process_graph import _expr_vars
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+CASES = [
+    ("(add (add a b) c)", ["a", "b", "c"]),
+    ("(eq (add a b) (add b a))", ["a", "b"]),
+    ("(eq a [S a])", ["a"]),
+]
+
+
+class TestLeanMode(unittest.TestCase):
+
+    def setUp(self):
+        self.nat = TypeExpr("Nat", [])
+
+    def run_sc(self, expr_text, var_names, lean, **kw):
+        prog = parse(CODE)
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        sc = Supercompiler(prog, lean=lean, **kw)
+        if kw.get("gen_type", "TOP") == "TOP":
+            sc.build_tree(start_expr, {v: self.nat for v in var_names})
+        else:
+            sc.run_hypercycle(start_expr, {v: self.nat for v in var_names})
+        return sc, str(Residualizer(sc.tree, prog).residualize())
+
+    @staticmethod
+    def _all(root):
+        stack, result = [root], []
+        while stack:
+            n = stack.pop()
+            result.append(n)
+            stack.extend(n.children)
+        return result
+
+    def test_1_same_residual(self):
+        for strategy in ("HE", "TAG"):
+            for gen_type in ("TOP", "BOTTOM"):
+                for expr, names in CASES:
+                    with self.subTest(expr=expr, strategy=strategy, gen_type=gen_type):
+                        _, full = self.run_sc(expr, names, False, strategy=strategy, gen_type=gen_type)
+                        _, lean = self.run_sc(expr, names, True, strategy=strategy, gen_type=gen_type)
+                        self.assertEqual(lean, full)
+
+    def test_2_lean_nodes_released(self):
+        sc, _ = self.run_sc("(eq (add a b) (add b a))", ["a", "b"], True, strategy="TAG")
+        nodes = self._all(sc.tree)
+        self.assertGreater(len(nodes), 1)
+        for n in nodes:
+            self.assertIs(type(n), LeanNode)
+            self.assertFalse(hasattr(n, "__dict__"))
+            self.assertTrue(n.released)
+            self.assertIsNone(n.bag)
+            self.assertIsNone(n.gen_result)
+            # типы всей ветви нужны только прогонке: у готового узла — лишь его переменные
+            self.assertLessEqual(set(n.var_types), set(_expr_vars(n.expr)))
+
+        # шаг развертки помечается и без driven_from (он нужен резидуализатору)
+        sc, _ = self.run_sc("(add [S a] b)", ["a", "b"], True)
+        self.assertTrue(sc.tree.unfolded)
+
+    def test_3_released_during_build(self):
+        """Законченные поддеревья отпускаются, не дожидаясь конца построения."""
+        prog = parse(CODE)
+        sc = Supercompiler(prog, strategy="TAG", lean=True)
+        during_build = []
+        release = LeanNode.release
+
+        def spy(node):
+            during_build.append(sc._queue is not None)
+            release(node)
+
+        LeanNode.release = spy
+        try:
+            sc.build_tree(Parser(tokenize("(eq a b)")).parse_expr(), {"a": self.nat, "b": self.nat})
+        finally:
+            LeanNode.release = release
+        self.assertTrue(any(during_build))
+
+    def test_4_full_mode_keeps_metadata(self):
+        sc, _ = self.run_sc("(add (add a b) c)", ["a", "b", "c"], False)
+        nodes = self._all(sc.tree)
+        self.assertTrue(all(type(n) is Node for n in nodes))
+        self.assertTrue(any(n.driven_rule is not None for n in nodes))
+        self.assertFalse(any(n.released for n in nodes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,6 @@
 import unittest
 from sll.ast_nodes import Var, Ctr, IntLit, FCall
-from sll.matching import match, MatchSuccess, MatchFail, MatchNarrowing
+from sll.matching import match, MatchSuccess, MatchFail, MatchNarrowing, renaming_key, DiscriminationTree
 
 class TestMatching(unittest.TestCase):
 
@@ -130,5 +130,53 @@ class TestMatching(unittest.TestCase):
 
         print("✅ Тест 7 (Narrowing) прошел")
 
+    def test_8_renaming_key(self):
+        """Тест 8: ключ переименования совпадает ровно для переименований"""
+        e1 = FCall("f", [Var("a"), Ctr("Cons", [Var("b"), Var("a")])])
+        e2 = FCall("f", [Var("v7"), Ctr("Cons", [Var("v3"), Var("v7")])])
+        e3 = FCall("f", [Var("a"), Ctr("Cons", [Var("b"), Var("b")])])
+
+        self.assertEqual(renaming_key(e1), renaming_key(e2))
+        self.assertNotEqual(renaming_key(e1), renaming_key(e3))
+        self.assertIsInstance(match(e1, e2), MatchSuccess)
+        self.assertIsInstance(match(e2, e1), MatchSuccess)
+
+    def test_9_discrimination_tree(self):
+        """Тест 9: индекс образцов находит все подходящие образцы в порядке добавления"""
+        s = lambda e: Ctr("S", [e])
+        patterns = [
+            FCall("add", [Var("x"), Var("y")]),
+            FCall("add", [s(Var("x")), Var("y")]),
+            FCall("add", [self.z, Var("y")]),
+            FCall("add", [Var("x"), Var("x")]),
+            FCall("mul", [Var("x"), Var("y")]),
+            FCall("add", [s(s(Var("x"))), IntLit(1)]),
+        ]
+        exprs = [
+            FCall("add", [s(self.z), Var("b")]),
+            FCall("add", [Var("a"), Var("a")]),
+            FCall("add", [s(s(self.z)), IntLit(1)]),
+            FCall("add", [FCall("mul", [Var("a"), Var("b")]), self.z]),
+            FCall("mul", [self.z]),
+        ]
+        tree = DiscriminationTree()
+        for i, p in enumerate(patterns):
+            tree.add(p, i)
+        tree.add(patterns[0], 0)
+        self.assertEqual(tree.size, len(patterns))
+
+        for e in exprs:
+            expected = [i for i, p in enumerate(patterns) if isinstance(match(p, e), MatchSuccess)]
+            found = [i for i in tree.candidates(e) if isinstance(match(patterns[i], e), MatchSuccess)]
+            self.assertEqual(found, expected)
+        # образцы с другим символом в какой-либо позиции не попадают в кандидаты
+        self.assertEqual(tree.candidates(exprs[2]), [0, 1, 3, 5])
+        self.assertEqual(tree.candidates(exprs[4]), [])
+
+        tree.remove(1)
+        self.assertEqual(tree.candidates(exprs[0]), [0, 3])
+        self.assertEqual(tree.size, len(patterns) - 1)
+
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+
+from sll.parser import Parser, tokenize
+from sll.minimize import minimize, partition
+from sll.interpreter import evaluate
+from sll.residualizer import Residualizer
+from sll.stats import Stats
+from sll.ast_nodes import Program, Rule, Pattern, FCall, Ctr
+
+
+def _expr(text):
+    return Parser(tokenize(text)).parse_expr()
+
+
+def _program(*rules):
+    """Программа из строк вида '(f [S x] y) -> [S (f x y)]'."""
+    result = []
+    for text in rules:
+        lhs, rhs = text.split(" -> ")
+        call = _expr(lhs)
+        result.append(Rule(Pattern(call.name, [Residualizer._expr_to_pattern(p) for p in call.args]),
+                           _expr(rhs)))
+    return Program(result, [], [])
+
+
+def _nat(n):
+    return Ctr("Z", []) if n == 0 else Ctr("S", [_nat(n - 1)])
+
+
+class TestMinimize(unittest.TestCase):
+
+    def test_1_chain(self):
+        """g1 -> g2 -> g3 -> g3: все три — одна функция."""
+        prog = _program("(g1 [S v1]) -> (g2 v1)", "(g1 [Z]) -> [True]",
+                        "(g2 [S v2]) -> (g3 v2)", "(g2 [Z]) -> [True]",
+                        "(g3 [S v3]) -> (g3 v3)", "(g3 [Z]) -> [True]")
+        stats = Stats()
+        result = minimize(prog, stats=stats)
+        self.assertEqual([str(r) for r in result.rules], ["(g1 [S v1]) -> (g1 v1)", "(g1 [Z]) -> [True]"])
+        self.assertEqual(stats.counters["minimize.merged"], 2)
+
+    def test_2_mutual_recursion(self):
+        """Пары g1/g2 и g3/g4 вызывают друг друга — сливаются попарно."""
+        prog = _program("(main x y) -> [P (g1 x) (g3 y)]",
+                        "(g1 [S v]) -> [A (g2 v)]", "(g1 [Z]) -> [Z]",
+                        "(g2 [S v]) -> [B (g1 v)]", "(g2 [Z]) -> [Z]",
+                        "(g3 [S w]) -> [A (g4 w)]", "(g3 [Z]) -> [Z]",
+                        "(g4 [S w]) -> [B (g3 w)]", "(g4 [Z]) -> [Z]")
+        block = partition(prog.rules)
+        self.assertEqual(block["g1"], block["g3"])
+        self.assertEqual(block["g2"], block["g4"])
+        self.assertNotEqual(block["g1"], block["g2"])
+        result = minimize(prog)
+        self.assertEqual(str(result.rules[0]), "(main x y) -> [P (g1 x) (g1 y)]")
+        self.assertEqual(len(result.rules), 5)
+
+    def test_3_difference_deep_in_cycle(self):
+        """Отличие через вызов: g3 не сливается с g1, хотя их правила одинаковы по форме."""
+        prog = _program("(main x y) -> [P (g1 x) (g3 y)]",
+                        "(g1 [S v]) -> (g2 v)", "(g1 [Z]) -> [Z]",
+                        "(g2 [S v]) -> (g1 v)", "(g2 [Z]) -> [Z]",
+                        "(g3 [S w]) -> (g4 w)", "(g3 [Z]) -> [Z]",
+                        "(g4 [S w]) -> (g3 w)", "(g4 [Z]) -> [True]")
+        block = partition(prog.rules)
+        self.assertEqual(block["g1"], block["g2"])
+        self.assertNotEqual(block["g1"], block["g3"])
+        self.assertNotEqual(block["g3"], block["g4"])
+        result = minimize(prog)
+        self.assertEqual(len(result.rules), len(prog.rules) - 2)
+
+    def test_4_entry_and_results(self):
+        """Точка входа остается представителем класса; результаты вычислений те же."""
+        prog = _program("(f1 [S v] y) -> [S (f2 v y)]", "(f1 [Z] y) -> y",
+                        "(f2 [S v] y) -> [S (f1 v y)]", "(f2 [Z] y) -> y")
+        result = minimize(prog)
+        self.assertEqual({r.pattern.name for r in result.rules}, {"f1"})
+        for a in range(4):
+            args = [_nat(a), _nat(2)]
+            self.assertEqual(str(evaluate(FCall("f1", args), result)[0]),
+                             str(evaluate(FCall("f1", args), prog)[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.cache import supercompile
+from sll.optimizer import optimize, entry_name
+from sll.interpreter import evaluate
+from sll.residualizer import Residualizer
+from sll.stats import Stats
+from sll.ast_nodes import Program, Rule, Pattern, FCall, Ctr, TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+
+def _expr(text):
+    return Parser(tokenize(text)).parse_expr()
+
+
+def _program(*rules):
+    """Программа из строк вида '(f [S x] y) -> [S (f x y)]'."""
+    result = []
+    for text in rules:
+        lhs, rhs = text.split(" -> ")
+        call = _expr(lhs)
+        params = [Residualizer._expr_to_pattern(p) for p in call.args]
+        result.append(Rule(Pattern(call.name, params), _expr(rhs)))
+    return Program(result, [], [])
+
+
+def _nat(n):
+    return Ctr("Z", []) if n == 0 else Ctr("S", [_nat(n - 1)])
+
+
+class TestOptimizer(unittest.TestCase):
+
+    def test_1_dead_functions(self):
+        prog = _program("(main x) -> (f1 x)",
+                        "(f1 [Z]) -> [Z]",
+                        "(f1 [S x]) -> (f1 x)",
+                        "(g9 x) -> (f1 x)")
+        stats = Stats()
+        opt = optimize(prog, stats=stats)
+        self.assertNotIn("g9", {r.pattern.name for r in opt.rules})
+        self.assertEqual(stats.counters["optimize.dead"], 1)
+
+    def test_2_inline_single_use_and_forwarding(self):
+        prog = _program("(main x y) -> (g1 x (k1 y))",
+                        "(g1 [Z] y) -> (k2 y y)",
+                        "(g1 [S x] y) -> [S (g1 x (k1 y))]",
+                        "(k1 v) -> (h1 v [Z])",
+                        "(k2 a b) -> [S (h1 a b)]",
+                        "(h1 [Z] b) -> b",
+                        "(h1 [S a] b) -> [S (h1 a b)]")
+        opt = optimize(prog, stats=Stats())
+        names = [r.pattern.name for r in opt.rules]
+        self.assertNotIn("k1", names)     # передает вызов, подставлен в оба места
+        self.assertNotIn("k2", names)     # вызван один раз
+        self.assertIn("(g1 x (h1 y [Z]))", str(opt.rules[0]))
+
+    def test_3_unused_parameters(self):
+        # y не нужен g1: он передается только в ту же позицию рекурсивного вызова
+        prog = _program("(main x y) -> [P (g1 x y) y]",
+                        "(g1 [Z] y) -> [True]",
+                        "(g1 [S x] y) -> (g1 x [S y])")
+        opt = optimize(prog, stats=Stats())
+        self.assertEqual([str(r) for r in opt.rules],
+                         ["(main x y) -> [P (g1 x) y]", "(g1 [Z]) -> [True]", "(g1 [S x]) -> (g1 x)"])
+
+    def test_4_merge_equivalent(self):
+        prog = _program("(main x) -> [P (f1 x) (f2 x)]",
+                        "(f1 [Z]) -> [Z]",
+                        "(f1 [S x]) -> (f1 x)",
+                        "(f2 [Z]) -> [Z]",
+                        "(f2 [S y]) -> (f2 y)")
+        stats = Stats()
+        opt = optimize(prog, stats=stats)
+        self.assertEqual(stats.counters["optimize.merge"], 1)
+        self.assertEqual(str(opt.rules[0]), "(main x) -> [P (f1 x) (f1 x)]")
+
+    def test_5_entry_keeps_name_and_params(self):
+        prog = _program("(f1 [Z] y) -> y", "(f1 [S x] y) -> [S (f1 x y)]")
+        opt = optimize(prog, stats=Stats())
+        self.assertEqual(entry_name(opt), "f1")
+        self.assertEqual([str(r) for r in opt.rules], [str(r) for r in prog.rules])
+
+    def test_6_fewer_reductions_same_results(self):
+        source = parse(CODE)
+        nat = TypeExpr("Nat", [])
+        checked = 0
+        for expr in ("(add (add a b) c)", "(eq (add a b) (add b a))"):
+            for gen_type in ("TOP", "BOTTOM"):
+                names = [v for v in ("a", "b", "c") if v in expr]
+                _, residual, _ = supercompile(source, _expr(expr), {v: nat for v in names},
+                                              gen_type=gen_type)
+                opt = optimize(residual, stats=Stats())
+                entry = entry_name(residual)
+                for k in range(4):
+                    args = [_nat((k + i) % 4) for i in range(len(names))]
+                    r1, n1 = evaluate(FCall(entry, args), residual)
+                    r2, n2 = evaluate(FCall(entry, args), opt)
+                    if not isinstance(r1, Ctr):
+                        continue    # остаточная программа не определена на этом входе
+                    with self.subTest(expr=expr, gen_type=gen_type, k=k):
+                        self.assertEqual(str(r2), str(r1))
+                        self.assertLessEqual(n2, n1)
+                        checked += 1
+        self.assertGreater(checked, 10)
+
+    def test_7_inline_keeps_sharing(self):
+        """Параметр с двумя вхождениями подставляется только переменной или значением."""
+        prog = _program("(main x y) -> [P (k1 (g1 x)) (k1 y) (k1 [S [Z]])]",
+                        "(k1 v) -> (h1 v v)",
+                        "(g1 [Z]) -> [Z]",
+                        "(g1 [S x]) -> [S (g1 x)]",
+                        "(h1 [Z] b) -> b",
+                        "(h1 [S a] b) -> [S (h1 a b)]")
+        opt = optimize(prog, stats=Stats())
+        self.assertEqual(str(opt.rules[0]), "(main x y) -> [P (k1 (g1 x)) (h1 y y) (h1 [S [Z]] [S [Z]])]")
+        self.assertIn("(k1 v) -> (h1 v v)", [str(r) for r in opt.rules])
+        args = [_nat(3), _nat(2)]
+        r1, n1 = evaluate(FCall("main", args), prog)
+        r2, n2 = evaluate(FCall("main", args), opt)
+        self.assertEqual(str(r2), str(r1))
+        self.assertLessEqual(n2, n1)
+
+
+if __name__ == '__main__':
+    unittest.main()
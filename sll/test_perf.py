@@ -0,0 +1,67 @@
+import os
+import unittest
+
+from sll.perf import Regression, compare, by_phase, phase_of, run_suite, load_baseline, workloads
+from sll.interpreter import evaluate
+from sll.parser import Parser, tokenize
+from sll.workloads import chain, alphabet
+
+# время — только по запросу: на общей машине оно шумит
+TIMINGS = os.environ.get("SLL_PERF_TIMING") == "1"
+
+
+def _result(counters, timers=None):
+    return {"counters": counters, "timers": timers or {}}
+
+
+class TestPerf(unittest.TestCase):
+
+    def test_1_counters_match_baseline(self):
+        """Счетчики фиксированных входов не выросли против bench/baselines/perf.json."""
+        baseline = load_baseline()
+        current = run_suite()
+        self.assertEqual(sorted(current), sorted(baseline), "workloads changed: run bench/perf.py --save")
+        regressions = compare(current, baseline)
+        self.assertFalse(regressions, "\n" + by_phase(regressions) if regressions else "")
+
+    @unittest.skipUnless(TIMINGS, "set SLL_PERF_TIMING=1 to compare phase timings")
+    def test_2_timings_match_baseline(self):
+        regressions = [r for r in compare(run_suite(repeat=5, timings=True), load_baseline()) if r.metric == "time"]
+        self.assertFalse(regressions, "\n" + by_phase(regressions) if regressions else "")
+
+    def test_3_regressions_reported_by_phase(self):
+        baseline = {"w": _result({"nodes": 10, "drive.DecomposeStep": 5, "folds": 3, "whistles": 2},
+                                 {"drive": 2.0, "msg": 0.1})}
+        current = {"w": _result({"nodes": 10, "drive.DecomposeStep": 7, "folds": 1, "whistles": 2, "new": 9},
+                                {"drive": 5.0, "msg": 0.4})}
+        found = compare(current, baseline)
+        # рост прогонки (счетчик и время) — регрессия; меньше сверток — нет;
+        # msg вырос вчетверо, но на 0.3 единицы — в пределах шума; нового счетчика нет в базе
+        self.assertEqual([(r.phase, r.metric) for r in found], [("drive", "drive.DecomposeStep"), ("drive", "time")])
+        report = by_phase(found)
+        self.assertTrue(report.startswith("regressed phases: drive"))
+        self.assertIn("w: drive drive.DecomposeStep 5 -> 7 (+40%)", report)
+        self.assertEqual(compare(current, baseline, {"counters": 0.5, "timers": 2.0}), [])
+        self.assertEqual(str(Regression("w", "build", "nodes", 0, 3)), "w: build nodes 0 -> 3 (new)")
+
+    def test_4_phase_of(self):
+        self.assertEqual([phase_of(c) for c in ("drive.VariantStep", "folds", "whistles", "generalizations",
+                                                "residual.rules", "interpreter.steps", "nodes", "stopped")],
+                         ["drive", "fold", "whistle", "generalize", "residualize", "interpret", "build", "build"])
+
+    def test_5_generated_programs(self):
+        """Сгенерированные программы делают то, что обещают."""
+        program, _, _ = chain(2).parsed()
+        result, _ = evaluate(Parser(tokenize("(sub2 (sub1 [Cons [L0] [Cons [L1] [Cons [L2] [Nil]]]]))")).parse_expr(),
+                             program)
+        self.assertEqual(str(result), str(Parser(tokenize("[Cons [L2] [Cons [L2] [Cons [L2] [Nil]]]]")).parse_expr()))
+        program, _, _ = alphabet(3).parsed()
+        for text, expected in (("(eqlists [Cons [C3] [Nil]] [Cons [C3] [Nil]])", "True"),
+                               ("(eqlists [Cons [C3] [Nil]] [Cons [C2] [Nil]])", "False")):
+            result, _ = evaluate(Parser(tokenize(text)).parse_expr(), program)
+            self.assertEqual(result.name, expected)
+        self.assertEqual(len({w.name for w in workloads()}), len(workloads()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.process_graph import SharedNode
+from sll.exporter import to_dot
+from sll.stream import CLOSED
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Pair] : P [Nat] [Nat] .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (both [Nat] [Nat]) -> [Pair] :
+    (both x y) -> [P (add x [Z]) (add y [Z])] .
+
+fun (two [Nat] [Nat]) -> [Nat] :
+    (two [Z] y) -> (add y [Z])
+  | (two [S x] y) -> (add x [Z]) .
+"""
+
+
+class TestProcessGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.prog = parse(CODE)
+        self.nat = TypeExpr("Nat", [])
+
+    def build(self, expr_text, var_names, gen_type="TOP", share=False):
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        var_types = {v: self.nat for v in var_names}
+        sc = Supercompiler(self.prog, gen_type=gen_type, share_subtrees=share)
+        if gen_type == "TOP":
+            sc.build_tree(start_expr, var_types)
+        else:
+            sc.run_hypercycle(start_expr, var_types)
+        return sc
+
+    def test_1_renamed_subtree_shared(self):
+        """Поддеревья (add x [Z]) и (add y [Z]) совпадают с точностью до переименования."""
+        sc = self.build("(both a b)", ["a", "b"])
+        expected_res = str(Residualizer(sc.tree).residualize())
+        expected_dot = to_dot(sc.tree)
+
+        stats = sc.compact_tree()
+        self.assertEqual(stats.shared_subtrees, 1)
+        self.assertLess(stats.nodes_after, stats.nodes_before)
+
+        stubs = [n for n in self._all(sc.tree) if isinstance(n, SharedNode)]
+        self.assertEqual(len(stubs), 1)
+        # Узел-ссылка отдаёт выражение в своих именах
+        self.assertIn("b", str(stubs[0].expr))
+
+        # Граф процессов дает ту же остаточную программу и ту же картинку
+        self.assertEqual(str(Residualizer(sc.tree).residualize()), expected_res)
+        self.assertEqual(to_dot(sc.tree), expected_dot)
+
+    def test_2_nothing_to_share(self):
+        sc = self.build("(add a b)", ["a", "b"])
+        stats = sc.compact_tree()
+        self.assertEqual(stats.shared_subtrees, 0)
+        self.assertEqual(stats.nodes_after, stats.nodes_before)
+
+    def test_3_forest_roots_pinned(self):
+        """В режиме BOTTOM корни леса не заменяются, остаточная программа та же."""
+        sc = self.build("(two a b)", ["a", "b"], gen_type="BOTTOM")
+        expected = str(Residualizer(sc.tree).residualize())
+        sc.compact_tree()
+        for r in sc.tree.children:
+            self.assertNotIsInstance(r, SharedNode)
+        self.assertEqual(str(Residualizer(sc.tree).residualize()), expected)
+
+    def test_4_merged_while_building(self):
+        """share_subtrees: поддерево (add y [Z]) заменяется ссылкой, как только закрылось."""
+        expected = self.build("(both a b)", ["a", "b"])
+        expected_res = str(Residualizer(expected.tree).residualize())
+
+        sc = self.build("(both a b)", ["a", "b"], share=True)
+        self.assertEqual(sc.stats.counters["shared_subtrees"], 1)
+        stubs = [n for n in self._all(sc.tree) if isinstance(n, SharedNode)]
+        self.assertEqual(len(stubs), 1)
+        self.assertEqual(str(Residualizer(sc.tree).residualize()), expected_res)
+        self.assertEqual(to_dot(sc.tree), to_dot(expected.tree))
+        # ключ ребенка нужен, только пока не закрыт родитель
+        self.assertTrue(all(n.share_key is None for n in self._all(sc.tree)))
+
+        # ссылка появляется в событии CLOSED, до конца постройки
+        sc = Supercompiler(self.prog, share_subtrees=True)
+        events = list(sc.iter_build(Parser(tokenize("(both a b)")).parse_expr(), {"a": self.nat, "b": self.nat}))
+        closed = [e.node for e in events if e.kind == CLOSED]
+        self.assertTrue(any(isinstance(n, SharedNode) for n in closed[:-1]))
+
+    @staticmethod
+    def _all(root):
+        stack, result = [root], []
+        while stack:
+            n = stack.pop()
+            result.append(n)
+            if not isinstance(n, SharedNode):
+                stack.extend(n.children)
+        return result
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import time
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.stats import Stats
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.nat = TypeExpr("Nat", [])
+
+    def run_sc(self, expr_text, var_names, **kw):
+        prog = parse(CODE)
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        sc = Supercompiler(prog, **kw)
+        if kw.get("gen_type", "TOP") == "TOP":
+            sc.build_tree(start_expr, {v: self.nat for v in var_names})
+        else:
+            sc.run_hypercycle(start_expr, {v: self.nat for v in var_names})
+        residual = Residualizer(sc.tree, prog, sc.stats).residualize()
+        return sc, residual
+
+    @staticmethod
+    def _all(root):
+        stack, result = [root], []
+        while stack:
+            n = stack.pop()
+            result.append(n)
+            stack.extend(n.children)
+        return result
+
+    def test_1_counters_match_tree(self):
+        sc, residual = self.run_sc("(add a b)", ["a", "b"])
+        c = sc.stats.counters
+        nodes = self._all(sc.tree)
+        self.assertEqual(c["nodes"], len(nodes))
+        self.assertEqual(c["folds"], sum(1 for n in nodes if n.back_link is not None))
+        self.assertEqual(c["steps"], len(nodes))
+        self.assertEqual(c["drive.VariantStep"], 1)
+        self.assertEqual(c["residual.rules"], len(residual.rules))
+        self.assertNotIn("whistles", c)
+        for phase in ("build", "fold", "drive", "whistle", "residualize"):
+            self.assertGreaterEqual(sc.stats.timers[phase], 0.0)
+
+    def test_2_whistles_and_generalizations(self):
+        sc, _ = self.run_sc("(add (add a b) c)", ["a", "b", "c"], strategy="TAG", gen_type="BOTTOM")
+        c = sc.stats.counters
+        self.assertGreater(c["whistles"], 0)
+        self.assertEqual(c["generalizations"], c["whistles"])
+        self.assertIn("msg", sc.stats.timers)
+        self.assertIn("hypercycle", sc.stats.timers)
+
+    def test_3_report(self):
+        a = Stats()
+        a.count("nodes", 2)
+        with a.timer("drive"):
+            pass
+        with a.timer("drive"):
+            pass
+        a.count("nodes")
+        a.count("folds")
+        report = json.loads(a.to_json())
+        self.assertEqual(report["counters"], {"folds": 1, "nodes": 3})
+        self.assertEqual(list(report["timers"]), ["drive"])
+
+    def test_4_reentrant_timers(self):
+        """Вложенный и перемежающийся вход в одну фазу: каждый промежуток — один раз."""
+        stats = Stats()
+        outer = stats.timer("drive")
+        outer.__enter__()
+        time.sleep(0.02)
+        with stats.timer("drive"):
+            time.sleep(0.02)
+        other = stats.timer("drive")
+        other.__enter__()
+        time.sleep(0.02)
+        outer.__exit__(None, None, None)    # закрывается раньше вложенного
+        time.sleep(0.02)
+        self.assertNotIn("drive", stats.timers)
+        other.__exit__(None, None, None)
+        self.assertGreaterEqual(stats.timers["drive"], 0.08)
+        self.assertLess(stats.timers["drive"], 0.11)     # сумма по секундомерам — 0.12
+
+
+if __name__ == '__main__':
+    unittest.main()
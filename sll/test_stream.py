@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.exporter import to_dot
+from sll.budget import Budget
+from sll.stream import CREATED, DRIVEN, FOLDED, GENERALIZED, STOPPED, CLOSED, DONE
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+ASSOC = "(eq (add (add a b) c) (add a (add b c)))"
+
+
+def _nodes(root):
+    result = []
+    stack = [root]
+    while stack:
+        n = stack.pop()
+        result.append(n)
+        stack.extend(n.children)
+    return result
+
+
+class TestStreamingBuild(unittest.TestCase):
+
+    def setUp(self):
+        self.nat = TypeExpr("Nat", [])
+
+    def make_sc(self, expr_text, **kw):
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        var_types = {v: self.nat for v in ("a", "b", "c") if v in expr_text}
+        return Supercompiler(parse(CODE), **kw), start_expr, var_types
+
+    def test_1_same_tree_as_build(self):
+        for gen_type in ("TOP", "BOTTOM"):
+            sc, expr, types = self.make_sc(ASSOC, gen_type=gen_type)
+            if gen_type == "TOP":
+                sc.build_tree(expr, types)
+            else:
+                sc.run_hypercycle(expr, types)
+
+            sc2, expr2, types2 = self.make_sc(ASSOC, gen_type=gen_type)
+            events = list(sc2.iter_build(expr2, types2))
+            self.assertEqual(events[-1].kind, DONE)
+            self.assertIs(events[-1].node, sc2.tree)
+            self.assertEqual(str(Residualizer(sc2.tree).residualize()),
+                             str(Residualizer(sc.tree).residualize()))
+            self.assertEqual(to_dot(sc2.tree, dev_mode=True), to_dot(sc.tree, dev_mode=True))
+
+    def test_2_events_during_construction(self):
+        """Первое событие приходит, когда дерево еще строится."""
+        sc, expr, types = self.make_sc(ASSOC)
+        events = sc.iter_build(expr, types)
+        first = next(events)
+        self.assertEqual(first.kind, CREATED)
+        self.assertIsNotNone(sc._queue)
+        kinds = {e.kind for e in events}
+        self.assertTrue({DRIVEN, FOLDED, CLOSED, DONE} <= kinds)
+        self.assertIsNone(sc._events)
+
+    def test_3_closed_subtrees_do_not_change(self):
+        sc, expr, types = self.make_sc(ASSOC)
+        created, closed = set(), {}
+        for e in sc.iter_build(expr, types):
+            if e.kind == CREATED:
+                created.add(e.node)
+            elif e.kind == CLOSED:
+                closed[e.node] = [(n, str(n.expr), n.back_link, len(n.children)) for n in _nodes(e.node)]
+        final = _nodes(sc.tree)
+        self.assertLessEqual(set(final), created)
+        self.assertLessEqual(set(final), set(closed))
+        for snapshot in closed.values():
+            if snapshot[0][0] in final:
+                self.assertEqual([(n, str(n.expr), n.back_link, len(n.children)) for n, *_ in snapshot],
+                                 snapshot)
+
+    def test_4_generalization_event(self):
+        sc, expr, types = self.make_sc("(add (add a b) c)", strategy="TAG")
+        gens = [e for e in sc.iter_build(expr, types) if e.kind == GENERALIZED]
+        self.assertTrue(gens)
+        self.assertIsNotNone(gens[0].node.gen_result)
+        self.assertIsNotNone(gens[0].target)
+
+    def test_5_budget_stop(self):
+        sc, expr, types = self.make_sc(ASSOC, budget=Budget(max_steps=5))
+        events = list(sc.iter_build(expr, types))
+        stopped = [e.node for e in events if e.kind == STOPPED]
+        self.assertTrue(stopped)
+        self.assertTrue(all(n.stopped for n in stopped))
+        self.assertIn(sc.tree, [e.node for e in events if e.kind == CLOSED])
+
+    def test_6_async(self):
+        sc, expr, types = self.make_sc(ASSOC, lean=True)
+        kinds = [e.kind for e in sc.iter_build(expr, types)]
+
+        async def collect():
+            sc2, expr2, types2 = self.make_sc(ASSOC, lean=True)
+            return [e.kind async for e in sc2.aiter_build(expr2, types2)]
+
+        self.assertEqual(asyncio.run(collect()), kinds)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -156,6 +156,53 @@ class TestSupervisorFullIntegration(unittest.TestCase):
         # Ожидаем строку вида: ... -> [False];
         self.assertIn("-> [False]", res)
 
+    def test_8_global_folding(self):
+        """
+        Тест 8: (h a b) — обе ветки h приходят к (add b [Z]).
+        С глобальной сверткой вторая ветка ссылается на первую, а не строится заново.
+        """
+        prog = parse(CODE + """
+        fun (h [Nat] [Nat]) -> [Nat] :
+            (h [Z] y) -> (add y [Z])
+          | (h [S x] y) -> [S (add y [Z])] .
+        """)
+        start_expr = Parser(tokenize("(h a b)")).parse_expr()
+        var_types = {"a": self.nat_type, "b": self.nat_type}
+
+        sc = Supercompiler(prog, global_folding=True)
+        sc.build_tree(start_expr, var_types)
+
+        self.assertEqual(len(sc.shared_refs), 1)
+        self.assertGreater(sc.saved_nodes, 0)
+        ref = sc.shared_refs[0]
+        self.assertNotIn(ref.back_link, ref.ancestors())
+
+        res = str(Residualizer(sc.tree).residualize())
+        # (add b [Z]) резидуализуется в одну функцию, вызываемую из обеих веток
+        self.assertEqual(res.count("[Z]) -> [Z];"), 1)
+        self.assertNotIn("(add", res)
+
+    def test_9_hypercycle_renaming_dedup(self):
+        """
+        Тест 9: базисные конфигурации (add a [Z]) и (add b [Z]) отличаются только именами.
+        Дерево строится один раз, второй вызов обрезается как ссылка на тот же корень.
+        """
+        prog = parse(CODE + """
+        type [Pair] : P [Nat] [Nat] .
+        fun (both [Nat] [Nat]) -> [Pair] :
+            (both x y) -> [P (add x [Z]) (add y [Z])] .
+        """)
+        start_expr = Parser(tokenize("(both a b)")).parse_expr()
+        var_types = {"a": self.nat_type, "b": self.nat_type}
+
+        sc = Supercompiler(prog, gen_type="BOTTOM")
+        sc.run_hypercycle(start_expr, var_types)
+
+        roots = [str(r.expr) for r in sc.tree.children]
+        self.assertEqual(roots, ["[P (add a [Z]) (add b [Z])]", "(add a [Z])"])
+        start_root = sc.tree.children[0]
+        self.assertTrue(all(c.is_basis_ref and not c.children for c in start_root.children))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,63 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.trace import Tracer, TextSink, JsonlSink, ListSink, INFO, DEBUG
+from sll.ast_nodes import TypeExpr
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+"""
+
+
+class TestTrace(unittest.TestCase):
+
+    def build(self, tracer=None, expr_text="(add (add a b) c)"):
+        prog = parse(CODE)
+        nat = TypeExpr("Nat", [])
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        sc = Supercompiler(prog, tracer=tracer)
+        sc.build_tree(start_expr, {v: nat for v in "abc"})
+        return sc
+
+    def test_1_disabled_formats_nothing(self):
+        """Без трассировки события не собираются и выражения не форматируются."""
+        with mock.patch.object(Tracer, "emit", side_effect=AssertionError("emitted")), \
+                mock.patch("sll.trace._render", side_effect=AssertionError("formatted")):
+            self.build()
+
+    def test_2_levels_and_text(self):
+        sink = ListSink()
+        self.build(Tracer(sink, INFO))
+        self.assertEqual(sink.events, [])   # на INFO шаги не видны, остановок нет
+
+        out = io.StringIO()
+        self.build(Tracer(TextSink(out), DEBUG))
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], "[DRIVE] at=(add (add a b) c) step=VariantStep")
+        self.assertEqual(lines[-1], "[FOLD] beta=(add v2 c) alpha=(add b c)")
+
+    def test_3_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.jsonl")
+            tracer = Tracer(JsonlSink(path), DEBUG)
+            self.build(tracer)
+            tracer.close()
+            with open(path, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f]
+        self.assertEqual(events[0], {"level": DEBUG, "event": "drive",
+                                     "at": "(add (add a b) c)", "step": "VariantStep"})
+        self.assertIn("fold", {e["event"] for e in events})
+
+
+if __name__ == '__main__':
+    unittest.main()
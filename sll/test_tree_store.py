@@ -0,0 +1,106 @@
+import pickle
+import unittest
+
+from sll.parser import parse, Parser, tokenize
+from sll.supercompiler import Supercompiler
+from sll.residualizer import Residualizer
+from sll.exporter import to_dot
+from sll.tree_store import TreeStore, StoredNode
+from sll.process_tree import Node
+from sll.process_graph import _expr_vars
+from sll.ast_nodes import TypeExpr, FCall
+
+CODE = """
+type [Nat] : Z | S [Nat] .
+type [Bool] : True | False .
+type [Pair] : P [Bool] [Bool] .
+
+fun (add [Nat] [Nat]) -> [Nat] :
+    (add [Z] y) -> y
+  | (add [S x] y) -> [S (add x y)] .
+
+fun (eq [Nat] [Nat]) -> [Bool] :
+    (eq [Z] [Z]) -> [True]
+  | (eq [S x] [S y]) -> (eq x y)
+  | (eq x y) -> [False] .
+"""
+
+
+class TestTreeStore(unittest.TestCase):
+
+    def setUp(self):
+        self.prog = parse(CODE)
+        self.nat = TypeExpr("Nat", [])
+
+    def build(self, expr_text, var_names, **kw):
+        start_expr = Parser(tokenize(expr_text)).parse_expr()
+        var_types = {v: self.nat for v in var_names}
+        sc = Supercompiler(self.prog, **kw)
+        if kw.get("gen_type", "TOP") == "TOP":
+            sc.build_tree(start_expr, var_types)
+        else:
+            sc.run_hypercycle(start_expr, var_types)
+        return sc
+
+    def assert_same(self, tree, packed):
+        self.assertEqual(str(Residualizer(packed, self.prog).residualize()),
+                         str(Residualizer(tree, self.prog).residualize()))
+        self.assertEqual(to_dot(packed, dev_mode=True), to_dot(tree, dev_mode=True))
+
+    def test_1_same_residual_and_graph(self):
+        cases = [
+            ("(add (add a b) c)", ["a", "b", "c"], {}),
+            ("(eq (add a b) (add b a))", ["a", "b"], {"strategy": "TAG"}),
+            ("(eq a [S a])", ["a"], {"gen_type": "BOTTOM"}),
+            ("[P (eq a b) (eq b a)]", ["a", "b"], {"global_folding": True}),
+        ]
+        for expr, names, kw in cases:
+            with self.subTest(expr=expr, **kw):
+                sc = self.build(expr, names, **kw)
+                self.assert_same(sc.tree, TreeStore.pack(sc.tree).root)
+
+    def test_2_process_graph(self):
+        """Граф с разделяемыми поддеревьями упаковывается как обычное дерево."""
+        sc = self.build("[P (eq a b) (eq b a)]", ["a", "b"])
+        expected = str(Residualizer(sc.tree, self.prog).residualize())
+        sc.compact_tree()
+        packed = TreeStore.pack(sc.tree).root
+        self.assertEqual(str(Residualizer(packed, self.prog).residualize()), expected)
+
+    def test_3_pack_tree(self):
+        sc = self.build("(eq (add a b) c)", ["a", "b", "c"], gen_type="BOTTOM")
+        expected = str(Residualizer(sc.tree, self.prog).residualize())
+        roots = len(sc.hypercycle_roots)
+        store = sc.pack_tree()
+        self.assertIsInstance(sc.tree, StoredNode)
+        self.assertEqual(len(sc.hypercycle_roots), roots)
+        self.assertTrue(all(isinstance(r, StoredNode) for r in sc.hypercycle_roots.values()))
+        self.assertEqual(str(Residualizer(sc.tree, self.prog).residualize()), expected)
+
+        # Узлы — несколько массивов целых, одинаковые выражения хранятся один раз
+        self.assertLessEqual(store.nbytes(), 29 * len(store))
+        self.assertLess(len(store.exprs), len(store))
+        self.assertEqual(sc.tree.children[0].parent, sc.tree)
+        self.assertEqual(hash(sc.tree.children[0]), hash(store.node(1)))
+
+        copy = pickle.loads(pickle.dumps(store))
+        self.assertEqual(str(Residualizer(copy.root, self.prog).residualize()), expected)
+
+    def test_4_only_expression_types_kept(self):
+        sc = self.build("[P (eq a b) (eq c d)]", ["a", "b", "c", "d"])
+        store = TreeStore.pack(sc.tree)
+        self.assertEqual(len(store.root.var_types), 4)
+        for child in store.root.children:
+            self.assertEqual(set(child.var_types), set(_expr_vars(child.expr)))
+            self.assertEqual(len(child.var_types), 2)
+
+    def test_5_back_link_outside(self):
+        root = Node(FCall("f", []), {})
+        child = root.add_child(Node(FCall("g", []), {}))
+        child.back_link = Node(FCall("f", []), {})
+        with self.assertRaises(ValueError):
+            TreeStore.pack(root)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import json
+import sys
+from typing import Any, Dict, List, Optional, TextIO, Tuple
+
+# Трассировка суперкомпилятора: события с уровнями и подключаемыми приемниками.
+#
+# Событие — имя ("drive", "fold", ...) и поля. Поля приводятся к строке
+# только если событие кому-то нужно, а места вызова проверяют флаг уровня
+# до того, как собрать поля:
+#
+#     if self.tracer.debug:
+#         self.tracer.emit(DEBUG, "drive", at=beta.expr, step=type(step).__name__)
+#
+# Поэтому при выключенной трассировке выражения не форматируются вовсе.
+
+QUIET = 0   # ничего
+INFO = 1    # остановки по бюджету, конфигурации гиперцикла, чекпоинты
+DEBUG = 2   # каждый шаг: прогонка, свертка, свисток, обобщение
+TRACE = 3   # транзитные шаги, мешки тегов, let в драйвере
+
+LEVELS = {"quiet": QUIET, "info": INFO, "debug": DEBUG, "trace": TRACE}
+
+Event = Tuple[int, str, Dict[str, Any]]
+
+
+class NullSink:
+    """Никуда не пишет."""
+
+    def write(self, level: int, event: str, fields: Dict[str, Any]):
+        pass
+
+    def close(self):
+        pass
+
+
+class TextSink:
+    """Текстовые строки вида "[DRIVE] at=(add a b) step=VariantStep" (по умолчанию в stderr)."""
+
+    def __init__(self, stream: Optional[TextIO] = None):
+        self.stream = stream
+
+    def write(self, level: int, event: str, fields: Dict[str, Any]):
+        stream = self.stream if self.stream is not None else sys.stderr
+        parts = [f"[{event.upper()}]"] + [f"{k}={v}" for k, v in fields.items()]
+        stream.write(" ".join(parts) + "\n")
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """По объекту JSON на событие: {"level": ..., "event": ..., поля...}."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "w", encoding="utf-8")
+
+    def write(self, level: int, event: str, fields: Dict[str, Any]):
+        self.file.write(json.dumps({"level": level, "event": event, **fields}, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class ListSink:
+    """Копит события в памяти (тесты)."""
+
+    def __init__(self):
+        self.events: List[Event] = []
+
+    def write(self, level: int, event: str, fields: Dict[str, Any]):
+        self.events.append((level, event, fields))
+
+    def close(self):
+        pass
+
+
+class Tracer:
+    """
+    Трассировщик с уровнем level и приемником sink.
+    Флаги info/debug/trace — для проверки в местах вызова.
+    """
+
+    def __init__(self, sink=None, level: int = INFO):
+        self.sink = sink if sink is not None else NullSink()
+        self.level = level if sink is not None else QUIET
+        self.info = self.level >= INFO
+        self.debug = self.level >= DEBUG
+        self.trace = self.level >= TRACE
+
+    def emit(self, level: int, event: str, **fields):
+        if level > self.level:
+            return
+        self.sink.write(level, event, {k: _render(v) for k, v in fields.items()})
+
+    def close(self):
+        self.sink.close()
+
+    # Приемники держат потоки и файлы: при pickle (чекпоинт)
+    # трассировщик становится немым, новый ставит тот, кто загружает.
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+
+def _render(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
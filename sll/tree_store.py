@@ -0,0 +1,277 @@
+from array import array
+from typing import Dict, List, Optional
+
+from sll.ast_nodes import Expr, Var, Ctr, FCall, IntLit, Let
+from sll.process_tree import Node, Contraction
+from sll.process_graph import _expr_vars
+
+# Компактное хранение законченного дерева процессов.
+#
+# Поля узлов лежат в параллельных массивах (array('i')): родитель, первый ребенок,
+# следующий брат, обратная ссылка, номер сужения, номер выражения, номер типов, флаги.
+# Выражения (по структуре, с учетом тегов), сужения и словари типов интернируются:
+# одинаковые хранятся один раз.
+# Поверх массивов работают тонкие виды StoredNode с интерфейсом Node, поэтому
+# Residualizer и to_dot работают с хранилищем как с обычным деревом.
+# Хранилище только для чтения: оно собирается из готового дерева (TreeStore.pack).
+# Прогонки больше не будет, поэтому у узла остаются типы только переменных
+# его выражения (в Node var_types несет весь контекст ветки).
+
+NONE = -1
+
+_BASIS_REF = 1
+_STOPPED = 2
+_UNFOLDED = 4
+
+
+class TreeStore:
+    """Дерево процессов в параллельных массивах. Узел 0 — корень."""
+
+    def __init__(self):
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.back_link = array('i')
+        self.contraction = array('i')
+        self.expr = array('i')
+        self.var_types = array('i')
+        self.flags = array('b')
+
+        self.exprs: List[Expr] = []
+        self.contractions: List[Contraction] = []
+        self.types: List[Dict] = []
+        # Поля для картинки (driven_*, gen_*) есть у немногих узлов — храним отдельно
+        self.extras: Dict[int, tuple] = {}
+
+    @classmethod
+    def pack(cls, root: Node, index: Optional[Dict[Node, int]] = None) -> 'TreeStore':
+        """
+        Упаковывает дерево root (Node, LeanNode или граф с SharedNode).
+        index, если передан, заполняется соответствием узел -> номер.
+        """
+        store = cls()
+        if index is None:
+            index = {}
+
+        # Номера — в порядке обхода в глубину, дети по порядку
+        order = []
+        stack = [root]
+        while stack:
+            n = stack.pop()
+            index[n] = len(order)
+            order.append(n)
+            stack.extend(reversed(n.children))
+
+        exprs = _ExprTable(store.exprs)
+        contractions: Dict[str, int] = {}
+        types: Dict[tuple, int] = {}
+        store.next_sibling = array('i', [NONE]) * len(order)
+        for i, n in enumerate(order):
+            parent = n.parent
+            store.parent.append(index[parent] if parent is not None and parent in index else NONE)
+            children = n.children
+            store.first_child.append(index[children[0]] if children else NONE)
+            for a, b in zip(children, children[1:]):
+                store.next_sibling[index[a]] = index[b]
+            if n.back_link is None:
+                store.back_link.append(NONE)
+            elif n.back_link in index:
+                store.back_link.append(index[n.back_link])
+            else:
+                raise ValueError(f"back link of {n} points outside of the tree")
+
+            store.contraction.append(_intern(contractions, store.contractions, repr(n.contraction),
+                                             n.contraction) if n.contraction is not None else NONE)
+            store.expr.append(exprs.add(n.expr))
+            var_types = n.var_types
+            own = {v: var_types[v] for v in _expr_vars(n.expr) if v in var_types}
+            store.var_types.append(_intern(types, store.types,
+                                           tuple((k, repr(t)) for k, t in own.items()), own))
+            store.flags.append(_BASIS_REF * n.is_basis_ref + _STOPPED * n.stopped
+                               + _UNFOLDED * n.unfolded)
+
+            extra = (n.driven_from, n.driven_rule, n.gen_alpha, n.gen_beta, n.gen_result)
+            if any(e is not None for e in extra):
+                store.extras[i] = extra
+        return store
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+    @property
+    def root(self) -> 'StoredNode':
+        return StoredNode(self, 0)
+
+    def node(self, i: int) -> Optional['StoredNode']:
+        return StoredNode(self, i) if i != NONE else None
+
+    def nbytes(self) -> int:
+        """Размер массивов узлов в байтах (без интернированных выражений)."""
+        arrays = (self.parent, self.first_child, self.next_sibling, self.back_link,
+                  self.contraction, self.expr, self.var_types, self.flags)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+def _intern(keys: dict, table: list, key, value) -> int:
+    i = keys.get(key)
+    if i is None:
+        i = keys[key] = len(table)
+        table.append(value)
+    return i
+
+
+class _ExprTable:
+    """
+    Интернирование выражений по структуре (с учетом тегов). Ключ выражения —
+    (вид, имя, тег, номера подвыражений); одинаковые выражения, в том числе
+    вложенные, заменяются первым встреченным объектом.
+    """
+
+    def __init__(self, exprs: List[Expr]):
+        self.exprs = exprs
+        self.keys: Dict[tuple, int] = {}
+        self.seen: List[Expr] = []
+        self.nodes: Dict[int, int] = {}     # номер в seen -> номер в exprs
+
+    def add(self, expr: Expr) -> int:
+        i = self._key_id(expr)
+        if i not in self.nodes:
+            self.nodes[i] = len(self.exprs)
+            self.exprs.append(self.seen[i])
+        return self.nodes[i]
+
+    def _key_id(self, e: Expr) -> int:
+        match e:
+            case Var(name):
+                key = ("V", name, e.tag)
+            case IntLit(value):
+                key = ("I", value, e.tag)
+            case Ctr(name, args) | FCall(name, args):
+                key = (type(e).__name__, name, e.tag, tuple(self._key_id(a) for a in args))
+            case Let(bindings, body):
+                key = ("L", e.tag, tuple((n, self._key_id(v)) for n, v in bindings), self._key_id(body))
+            case _:
+                key = ("?", id(e))
+        i = self.keys.get(key)
+        if i is None:
+            i = self.keys[key] = len(self.seen)
+            self.seen.append(e)
+        return i
+
+
+class StoredNode:
+    """
+    Вид на узел i хранилища: тот же интерфейс, что и у Node, только для чтения.
+    Виды создаются на лету и сравниваются по (хранилище, номер).
+    """
+    __slots__ = ("_store", "_i")
+
+    def __init__(self, store: TreeStore, i: int):
+        self._store = store
+        self._i = i
+
+    def __eq__(self, other):
+        return isinstance(other, StoredNode) and other._store is self._store and other._i == self._i
+
+    def __hash__(self):
+        return hash(self._i)
+
+    @property
+    def index(self) -> int:
+        return self._i
+
+    @property
+    def expr(self) -> Expr:
+        return self._store.exprs[self._store.expr[self._i]]
+
+    @property
+    def var_types(self):
+        return self._store.types[self._store.var_types[self._i]]
+
+    @property
+    def parent(self) -> Optional['StoredNode']:
+        return self._store.node(self._store.parent[self._i])
+
+    @property
+    def children(self) -> List['StoredNode']:
+        s = self._store
+        result = []
+        c = s.first_child[self._i]
+        while c != NONE:
+            result.append(StoredNode(s, c))
+            c = s.next_sibling[c]
+        return result
+
+    @property
+    def contraction(self) -> Optional[Contraction]:
+        c = self._store.contraction[self._i]
+        return self._store.contractions[c] if c != NONE else None
+
+    @property
+    def back_link(self) -> Optional['StoredNode']:
+        return self._store.node(self._store.back_link[self._i])
+
+    @property
+    def is_basis_ref(self) -> bool:
+        return bool(self._store.flags[self._i] & _BASIS_REF)
+
+    @property
+    def stopped(self) -> bool:
+        return bool(self._store.flags[self._i] & _STOPPED)
+
+    @property
+    def unfolded(self) -> bool:
+        return bool(self._store.flags[self._i] & _UNFOLDED)
+
+    def _extra(self, k: int):
+        extra = self._store.extras.get(self._i)
+        return extra[k] if extra is not None else None
+
+    @property
+    def driven_from(self):
+        return self._extra(0)
+
+    @property
+    def driven_rule(self):
+        return self._extra(1)
+
+    @property
+    def gen_alpha(self):
+        return self._extra(2)
+
+    @property
+    def gen_beta(self):
+        return self._extra(3)
+
+    @property
+    def gen_result(self):
+        return self._extra(4)
+
+    @property
+    def heap(self):
+        return []
+
+    @property
+    def stack(self):
+        return []
+
+    @property
+    def context(self):
+        return None
+
+    @property
+    def bag(self):
+        return None
+
+    @property
+    def released(self) -> bool:
+        return True
+
+    def leaves(self) -> List['StoredNode']:
+        return Node.leaves(self)
+
+    def ancestors(self) -> List['StoredNode']:
+        return Node.ancestors(self)
+
+    def __str__(self):
+        return Node.__str__(self)
@@ -0,0 +1,89 @@
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Tuple
+
+from sll.ast_nodes import Program, Expr, TypeExpr
+from sll.parser import parse, Parser, tokenize
+
+# Генерируемые программы для замеров масштабирования (bench/scaling.py).
+#
+# Каждый генератор по параметру n строит программу и стартовое выражение, у которых
+# растет одна ось дерева процессов:
+#   chain    — композиция (subn ... (sub2 (sub1 xs))), subi заменяет букву L(i-1) на Li
+#              (как fabc в samples/test_4.sll): глубина вложенности вызовов;
+#   acc      — (acc x a1 .. an): на каждом шаге аккумуляторы сдвигаются по кругу,
+#              первый оборачивается в S: число аргументов, которые надо обобщать;
+#   alphabet — eqlists над алфавитом из n букв (как samples/test_5.sll): ширина ветвления.
+
+
+@dataclass
+class Workload:
+    name: str
+    code: str
+    expr: str
+    types: Dict[str, str]       # переменная -> тип, как в -t у main.py
+
+    def parsed(self) -> Tuple[Program, Expr, Dict[str, TypeExpr]]:
+        """(программа, стартовое выражение, типы переменных)."""
+        types = {v: Parser(list(tokenize(t))).parse_type_expr() for v, t in self.types.items()}
+        return parse(self.code), Parser(tokenize(self.expr)).parse_expr(), types
+
+
+def chain(n: int) -> Workload:
+    letters = " | ".join(f"L{i}" for i in range(n + 1))
+    funcs = []
+    for i in range(1, n + 1):
+        funcs.append(f"""
+fun (sub{i} [List [Letter]]) -> [List [Letter]] :
+    (sub{i} [Cons [L{i - 1}] xs]) -> [Cons [L{i}] (sub{i} xs)]
+  | (sub{i} [Cons x xs]) -> [Cons x (sub{i} xs)]
+  | (sub{i} [Nil]) -> [Nil] .""")
+    code = f"type [List x] : Cons x [List x] | Nil .\ntype [Letter] : {letters} .\n" + "\n".join(funcs)
+    expr = "xs"
+    for i in range(1, n + 1):
+        expr = f"(sub{i} {expr})"
+    return Workload(f"chain{n}", code, expr, {"xs": "[List [Letter]]"})
+
+
+def acc(n: int) -> Workload:
+    args = " ".join(f"a{i}" for i in range(1, n + 1))
+    rotated = " ".join([f"a{i}" for i in range(2, n + 1)] + ["[S a1]"])
+    code = f"""type [Nat] : Z | S [Nat] .
+
+fun (acc [Nat] {' '.join(['[Nat]'] * n)}) -> [Nat] :
+    (acc [Z] {args}) -> a1
+  | (acc [S x] {args}) -> (acc x {rotated}) ."""
+    types = {"x": "[Nat]", **{f"a{i}": "[Nat]" for i in range(1, n + 1)}}
+    return Workload(f"acc{n}", code, f"(acc x {args})", types)
+
+
+def alphabet(n: int) -> Workload:
+    letters = [f"C{i}" for i in range(1, n + 1)]
+    rules = [f"(eqlists [Cons [{c}] xs] [Cons [{c}] ys]) -> (eqlists xs ys)" for c in letters]
+    rules += ["(eqlists [Nil] [Nil]) -> [True]", "(eqlists xs ys) -> [False]"]
+    code = (f"type [List x] : Cons x [List x] | Nil .\ntype [Letter] : {' | '.join(letters)} .\n"
+            f"type [Bool] : True | False .\n\n"
+            f"fun (eqlists [List [Letter]] [List [Letter]]) -> [Bool] :\n    " + "\n  | ".join(rules) + " .")
+    return Workload(f"alphabet{n}", code, "(eqlists xs ys)", {"xs": "[List [Letter]]", "ys": "[List [Letter]]"})
+
+
+GENERATORS: Dict[str, Callable[[int], Workload]] = {
+    "chain": chain,
+    "acc": acc,
+    "alphabet": alphabet,
+}
+
+
+def calibrate(repeats: int = 7) -> float:
+    """
+    Секунд на эталонный запуск (chain4, HE/TOP, лучший из repeats): единица времени
+    машины. Время, деленное на нее, сравнимо между машинами, грубо, но лучше секунд.
+    """
+    from sll.cache import supercompile     # cache -> supercompiler -> ...: не на уровне модуля
+    program, expr, types = chain(4).parsed()
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        supercompile(program, expr, types)
+        best = min(best, time.perf_counter() - started)
+    return best